@@ -1,4 +1,15 @@
-from polly.api import *
-from polly.cli import *
-from polly.core import *
-from polly.utils import *
\ No newline at end of file
+import importlib
+
+# Subpackages whose public names are available from the polly package. They
+# are imported on first use, so running a command only loads what it needs.
+_SUBPACKAGES = ("api", "cli", "core", "utils")
+
+
+def __getattr__(name):
+    for subpackage in _SUBPACKAGES:
+        module = importlib.import_module(f"polly.{subpackage}")
+        if hasattr(module, name):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+    raise AttributeError(f"module 'polly' has no attribute {name!r}")
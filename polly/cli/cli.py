@@ -1,12 +1,36 @@
-from polly.cli.commands.help import help_main
-from polly.cli.commands.update import update_main
-from polly.cli.commands.install import install_main
-from polly.cli.commands.uninstall import uninstall_main
-from polly.cli.commands.inspect import inspect_main
-from polly.cli.commands.upgrade import upgrade_main
-from polly.cli.commands.list import list_main
+import sys
+import importlib
 from polly.utils.simple import set_simple_mode
+from polly.utils.json_mode import set_json_mode
 from polly.utils.debug import set_debug_mode
+from polly.utils.profiling import set_profile_mode, profile_call
+from polly.utils.trace import set_trace_mode, span, write_trace
+
+# Command name to the module and function implementing it. A command's module
+# is only imported when that command runs, so startup doesn't pay for the
+# dependencies of every other command.
+COMMANDS = {
+    "help": ("polly.cli.commands.help", "help_main"),
+    "update": ("polly.cli.commands.update", "update_main"),
+    "install": ("polly.cli.commands.install", "install_main"),
+    "uninstall": ("polly.cli.commands.uninstall", "uninstall_main"),
+    "inspect": ("polly.cli.commands.inspect", "inspect_main"),
+    "upgrade": ("polly.cli.commands.upgrade", "upgrade_main"),
+    "list": ("polly.cli.commands.list", "list_main"),
+    "reindex": ("polly.cli.commands.reindex", "reindex_main"),
+    "sync": ("polly.cli.commands.sync", "sync_main"),
+}
+
+# Commands whose main function takes no arguments
+NO_ARGUMENT_COMMANDS = ("help", "update")
+
+
+def load_command(command):
+    """Import a command's module and get its main function, or None if unknown."""
+    if command not in COMMANDS:
+        return None
+    module_name, function_name = COMMANDS[command]
+    return getattr(importlib.import_module(module_name), function_name)
 
 
 def dispatch_command(args):
@@ -15,48 +39,96 @@ def dispatch_command(args):
     Dispatches the remaining arguments to the appropriate script based on the command.
     """
     if not args:
-        help_main()
+        load_command("help")()
         return
 
     # Check for global flags at the start
     simple_mode = False
+    json_mode = False
     debug_mode = False
+    profile_mode = False
+    profile_output = None
+    trace_output = None
 
     # Process flags
     while args and args[0].startswith("--"):
         if args[0] == "--simple":
             simple_mode = True
             args = args[1:]
+        elif args[0] == "--json":
+            json_mode = True
+            args = args[1:]
         elif args[0] == "--debug":
             debug_mode = True
             args = args[1:]
+        elif args[0] == "--profile" or args[0].startswith("--profile="):
+            # --profile=FILE also dumps the cProfile stats to FILE
+            profile_mode = True
+            profile_output = args[0].partition("=")[2] or None
+            args = args[1:]
+        elif args[0] == "--trace" or args[0].startswith("--trace="):
+            # A .jsonl file gets OTLP-style spans, anything else Chrome trace JSON
+            trace_output = args[0].partition("=")[2]
+            args = args[1:]
+            if args[0:1] and not trace_output and not is_trace_file_ambiguous(args[0]):
+                trace_output = args[0]
+                args = args[1:]
+            if not trace_output:
+                print(
+                    "polly: --trace needs an output file, e.g. --trace=trace.json",
+                    file=sys.stderr,
+                )
+                sys.exit(2)
         else:
             break
 
     if not args:  # If only flags were provided
-        help_main()
+        load_command("help")()
         return
 
-    # Set global modes
-    set_simple_mode(simple_mode)
+    # Set global modes, JSON mode prints plain messages like simple mode
+    set_simple_mode(simple_mode or json_mode)
+    set_json_mode(json_mode)
     set_debug_mode(debug_mode)
+    set_profile_mode(profile_mode)
+    set_trace_mode(bool(trace_output))
 
     command = args[0]
     command_args = args[1:]
 
-    if command == "help":
-        help_main()
-    elif command == "update":
-        update_main()
-    elif command == "install":
-        install_main(command_args)
-    elif command == "uninstall":
-        uninstall_main(command_args)
-    elif command == "inspect":
-        inspect_main(command_args)
-    elif command == "upgrade":
-        upgrade_main(command_args)
-    elif command == "list":
-        list_main(command_args)
-    else:
+    try:
+        if profile_mode:
+            profile_call(lambda: run_command(command, command_args), profile_output)
+        else:
+            run_command(command, command_args)
+    finally:
+        if trace_output:
+            save_trace(trace_output)
+
+
+def is_trace_file_ambiguous(argument):
+    """Check whether the argument after --trace could be a command or flag."""
+    return argument in COMMANDS or argument.startswith("-")
+
+
+def save_trace(output_path):
+    """Write the recorded trace spans, reporting to stderr."""
+    try:
+        count = write_trace(output_path)
+        print(f"Trace with {count} spans written to {output_path}", file=sys.stderr)
+    except OSError as e:
+        print(f"Could not write trace to {output_path}: {e}", file=sys.stderr)
+
+
+def run_command(command, command_args):
+    """Run a command with its arguments."""
+    command_main = load_command(command)
+    if command_main is None:
         print(f"Unknown command: {command}")
+        return
+
+    with span(f"polly {command}", "command", args=" ".join(command_args)):
+        if command in NO_ARGUMENT_COMMANDS:
+            command_main()
+        else:
+            command_main(command_args)
@@ -10,10 +10,10 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 try:
-    from polly.core import (
+    from polly.core.requires_update import (
         update_required,
         latest_version,
-        get_current_version
+        get_current_version,
     )
 except ImportError:
     # Fallback functions if core module is not available
@@ -28,7 +28,7 @@ except ImportError:
 
 
 # Import simple mode utilities
-from polly.utils import is_simple_mode
+from polly.utils.simple import is_simple_mode
 
 
 # ANSI color constants
@@ -78,7 +78,7 @@ def create_simple_header():
 
 def help_simple():
     """Display help in simple mode for external applications."""
-    print("commands:help,update,install,uninstall,list,inspect,upgrade")
+    print("commands:help,update,install,uninstall,list,inspect,upgrade,reindex,sync")
     print(f"version:{get_current_version()[:7]}")
     print(f"latest_version:{latest_version()[:7]}")
     print(f"update_available:{update_required()}")
@@ -115,11 +115,13 @@ def help_main():
 {s}Available Commands:
   {p}help        {g}Show this help message
   {p}update      {g}Update Polly to the latest version
-  {p}install     {g}Install a Polly package
+  {p}install     {g}Install Polly packages
   {p}uninstall   {g}Uninstall a Polly package
   {p}list        {g}List installed Polly packages
   {p}inspect     {g}Show information about a Polly package
   {p}upgrade     {g}Upgrade Polly packages
+  {p}reindex     {g}Rebuild the installed package index
+  {p}sync        {g}Install and remove packages to match a manifest
 
 {s}For more information, visit: {p}https://github.com/pollypm/polly
 """
@@ -130,11 +132,12 @@ def help_main():
     grey_color = hex_to_ansi("#808080")
 
     # Format update status
-    update_status = (
-        f"Yes {grey_color}({primary_color}use {secondary_color}polly update{grey_color})"
-        if update_required()
-        else "No"
-    )
+    if latest_version() == "Unknown":
+        update_status = "Unknown"
+    elif update_required():
+        update_status = f"Yes {grey_color}({primary_color}use {secondary_color}polly update{grey_color})"
+    else:
+        update_status = "No"
 
     if hide_ascii_art:
         # Simple layout for narrow terminals
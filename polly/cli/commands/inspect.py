@@ -1,16 +1,13 @@
 import sys
 import json
 import argparse
-from polly.core import inspect_package
-from polly.utils import (
-    print_header,
-    format_message,
-    get_colors,
-    format_size,
-    is_simple_mode,
-    is_debug_mode,
-    handle_exception_with_debug,
-)
+from polly.core.inspect_package import inspect_package
+from polly.utils.colors import print_header, format_message, get_colors
+from polly.utils.filesystem import format_size
+from polly.utils.simple import is_simple_mode
+from polly.utils.json_mode import is_json_mode, print_json
+from polly.utils.debug import is_debug_mode, handle_exception_with_debug
+from polly.utils.profiling import phase
 
 
 def display_inspection_data_simple(data):
@@ -154,15 +151,20 @@ def inspect_main(args=None):
         success, message, data = inspect_package(package_name)
 
         if success and data:
-            if is_simple_mode():
-                display_inspection_data_simple(data)
-            else:
-                display_inspection_data(data)
+            with phase("rendering"):
+                if is_json_mode():
+                    print_json({"type": "package", **data})
+                elif is_simple_mode():
+                    display_inspection_data_simple(data)
+                else:
+                    display_inspection_data(data)
                 print(
                     f"\n{format_message('success', 'Package inspection completed')}\n"
                 )
         else:
-            if is_simple_mode():
+            if is_json_mode():
+                print_json({"type": "error", "message": message})
+            elif is_simple_mode():
                 print(f"error:{message}")
             else:
                 print(format_message("error", message))
@@ -178,7 +180,9 @@ def inspect_main(args=None):
         error_message = handle_exception_with_debug(
             f"Unexpected error during inspection: {e}", e
         )
-        if is_simple_mode():
+        if is_json_mode():
+            print_json({"type": "error", "message": error_message})
+        elif is_simple_mode():
             print(f"error:{error_message}")
         else:
             print(format_message("error", error_message))
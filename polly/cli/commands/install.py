@@ -1,61 +1,61 @@
+import os
 import sys
 import argparse
-from polly.core import install_package_from_git
-from polly.utils import (
-    print_header,
-    format_message,
-    get_colors,
-    extract_package_id_from_url,
-    is_simple_mode,
-    is_debug_mode,
-    handle_exception_with_debug,
+from polly.core.install_package import (
+    install_package_from_git,
+    iter_install_packages_from_git,
+    DEFAULT_INSTALL_JOBS,
+    DEFAULT_INSTALL_WORKERS,
 )
+from polly.core.download_package import get_clone_options
+from polly.utils.colors import print_header, format_message, get_colors
+from polly.utils.git import extract_package_id_from_url
+from polly.utils.simple import is_simple_mode
+from polly.utils.debug import is_debug_mode, handle_exception_with_debug
+from polly.utils.package import PACKAGES_DIR
 
 
-def install_main(args=None):
-    """Main function for the install command."""
-    colors = get_colors()
+def is_repository_url(repo_url):
+    """Check that a string looks like a git repository URL."""
+    return (
+        repo_url.startswith(("http://", "https://", "git@"))
+        or repo_url.endswith(".git")
+        or "/" in repo_url
+    )
 
-    if args is None:
-        args = sys.argv[1:]
 
-    parser = argparse.ArgumentParser(
-        description="Install a package from a git repository", prog="polly install"
-    )
-    parser.add_argument("repo_url", help="Git repository URL of the package to install")
+def read_repository_urls(path):
+    """
+    Read repository URLs from a file, one per line.
 
-    try:
-        parsed_args = parser.parse_args(args)
-    except SystemExit:
-        return
+    Blank lines and lines starting with # are skipped.
 
-    repo_url = parsed_args.repo_url
+    :param path: File to read, or - for standard input
+    :return: List of repository URLs
+    :raises: OSError if the file can't be read
+    """
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return urls
 
-    # Validate that it looks like a git URL
-    if not (
-        repo_url.startswith(("http://", "https://", "git@"))
-        or repo_url.endswith(".git")
-        or "/" in repo_url
-    ):
-        if is_simple_mode():
-            print(f"error:Invalid repository URL: {repo_url}")
-        else:
-            print(format_message("error", f"Invalid repository URL: {repo_url}"))
-            print(
-                f"  {colors['grey']}Please provide a valid git repository URL{colors['reset']}"
-            )
-        sys.exit(1)
 
-    # Print header and package info
+def print_package_info(package_id, repo_url):
+    """Print the package ID and repository of a package being installed."""
+    colors = get_colors()
+
     if is_simple_mode():
-        package_id = extract_package_id_from_url(repo_url)
         print(f"installing:{package_id}")
         print(f"repository:{repo_url}")
     else:
-        print_header("Polly", "Package Installation")
-
-        # Show package information
-        package_id = extract_package_id_from_url(repo_url)
         print(
             f"  {colors['info']}Package ID:{colors['reset']} {colors['grey']}{package_id}{colors['reset']}"
         )
@@ -63,26 +63,214 @@ def install_main(args=None):
             f"  {colors['info']}Repository:{colors['reset']} {colors['grey']}{repo_url}{colors['reset']}\n"
         )
 
-    # Install the package
+
+def print_install_result(success, message, package_name):
+    """Print the outcome of a single package installation."""
+    colors = get_colors()
+
+    if success:
+        if is_simple_mode():
+            print(f"success:{message}")
+            if package_name:
+                print(f"location:{os.path.join(PACKAGES_DIR, package_name)}")
+        else:
+            print(format_message("success", message))
+            if package_name:
+                print(
+                    f"  {colors['grey']}Location: {os.path.join(PACKAGES_DIR, package_name)}{colors['reset']}\n"
+                )
+    else:
+        if is_simple_mode():
+            print(f"error:{message}")
+        else:
+            print(format_message("error", message))
+
+
+def install_batch(repo_urls, clone_options, use_cache, jobs, workers):
+    """
+    Install several packages, printing each one's output once it finishes.
+
+    :return: True if every package was installed
+    """
+    colors = get_colors()
+
+    if not is_simple_mode():
+        print_header("Polly", "Package Installation")
+        print(
+            f"  {colors['grey']}Installing {len(repo_urls)} packages, "
+            f"cloning up to {jobs} at a time{colors['reset']}\n"
+        )
+
+    results = {}
+    for result in iter_install_packages_from_git(
+        repo_urls, clone_options, use_cache, jobs, workers
+    ):
+        results[result["repo_url"]] = result
+        print_package_info(result["package_id"], result["repo_url"])
+        sys.stdout.write(result["output"])
+        print_install_result(
+            result["success"], result["message"], result["package_name"]
+        )
+        sys.stdout.flush()
+
+    # Report in the order the packages were given
+    ordered = [results[repo_url] for repo_url in dict.fromkeys(repo_urls)]
+    successful = [result["package_id"] for result in ordered if result["success"]]
+    failed = [result["package_id"] for result in ordered if not result["success"]]
+
+    if is_simple_mode():
+        if successful:
+            print(f"installed_successfully:{','.join(successful)}")
+        if failed:
+            print(f"installed_failed:{','.join(failed)}")
+        print(f"install_success:{not failed}")
+    else:
+        print(
+            f"  {colors['info']}Installed {len(successful)} of {len(ordered)} package(s){colors['reset']}"
+        )
+        if failed:
+            print(format_message("error", f"Failed packages: {', '.join(failed)}"))
+        print()
+
+    return not failed
+
+
+def install_main(args=None):
+    """Main function for the install command."""
+    colors = get_colors()
+
+    if args is None:
+        args = sys.argv[1:]
+
+    parser = argparse.ArgumentParser(
+        description="Install packages from git repositories", prog="polly install"
+    )
+    parser.add_argument(
+        "repo_urls",
+        nargs="*",
+        metavar="repo_url",
+        help="Git repository URL of a package to install",
+    )
+    parser.add_argument(
+        "-f",
+        "--file",
+        metavar="FILE",
+        help="Read repository URLs from FILE, one per line (- for standard input)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_INSTALL_JOBS,
+        help=f"Number of packages to clone concurrently (default: {DEFAULT_INSTALL_JOBS})",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=DEFAULT_INSTALL_WORKERS,
+        help=f"Number of packages running install commands at the same time (default: {DEFAULT_INSTALL_WORKERS})",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        help="Clone only the last N commits of history (shallow clone)",
+    )
+    parser.add_argument(
+        "--filter",
+        dest="filter_spec",
+        metavar="SPEC",
+        help="Partial clone filter, e.g. blob:none to fetch file contents on demand",
+    )
+    parser.add_argument(
+        "--single-branch",
+        action="store_true",
+        help="Clone only the default branch",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Clone directly from the repository instead of the local git cache",
+    )
+
     try:
-        success, message, package_name = install_package_from_git(repo_url)
+        parsed_args = parser.parse_args(args)
+    except SystemExit:
+        return
 
-        if success:
+    repo_urls = list(parsed_args.repo_urls)
+    if parsed_args.file:
+        try:
+            repo_urls.extend(read_repository_urls(parsed_args.file))
+        except OSError as e:
             if is_simple_mode():
-                print(f"success:{message}")
-                if package_name:
-                    print(f"location:/opt/pollypackages/{package_name}")
+                print(f"error:Cannot read {parsed_args.file}: {e}")
             else:
-                print(format_message("success", message))
-                if package_name:
-                    print(
-                        f"  {colors['grey']}Location: /opt/pollypackages/{package_name}{colors['reset']}\n"
-                    )
+                print(format_message("error", f"Cannot read {parsed_args.file}: {e}"))
+            sys.exit(1)
+
+    if not repo_urls:
+        if is_simple_mode():
+            print("error:No repository URL given")
         else:
+            print(format_message("error", "No repository URL given"))
+        sys.exit(1)
+
+    # Only pass clone options when some were given, so reinstalls keep the
+    # options declared by the installed package
+    clone_options = None
+    if (
+        parsed_args.depth is not None
+        or parsed_args.filter_spec
+        or parsed_args.single_branch
+    ):
+        if parsed_args.depth is not None and parsed_args.depth < 1:
+            if is_simple_mode():
+                print("error:--depth must be a positive integer")
+            else:
+                print(format_message("error", "--depth must be a positive integer"))
+            sys.exit(1)
+        clone_options = get_clone_options(
+            depth=parsed_args.depth,
+            filter_spec=parsed_args.filter_spec,
+            single_branch=parsed_args.single_branch,
+        )
+
+    # Validate that they look like git URLs
+    for repo_url in repo_urls:
+        if not is_repository_url(repo_url):
             if is_simple_mode():
-                print(f"error:{message}")
+                print(f"error:Invalid repository URL: {repo_url}")
             else:
-                print(format_message("error", message))
+                print(format_message("error", f"Invalid repository URL: {repo_url}"))
+                print(
+                    f"  {colors['grey']}Please provide a valid git repository URL{colors['reset']}"
+                )
+            sys.exit(1)
+
+    use_cache = not parsed_args.no_cache
+
+    try:
+        if len(dict.fromkeys(repo_urls)) > 1:
+            jobs = max(1, parsed_args.jobs)
+            workers = max(1, parsed_args.workers)
+            if not install_batch(repo_urls, clone_options, use_cache, jobs, workers):
+                sys.exit(1)
+            return
+
+        repo_url = repo_urls[0]
+
+        # Print header and package info
+        if not is_simple_mode():
+            print_header("Polly", "Package Installation")
+        print_package_info(extract_package_id_from_url(repo_url), repo_url)
+
+        # Install the package
+        success, message, package_name = install_package_from_git(
+            repo_url, clone_options, use_cache
+        )
+        print_install_result(success, message, package_name)
+        if not success:
             sys.exit(1)
 
     except KeyboardInterrupt:
@@ -1,41 +1,44 @@
 import sys
 import argparse
-from polly.core import list_packages
-from polly.utils import (
-    print_header,
-    format_message,
-    get_colors,
-    is_simple_mode,
-    is_debug_mode,
-    handle_exception_with_debug,
-)
-
-
-def display_packages_simple_mode(packages_data):
-    """Display packages in simple format for external tools."""
-    packages = packages_data["packages"]
+from datetime import datetime
+from polly.core.list_packages import iter_packages
+from polly.utils.colors import print_header, format_message, get_colors
+from polly.utils.filesystem import format_size, parse_size
+from polly.utils.package import get_package_names
+from polly.utils.simple import is_simple_mode
+from polly.utils.json_mode import is_json_mode, print_json
+from polly.utils.debug import is_debug_mode, handle_exception_with_debug
+from polly.utils.profiling import phase
 
-    if not packages:
-        print("No packages installed")
-        return
 
-    # Simple format: name,type,size,installed_date
+def no_packages_message(filtered):
+    """Get the message shown when no package is listed."""
+    return "No packages match the filters" if filtered else "No packages installed"
+
+
+def display_packages_simple_mode(packages, filtered=False):
+    """Display packages in simple format for external tools."""
+    count = 0
+
+    # Simple format: name,size,installed_date
     for package in packages:
         install_date = package["install_date"].split(" ")[0]  # Just the date part
-        print(f"{package['name']},{package['size_formatted']},{install_date}")
+        size = package["size_formatted"] or ""
+        print(f"{package['name']},{size},{install_date}", flush=True)
+        count += 1
 
+    if not count:
+        print(no_packages_message(filtered))
 
-def display_packages_detailed_simple_mode(packages_data):
-    """Display packages in detailed format for external tools."""
-    packages = packages_data["packages"]
 
-    if not packages:
-        print("No packages installed")
-        return
+def display_packages_detailed_simple_mode(packages, filtered=False):
+    """Display packages in detailed format for external tools."""
+    count = 0
 
     for package in packages:
         print(f"name:{package['name']}")
-        print(f"size:{package['size_formatted']}")
+        if package["size_formatted"] is not None:
+            print(f"size:{package['size_formatted']}")
         print(f"installed:{package['install_date']}")
         print(f"location:{package['path']}")
 
@@ -48,67 +51,111 @@ def display_packages_detailed_simple_mode(packages_data):
         else:
             print("status:invalid_metadata")
 
-        print("---")  # Separator between packages
+        print("---", flush=True)  # Separator between packages
+        count += 1
 
+    if not count:
+        print(no_packages_message(filtered))
 
-def display_packages_simple(packages_data):
-    """Display packages in simple format."""
-    colors = get_colors()
-    packages = packages_data["packages"]
 
-    if not packages:
-        print(format_message("info", "No packages are currently installed"))
+def display_packages_json(packages):
+    """Write one JSON object per package as soon as it is read."""
+    for package in packages:
+        print_json({"type": "package", **package})
+
+
+def print_no_packages(filtered=False):
+    """Display the message shown when nothing is installed or matches."""
+    colors = get_colors()
+    if filtered:
+        print(format_message("info", "No packages match the filters"))
         print(
-            f"  {colors['grey']}Use 'polly install <repo_url>' to install a package{colors['reset']}\n"
+            f"  {colors['grey']}Use 'polly list' without filters to see every package{colors['reset']}\n"
         )
         return
 
-    # Calculate column widths
-    max_name_length = max(len(pkg["name"]) for pkg in packages)
-
-    # Header
+    print(format_message("info", "No packages are currently installed"))
     print(
-        f"  {colors['info']}{'NAME':<{max_name_length}} {'SIZE':<10} {'INSTALLED'}{colors['reset']}"
-    )
-    print(
-        f"  {colors['grey']}{'-' * max_name_length} {'-' * 10} {'-' * 10}{colors['reset']}"
+        f"  {colors['grey']}Use 'polly install <repo_url>' to install a package{colors['reset']}\n"
     )
 
+
+def print_totals(total_count, total_size, show_sizes):
+    """Display the package count and total size."""
+    colors = get_colors()
+    total = f"Total: {total_count} package(s)"
+    if show_sizes:
+        total += f", {format_size(total_size)}"
+    print(f"  {colors['info']}{total}{colors['reset']}")
+
+
+def display_packages_simple(packages, package_names, show_sizes=True, filtered=False):
+    """Display packages in simple format, printing each row as it is read."""
+    colors = get_colors()
+
+    if not package_names:
+        print_no_packages(filtered)
+        return
+
+    # Column widths only depend on names, so rows can be printed right away
+    max_name_length = max(len(name) for name in package_names)
+
+    # Header
+    if show_sizes:
+        print(
+            f"  {colors['info']}{'NAME':<{max_name_length}} {'SIZE':<10} {'INSTALLED'}{colors['reset']}"
+        )
+        print(
+            f"  {colors['grey']}{'-' * max_name_length} {'-' * 10} {'-' * 10}{colors['reset']}"
+        )
+    else:
+        print(
+            f"  {colors['info']}{'NAME':<{max_name_length}} {'INSTALLED'}{colors['reset']}"
+        )
+        print(f"  {colors['grey']}{'-' * max_name_length} {'-' * 10}{colors['reset']}")
+
     # Package rows
+    total_count = 0
+    total_size = 0
     for package in packages:
         name_color = colors["primary"] if package["has_metadata"] else colors["error"]
 
         install_date = package["install_date"].split(" ")[0]  # Just the date part
 
-        print(
-            f"  {name_color}{package['name']:<{max_name_length}}{colors['reset']} "
-            f"{colors['grey']}{package['size_formatted']:<10} {install_date}{colors['reset']}"
-        )
+        if show_sizes:
+            print(
+                f"  {name_color}{package['name']:<{max_name_length}}{colors['reset']} "
+                f"{colors['grey']}{package['size_formatted']:<10} {install_date}{colors['reset']}",
+                flush=True,
+            )
+            total_size += package["size"]
+        else:
+            print(
+                f"  {name_color}{package['name']:<{max_name_length}}{colors['reset']} "
+                f"{colors['grey']}{install_date}{colors['reset']}",
+                flush=True,
+            )
+        total_count += 1
 
-    print(
-        f"\n  {colors['info']}Total: {packages_data['total_count']} package(s), {packages_data['total_size_formatted']}{colors['reset']}"
-    )
+    print()
+    print_totals(total_count, total_size, show_sizes)
 
 
-def display_packages_detailed(packages_data):
-    """Display packages in detailed format."""
+def display_packages_detailed(packages, show_sizes=True, filtered=False):
+    """Display packages in detailed format, printing each package as it is read."""
     colors = get_colors()
-    packages = packages_data["packages"]
-
-    if not packages:
-        print(format_message("info", "No packages are currently installed"))
-        print(
-            f"  {colors['grey']}Use 'polly install <repo_url>' to install a package{colors['reset']}\n"
-        )
-        return
 
+    total_count = 0
+    total_size = 0
     for package in packages:
         print(
             f"  {colors['primary']}•{colors['reset']} {colors['info']}{package['name']}{colors['reset']}"
         )
-        print(
-            f"    {colors['grey']}Size:      {package['size_formatted']}{colors['reset']}"
-        )
+        if show_sizes:
+            print(
+                f"    {colors['grey']}Size:      {package['size_formatted']}{colors['reset']}"
+            )
+            total_size += package["size"]
         print(
             f"    {colors['grey']}Installed: {package['install_date']}{colors['reset']}"
         )
@@ -129,15 +176,28 @@ def display_packages_detailed(packages_data):
                 f"    {colors['grey']}Status:    {colors['error']}Invalid metadata{colors['reset']}"
             )
 
-        print()
+        print(flush=True)
+        total_count += 1
+
+    if not total_count:
+        print_no_packages(filtered)
+        return
 
     print(f"  {colors['info']}Summary:{colors['reset']}")
-    print(
-        f"    {colors['grey']}Total packages: {packages_data['total_count']}{colors['reset']}"
-    )
-    print(
-        f"    {colors['grey']}Total size:     {packages_data['total_size_formatted']}{colors['reset']}"
-    )
+    print(f"    {colors['grey']}Total packages: {total_count}{colors['reset']}")
+    if show_sizes:
+        print(
+            f"    {colors['grey']}Total size:     {format_size(total_size)}{colors['reset']}"
+        )
+
+
+def exit_with_error(message):
+    """Display an invalid option error and exit."""
+    if is_simple_mode():
+        print(f"error:{message}")
+    else:
+        print(format_message("error", message))
+    sys.exit(1)
 
 
 def list_main(args=None):
@@ -156,6 +216,42 @@ def list_main(args=None):
         action="store_true",
         help="Show detailed information for each package",
     )
+    parser.add_argument(
+        "--no-sizes",
+        action="store_true",
+        help="Don't compute or show package sizes",
+    )
+    parser.add_argument(
+        "--name",
+        metavar="GLOB",
+        help="Only list packages whose name matches GLOB, e.g. 'lib*'",
+    )
+    parser.add_argument(
+        "--origin",
+        metavar="TEXT",
+        help="Only list packages whose git origin URL contains TEXT",
+    )
+    parser.add_argument(
+        "--min-size",
+        metavar="SIZE",
+        help="Only list packages of at least SIZE, e.g. 100M",
+    )
+    parser.add_argument(
+        "--installed-before",
+        metavar="DATE",
+        help="Only list packages installed before DATE, e.g. 2024-01-31",
+    )
+    parser.add_argument(
+        "--sort",
+        choices=["name", "size", "date"],
+        default="name",
+        help="Sort by name, size (largest first) or date (newest first)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="List at most N packages",
+    )
 
     try:
         parsed_args = parser.parse_args(args)
@@ -163,31 +259,70 @@ def list_main(args=None):
         return
 
     detailed = parsed_args.detailed
+    show_sizes = not parsed_args.no_sizes
+
+    min_size = None
+    if parsed_args.min_size is not None:
+        try:
+            min_size = parse_size(parsed_args.min_size)
+        except ValueError:
+            exit_with_error(f"Invalid size: {parsed_args.min_size}")
+
+    installed_before = None
+    if parsed_args.installed_before is not None:
+        try:
+            installed_before = datetime.fromisoformat(
+                parsed_args.installed_before
+            ).timestamp()
+        except ValueError:
+            exit_with_error(f"Invalid date: {parsed_args.installed_before}")
+
+    if parsed_args.limit is not None and parsed_args.limit < 1:
+        exit_with_error("--limit must be a positive integer")
+
+    filters = {
+        "name": parsed_args.name,
+        "origin": parsed_args.origin,
+        "min_size": min_size,
+        "installed_before": installed_before,
+        "sort": parsed_args.sort,
+        "limit": parsed_args.limit,
+    }
+    filtered = any(
+        filters[key] is not None
+        for key in ("name", "origin", "min_size", "installed_before")
+    )
 
     # In simple mode, skip header
     if not is_simple_mode():
         print_header("Polly", "Installed Packages")
 
-    # List the packages
+    # List the packages, printing each one as soon as it is read
     try:
-        success, message, packages_data = list_packages(detailed)
-
-        if not success:
-            print(format_message("error", message))
-            sys.exit(1)
+        packages = iter_packages(detailed, include_size=show_sizes, **filters)
 
         # Display packages based on mode
-        if is_simple_mode():
-            if detailed:
-                display_packages_detailed_simple_mode(packages_data)
-            else:
-                display_packages_simple_mode(packages_data)
-        else:
-            if detailed:
-                display_packages_detailed(packages_data)
+        with phase("rendering"):
+            if is_json_mode():
+                display_packages_json(packages)
+            elif is_simple_mode():
+                if detailed:
+                    display_packages_detailed_simple_mode(packages, filtered)
+                else:
+                    display_packages_simple_mode(packages, filtered)
             else:
-                display_packages_simple(packages_data)
-            print()
+                if detailed:
+                    display_packages_detailed(packages, show_sizes, filtered)
+                elif filtered or parsed_args.limit is not None:
+                    # Size columns to the packages that are listed
+                    packages = list(packages)
+                    package_names = [package["name"] for package in packages]
+                    display_packages_simple(
+                        packages, package_names, show_sizes, filtered
+                    )
+                else:
+                    display_packages_simple(packages, get_package_names(), show_sizes)
+                print()
 
     except KeyboardInterrupt:
         print(format_message("error", "Listing cancelled by user"))
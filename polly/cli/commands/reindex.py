@@ -0,0 +1,68 @@
+import sys
+import argparse
+from polly.core.reindex_packages import reindex_packages
+from polly.utils.colors import print_header, format_message, get_colors
+from polly.utils.simple import is_simple_mode
+from polly.utils.debug import handle_exception_with_debug
+
+
+def reindex_main(args=None):
+    """Main function for the reindex command."""
+    colors = get_colors()
+
+    if args is None:
+        args = sys.argv[1:]
+
+    parser = argparse.ArgumentParser(
+        description="Rebuild the installed package index from the filesystem",
+        prog="polly reindex",
+    )
+
+    try:
+        parser.parse_args(args)
+    except SystemExit:
+        return
+
+    if not is_simple_mode():
+        print_header("Polly", "Package Index")
+        print(format_message("progress", "Rebuilding package index..."))
+
+    try:
+        success, message, data = reindex_packages()
+
+        if success:
+            if is_simple_mode():
+                print(f"success:{message}")
+                print(f"indexed:{data['total_count']}")
+                print(f"location:{data['index_path']}")
+            else:
+                print(format_message("success", message))
+                print(
+                    f"  {colors['grey']}Location: {data['index_path']}{colors['reset']}\n"
+                )
+        else:
+            if is_simple_mode():
+                print(f"error:{message}")
+            else:
+                print(format_message("error", message))
+            sys.exit(1)
+
+    except KeyboardInterrupt:
+        if is_simple_mode():
+            print("error:Reindex cancelled by user")
+        else:
+            print(format_message("error", "Reindex cancelled by user"))
+        sys.exit(1)
+    except Exception as e:
+        error_message = handle_exception_with_debug(
+            f"Unexpected error during reindex: {e}", e
+        )
+        if is_simple_mode():
+            print(f"error:{error_message}")
+        else:
+            print(format_message("error", error_message))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    reindex_main()
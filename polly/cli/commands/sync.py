@@ -0,0 +1,208 @@
+import sys
+import argparse
+from polly.core.sync_packages import (
+    load_manifest,
+    build_sync_plan,
+    execute_sync_plan,
+    is_sync_plan_empty,
+)
+from polly.core.install_package import DEFAULT_INSTALL_JOBS, DEFAULT_INSTALL_WORKERS
+from polly.utils.colors import print_header, format_message, get_colors
+from polly.utils.simple import is_simple_mode
+from polly.utils.debug import handle_exception_with_debug
+
+# Plan sections in the order they are shown and applied
+SYNC_ACTIONS = ("remove", "update", "reinstall", "install")
+
+
+def _describe_change(action, item):
+    """Get the package name and a short description of a planned change."""
+    if action == "remove":
+        return item, "not in manifest"
+    if action == "update":
+        current = (item["current_commit"] or "unknown")[:8]
+        return item["package_id"], f"{current} -> {item['commit'][:8]}"
+    if item["commit"]:
+        return item["package_id"], f"{item['url']} @ {item['commit'][:8]}"
+    return item["package_id"], item["url"]
+
+
+def display_sync_plan_simple(plan):
+    """Display the sync plan in simple mode for external tools."""
+    for action in SYNC_ACTIONS:
+        for item in plan[action]:
+            name, _ = _describe_change(action, item)
+            print(f"{action}:{name}")
+    print(f"unchanged_count:{len(plan['unchanged'])}")
+
+
+def display_sync_plan(plan):
+    """Display the sync plan with colors."""
+    colors = get_colors()
+    titles = {
+        "install": ("Install", colors["success"]),
+        "reinstall": ("Reinstall (origin changed)", colors["warning"]),
+        "update": ("Fast-forward to pinned commit", colors["info"]),
+        "remove": ("Remove", colors["error"]),
+    }
+
+    for action in SYNC_ACTIONS:
+        if not plan[action]:
+            continue
+        title, color = titles[action]
+        print(f"  {color}{title}:{colors['reset']}")
+        for item in plan[action]:
+            name, detail = _describe_change(action, item)
+            print(
+                f"    {colors['primary']}{name}{colors['reset']} {colors['grey']}{detail}{colors['reset']}"
+            )
+        print()
+
+    print(
+        f"  {colors['grey']}{len(plan['unchanged'])} package(s) already in sync{colors['reset']}\n"
+    )
+
+
+def sync_main(args=None):
+    """Main function for the sync command."""
+    colors = get_colors()
+
+    if args is None:
+        args = sys.argv[1:]
+
+    parser = argparse.ArgumentParser(
+        description="Install, update and remove packages to match a manifest. "
+        "Each manifest line is a repository URL, optionally followed by a commit "
+        "to pin the package to",
+        prog="polly sync",
+    )
+    parser.add_argument("manifest", help="Manifest file (- for standard input)")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Show what would change without changing anything",
+    )
+    parser.add_argument(
+        "--keep-extra",
+        action="store_true",
+        help="Keep installed packages that aren't in the manifest",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Sync an empty manifest, removing every installed package",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_INSTALL_JOBS,
+        help=f"Number of packages to process concurrently (default: {DEFAULT_INSTALL_JOBS})",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=DEFAULT_INSTALL_WORKERS,
+        help=f"Number of packages running install or uninstall commands at the same time (default: {DEFAULT_INSTALL_WORKERS})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Clone directly from the repositories instead of the local git cache",
+    )
+
+    try:
+        parsed_args = parser.parse_args(args)
+    except SystemExit:
+        return
+
+    try:
+        manifest = load_manifest(parsed_args.manifest)
+    except (OSError, ValueError) as e:
+        if is_simple_mode():
+            print(f"error:Invalid manifest {parsed_args.manifest}: {e}")
+        else:
+            print(
+                format_message("error", f"Invalid manifest {parsed_args.manifest}: {e}")
+            )
+        sys.exit(1)
+
+    try:
+        if not is_simple_mode():
+            print_header("Polly", "Package Sync")
+
+        try:
+            plan = build_sync_plan(
+                manifest,
+                keep_extra=parsed_args.keep_extra,
+                force=parsed_args.force,
+                jobs=max(1, parsed_args.jobs),
+            )
+        except ValueError as e:
+            if is_simple_mode():
+                print(f"error:{e}")
+            else:
+                print(format_message("error", str(e)))
+                print(
+                    f"  {colors['grey']}Use --force to remove them, or --keep-extra to keep them{colors['reset']}"
+                )
+            sys.exit(1)
+
+        if is_simple_mode():
+            display_sync_plan_simple(plan)
+        else:
+            display_sync_plan(plan)
+
+        if is_sync_plan_empty(plan):
+            if is_simple_mode():
+                print("success:All packages are in sync")
+            else:
+                print(format_message("success", "All packages are in sync"))
+            return
+
+        if parsed_args.dry_run:
+            return
+
+        success, message, results = execute_sync_plan(
+            plan,
+            jobs=max(1, parsed_args.jobs),
+            workers=max(1, parsed_args.workers),
+            use_cache=not parsed_args.no_cache,
+        )
+
+        if is_simple_mode():
+            if results["successful"]:
+                print(f"synced_successfully:{','.join(results['successful'])}")
+            if results["failed"]:
+                print(f"synced_failed:{','.join(results['failed'])}")
+            print(f"sync_success:{success}")
+        else:
+            print()
+            for name in results["failed"]:
+                print(format_message("error", f"{name}: {results['messages'][name]}"))
+            print(format_message("success" if success else "error", message))
+            print()
+
+        if not success:
+            sys.exit(1)
+
+    except KeyboardInterrupt:
+        if is_simple_mode():
+            print("error:Sync cancelled by user")
+        else:
+            print(format_message("error", "Sync cancelled by user"))
+        sys.exit(1)
+    except Exception as e:
+        error_message = handle_exception_with_debug(
+            f"Unexpected error during sync: {e}", e
+        )
+        if is_simple_mode():
+            print(f"error:{error_message}")
+        else:
+            print(format_message("error", error_message))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    sync_main()
@@ -1,15 +1,10 @@
 import sys
 import argparse
-from polly.core import uninstall_package
-from polly.utils import (
-    print_header,
-    format_message,
-    get_colors,
-    get_package_names,
-    is_simple_mode,
-    is_debug_mode,
-    handle_exception_with_debug,
-)
+from polly.core.uninstall_package import uninstall_package
+from polly.utils.colors import print_header, format_message, get_colors
+from polly.utils.package import package_exists
+from polly.utils.simple import is_simple_mode
+from polly.utils.debug import is_debug_mode, handle_exception_with_debug
 
 
 def uninstall_main(args=None):
@@ -36,8 +31,7 @@ def uninstall_main(args=None):
     skip_confirmation = parsed_args.yes
 
     # Check if package is installed
-    installed_packages = get_package_names()
-    if package_name not in installed_packages:
+    if not package_exists(package_name):
         if is_simple_mode():
             print(f"error:Package '{package_name}' is not installed")
         else:
@@ -3,7 +3,7 @@ import sys
 import os
 
 # Import simple mode utilities
-from polly.utils import is_simple_mode
+from polly.utils.simple import is_simple_mode
 
 # ANSI color constants
 RESET = "\033[0m"
@@ -1,18 +1,26 @@
 import sys
+import json
 import argparse
-from polly.core import upgrade_packages, check_package_updates, get_upgrade_summary
-from polly.utils import (
-    print_header,
-    format_message,
-    get_colors,
-    format_size,
-    is_simple_mode,
+from polly.core.upgrade_package import (
+    build_upgrade_plan,
+    execute_upgrade_plan,
+    UpgradePlan,
+    DEFAULT_CHECK_JOBS,
+    DEFAULT_UPGRADE_WORKERS,
 )
+from polly.utils.colors import print_header, format_message, get_colors
+from polly.utils.filesystem import format_size
+from polly.utils.simple import is_simple_mode
+from polly.utils.json_mode import is_json_mode, print_json
+from polly.utils.profiling import phase
 from polly.utils.debug import is_debug_mode, handle_exception_with_debug
 
 
-def display_upgrade_summary_simple(upgradeable_packages, error_packages):
+def display_upgrade_summary_simple(plan):
     """Display upgrade summary in simple mode for external tools."""
+    upgradeable_packages = plan.packages
+    error_packages = plan.errors
+
     if error_packages:
         print(f"errors:{','.join(error_packages)}")
 
@@ -29,9 +37,30 @@ def display_upgrade_summary_simple(upgradeable_packages, error_packages):
     return True
 
 
-def display_upgrade_summary(upgradeable_packages, error_packages):
+def print_update_check_json(package, update_info, error=None):
+    """Write the result of one package's update check as JSON."""
+    record = {"type": "update_check", "name": package["name"]}
+    if update_info is None:
+        record["status"] = "error"
+        record["error"] = error
+    elif update_info is False:
+        record["status"] = "up_to_date"
+    else:
+        record["status"] = "update_available"
+        record.update(update_info)
+    print_json(record)
+
+
+def print_upgrade_result_json(package, upgraded):
+    """Write the result of one package's upgrade as JSON."""
+    print_json({"type": "upgrade", "name": package["name"], "success": upgraded})
+
+
+def display_upgrade_summary(plan):
     """Display the upgrade summary."""
     colors = get_colors()
+    upgradeable_packages = plan.packages
+    error_packages = plan.errors
 
     if error_packages:
         print(
@@ -50,7 +79,7 @@ def display_upgrade_summary(upgradeable_packages, error_packages):
         f"  {colors['info']}The following packages will be upgraded:{colors['reset']}\n"
     )
 
-    summary = get_upgrade_summary(upgradeable_packages)
+    summary = plan.summary()
 
     for package in upgradeable_packages:
         package_name = package["name"]
@@ -115,6 +144,31 @@ def upgrade_main(args=None):
         action="store_true",
         help="Only check for updates, don't upgrade",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_CHECK_JOBS,
+        help=f"Number of packages to check for updates concurrently (default: {DEFAULT_CHECK_JOBS})",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=DEFAULT_UPGRADE_WORKERS,
+        help=f"Number of packages to upgrade at the same time (default: {DEFAULT_UPGRADE_WORKERS}). "
+        "Packages with the same 'serialGroup' in their metadata always run one after another",
+    )
+    parser.add_argument(
+        "--save-plan",
+        metavar="FILE",
+        help="Save the upgrade plan to FILE so it can be applied later with --plan",
+    )
+    parser.add_argument(
+        "--plan",
+        metavar="FILE",
+        help="Apply a saved upgrade plan instead of checking for updates",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -128,6 +182,8 @@ def upgrade_main(args=None):
 
     skip_confirmation = parsed_args.yes
     check_only = parsed_args.check_only
+    jobs = max(1, parsed_args.jobs)
+    workers = max(1, parsed_args.workers)
 
     # Enable debug mode if requested via command line argument
     # (This is in addition to the global --debug flag)
@@ -142,13 +198,32 @@ def upgrade_main(args=None):
         print(format_message("progress", "Scanning installed packages..."))
 
     try:
-        upgradeable_packages, error_packages = check_package_updates()
-
-        if not is_simple_mode():
-            print(format_message("progress", "Checking for updates..."))
+        if parsed_args.plan:
+            # Apply to the exact commits the saved plan was built against
+            with open(parsed_args.plan, "r") as f:
+                plan = UpgradePlan.from_dict(json.load(f))
+        else:
+            if not is_simple_mode():
+                print(format_message("progress", "Checking for updates..."))
+            # JSON mode reports every check as soon as it finishes
+            on_checked = print_update_check_json if is_json_mode() else None
+            plan = build_upgrade_plan(jobs=jobs, on_checked=on_checked)
+
+        if parsed_args.save_plan:
+            with open(parsed_args.save_plan, "w") as f:
+                json.dump(plan.to_dict(), f, indent=2)
+
+        if is_json_mode():
+            print_json(
+                {
+                    "type": "upgrade_plan",
+                    "upgradeable": [package["name"] for package in plan.packages],
+                    "errors": plan.errors,
+                }
+            )
 
         # Display results
-        if not upgradeable_packages and not error_packages:
+        if plan.is_empty() and not plan.errors:
             if is_simple_mode():
                 print("updates_available:false")
             else:
@@ -156,12 +231,11 @@ def upgrade_main(args=None):
             return
 
         # Choose display mode
-        if is_simple_mode():
-            has_upgrades = display_upgrade_summary_simple(
-                upgradeable_packages, error_packages
-            )
-        else:
-            has_upgrades = display_upgrade_summary(upgradeable_packages, error_packages)
+        with phase("rendering"):
+            if is_simple_mode():
+                has_upgrades = display_upgrade_summary_simple(plan)
+            else:
+                has_upgrades = display_upgrade_summary(plan)
 
         if not has_upgrades:
             return
@@ -195,10 +269,21 @@ def upgrade_main(args=None):
             print(format_message("progress", "Upgrading packages..."))
             print()
 
-        success, message, results = upgrade_packages()
+        # Execute the plan that was displayed, without fetching again
+        on_upgraded = print_upgrade_result_json if is_json_mode() else None
+        success, message, results = execute_upgrade_plan(plan, workers, on_upgraded)
 
         # Show results
-        if is_simple_mode():
+        if is_json_mode():
+            print_json(
+                {
+                    "type": "upgrade_summary",
+                    "success": success,
+                    "successful": results["successful"],
+                    "failed": results["failed"],
+                }
+            )
+        elif is_simple_mode():
             if results["successful"]:
                 print(f"upgraded_successfully:{','.join(results['successful'])}")
             if results["failed"]:
@@ -233,7 +318,9 @@ def upgrade_main(args=None):
             sys.exit(1)
 
     except KeyboardInterrupt:
-        if is_simple_mode():
+        if is_json_mode():
+            print_json({"type": "error", "message": "Upgrade cancelled by user"})
+        elif is_simple_mode():
             print("error:Upgrade cancelled by user")
         else:
             print(format_message("error", "Upgrade cancelled by user"))
@@ -242,7 +329,9 @@ def upgrade_main(args=None):
         error_message = handle_exception_with_debug(
             f"Unexpected error during upgrade: {e}", e
         )
-        if is_simple_mode():
+        if is_json_mode():
+            print_json({"type": "error", "message": error_message})
+        elif is_simple_mode():
             print(f"error:{error_message}")
         else:
             print(format_message("error", error_message))
@@ -0,0 +1,37 @@
+"""
+Configuration handling for Polly.
+Settings are read from /etc/polly/config.json, and each one can be
+overridden with a POLLY_<NAME> environment variable.
+"""
+
+import os
+import json
+from functools import lru_cache
+
+CONFIG_FILE = "/etc/polly/config.json"
+
+
+@lru_cache(maxsize=1)
+def load_config():
+    """Load the configuration file, or an empty config if there is none."""
+    config_file = os.environ.get("POLLY_CONFIG", CONFIG_FILE)
+    try:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+        return config if isinstance(config, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def get_config_value(name, default=None):
+    """
+    Get a configuration value.
+
+    :param name: Setting name, e.g. git_cache_limit
+    :param default: Value used when the setting isn't configured
+    :return: The environment override, the configured value, or the default
+    """
+    env_value = os.environ.get(f"POLLY_{name.upper()}")
+    if env_value is not None:
+        return env_value
+    return load_config().get(name, default)
@@ -1,14 +1,52 @@
-from polly.core.requires_update import (
-    update_required,
-    latest_version,
-    get_current_version
+import sys
+import types
+import importlib
+
+# Modules whose operations are available from polly.core. Commands import the
+# module they run directly, so only that operation is loaded. A name used from
+# the package is looked up in each module in turn.
+_MODULES = (
+    "requires_update",
+    "install_package",
+    "download_package",
+    "uninstall_package",
+    "inspect_package",
+    "upgrade_package",
+    "list_packages",
+    "reindex_packages",
+    "sync_packages",
 )
-from .install_package import install_package_from_git
-from .uninstall_package import uninstall_package
-from .inspect_package import inspect_package
-from .upgrade_package import (
-    upgrade_packages,
-    check_package_updates,
-    get_upgrade_summary,
-)
-from .list_packages import list_packages
+
+
+class _CorePackage(types.ModuleType):
+    """
+    The polly.core package, where an operation takes precedence over the
+    module of the same name.
+
+    Importing a module such as polly.core.uninstall_package binds it to that
+    name in the package, hiding the uninstall_package function it defines.
+    """
+
+    def __getattribute__(self, name):
+        value = super().__getattribute__(name)
+        if (
+            isinstance(value, types.ModuleType)
+            and value.__name__ == f"{__name__}.{name}"
+            and hasattr(value, name)
+        ):
+            return getattr(value, name)
+        return value
+
+
+def __getattr__(name):
+    if not name.startswith("_"):
+        for module_name in _MODULES:
+            module = importlib.import_module(f"{__name__}.{module_name}")
+            if hasattr(module, name):
+                value = getattr(module, name)
+                globals()[name] = value
+                return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+sys.modules[__name__].__class__ = _CorePackage
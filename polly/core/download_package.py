@@ -1,24 +1,110 @@
+import shlex
 import subprocess
 
-from ..utils import run_silent_command
+from ..utils.command import run_silent_command
+from ..utils.git_cache import update_mirror
+from ..utils.profiling import phase
 
+# Clone options that can be passed to download_package, or declared under
+# "clone" in .install.polly.json
+CLONE_OPTION_KEYS = ("depth", "filter", "singleBranch")
 
-def download_package(repo_url, dest_dir=None):
+
+def get_clone_options(depth=None, filter_spec=None, single_branch=False, metadata=None):
+    """
+    Build clone options from explicit values, falling back to metadata.
+
+    :param depth: Number of commits of history to clone
+    :param filter_spec: Partial clone filter, e.g. blob:none
+    :param single_branch: Whether to clone only the default branch
+    :param metadata: Package metadata that may declare "clone" options
+    :return: Dictionary with depth, filter and singleBranch
+    """
+    declared = {}
+    if metadata and isinstance(metadata.get("clone"), dict):
+        declared = metadata["clone"]
+
+    return {
+        "depth": depth if depth is not None else declared.get("depth"),
+        "filter": filter_spec if filter_spec is not None else declared.get("filter"),
+        "singleBranch": bool(single_branch or declared.get("singleBranch", False)),
+    }
+
+
+def build_clone_arguments(clone_options=None):
+    """Get the extra git clone arguments for a set of clone options."""
+    clone_options = clone_options or {}
+    arguments = []
+
+    if clone_options.get("depth"):
+        arguments.append(f"--depth {int(clone_options['depth'])}")
+    if clone_options.get("filter"):
+        arguments.append(f"--filter={shlex.quote(clone_options['filter'])}")
+    if clone_options.get("singleBranch"):
+        arguments.append("--single-branch")
+
+    return arguments
+
+
+@phase("git calls")
+def download_package(
+    repo_url, dest_dir=None, clone_options=None, use_cache=True, reference_dir=None
+):
     """
     Clone a package to the specified directory.
 
+    Shallow (depth), partial (filter) and single-branch clones are supported,
+    update checks keep working on them because fetching into a shallow clone
+    only transfers the commits between its history and the new remote tip.
+
+    With the cache enabled the package is cloned from a local mirror of the
+    repository, so only new objects come over the network. The clone gets
+    its own hardlinked copy of the objects, evicting the mirror later never
+    affects installed packages. Shallow, partial and single-branch clones
+    skip the cache, a mirror would download the full history they avoid.
+
     :param repo_url: URL of the git repository for the package
     :param dest_dir: Destination directory (optional)
+    :param clone_options: Dictionary from get_clone_options (optional)
+    :param use_cache: Whether to clone through the local git cache
+    :param reference_dir: Existing checkout of the same repository to copy
+                          objects from instead of transferring them again
     :return: None
     :raises: subprocess.CalledProcessError if git clone fails
     """
-    command = f"git clone {repo_url}"
+    clone_arguments = build_clone_arguments(clone_options)
+    mirror_path = None
+    if use_cache and not clone_arguments:
+        mirror_path = update_mirror(repo_url)
+
+    source = shlex.quote(mirror_path or repo_url)
+
+    reference_arguments = []
+    if reference_dir:
+        # --dissociate copies the borrowed objects, the reference can go away
+        reference_arguments = [
+            f"--reference-if-able {shlex.quote(reference_dir)}",
+            "--dissociate",
+        ]
+
+    command = " ".join(
+        ["git clone"] + clone_arguments + reference_arguments + [source]
+    )
     if dest_dir:
-        command += f" {dest_dir}"
+        command += f" {shlex.quote(dest_dir)}"
 
     if not run_silent_command(command, "Cloning package"):
         raise subprocess.CalledProcessError(
             returncode=1, cmd=command, output="Failed to clone package"
         )
+
+    if mirror_path:
+        clone_dir = dest_dir or repo_url.rstrip("/").split("/")[-1].removesuffix(".git")
+        run_silent_command(
+            f"git -C {shlex.quote(clone_dir)} remote set-url origin "
+            f"{shlex.quote(repo_url)}",
+            "Pointing package at its repository",
+        )
+
     print("Package cloned successfully.")
-    return
\ No newline at end of file
+    return
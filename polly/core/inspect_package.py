@@ -1,20 +1,14 @@
 import os
 import json
 from datetime import datetime
-from ..utils import (
-    get_package_by_name,
-    get_directory_size,
-    format_size,
-    get_file_count,
-    get_git_info,
-    file_exists,
-)
+from ..utils.package import resolve_package
+from ..utils.filesystem import get_directory_stats, format_size, file_exists
+from ..utils.git import get_git_info
 
 
 def get_package_statistics(package_path):
     """Get statistics for a package."""
-    package_size = get_directory_size(package_path)
-    file_count = get_file_count(package_path)
+    package_size, file_count = get_directory_stats(package_path)
     install_time = os.path.getctime(package_path)
     install_date = datetime.fromtimestamp(install_time).strftime("%Y-%m-%d %H:%M:%S")
 
@@ -54,7 +48,7 @@ def inspect_package(package_name):
     """
     try:
         # Get package information
-        package = get_package_by_name(package_name)
+        package = resolve_package(package_name, fields=("metadata",))
         if not package:
             return False, f"Package '{package_name}' is not installed", None
 
@@ -1,43 +1,155 @@
 import json
 import os
 import shutil
-from .download_package import download_package
-from ..utils import (
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .download_package import download_package, get_clone_options
+from ..utils.git import (
     extract_package_id_from_url,
+    get_git_origin,
+    resolve_commit,
+    run_git_command,
+)
+from ..utils.package import (
     validate_metadata_file,
-    run_silent_command,
+    record_package,
+    load_package_metadata,
+    PACKAGES_DIR,
+)
+from ..utils.command import run_silent_command, run_command_steps
+from ..utils.filesystem import (
     safe_create_directory,
     safe_remove_directory,
-    PACKAGES_DIR,
+    replace_directory,
+    swap_directory,
+    restore_directory,
+    invalidate_size_cache,
 )
+from ..utils.output import capture_thread_output
+from ..utils.profiling import phase
+from ..utils.trace import trace_context, span
+
+# Cloning mostly waits on the network, so several packages can clone at once
+DEFAULT_INSTALL_JOBS = 4
+
+# Install commands may share global state (package managers, locks), so by
+# default only one package runs its install commands at a time
+DEFAULT_INSTALL_WORKERS = 1
+
+# git config --global can't be written by several processes at once
+_git_config_lock = threading.Lock()
 
 
-def install_package_from_metadata(package_dir, metadata):
-    """Install package based on metadata configuration."""
+@phase("install commands")
+def install_package_from_metadata(package_dir, metadata, package_name=None):
+    """
+    Install package based on metadata configuration.
+
+    :param package_dir: Directory to run the install commands in
+    :param metadata: Package metadata
+    :param package_name: Package the commands' output is logged under (optional)
+    :return: bool indicating success
+    """
     install_commands = metadata["install"]
+    descriptions = [
+        f"Running install command {i + 1}/{len(install_commands)}"
+        for i in range(len(install_commands))
+    ]
+
+    # Execute install commands, in one shell if the package asks for it
+    success, _ = run_command_steps(
+        install_commands,
+        descriptions,
+        cwd=package_dir,
+        package=package_name,
+        operation="install",
+        persistent_shell=metadata.get("persistentShell", False),
+    )
+    return success
+
+
+def _install_staged(staging_dir, package_dest, metadata, package_id):
+    """
+    Run the install commands in the staging directory, then swap it in.
 
-    # Execute install commands
-    for i, command in enumerate(install_commands):
-        description = f"Running install command {i + 1}/{len(install_commands)}"
-        if not run_silent_command(command, description, cwd=package_dir):
-            return False
+    :return: Tuple of (success: bool, error message or None)
+    """
+    if not install_package_from_metadata(staging_dir, metadata, package_id):
+        # Clean up downloaded package
+        safe_remove_directory(staging_dir)
+        return False, "Package installation failed"
+
+    # Swap the new package in
+    if not replace_directory(staging_dir, package_dest):
+        safe_remove_directory(staging_dir)
+        return False, "Failed to replace existing package installation"
+
+    return True, None
+
+
+def _install_in_place(staging_dir, package_dest, metadata, package_id):
+    """
+    Swap the staging directory in, then run the install commands there.
+
+    For packages whose install records its own absolute path, e.g. a venv.
+    The installed package is kept aside while the commands run and is put
+    back if they fail, so it's unavailable for the length of the install.
+
+    :return: Tuple of (success: bool, error message or None)
+    """
+    swapped, backup_dir = swap_directory(staging_dir, package_dest)
+    if not swapped:
+        safe_remove_directory(staging_dir)
+        return False, "Failed to replace existing package installation"
+
+    if not install_package_from_metadata(package_dest, metadata, package_id):
+        restored = restore_directory(backup_dir, package_dest)
+        invalidate_size_cache(package_dest)
+        if not restored:
+            return (
+                False,
+                "Package installation failed and the previous installation "
+                f"could not be restored from {backup_dir}",
+            )
+        return False, "Package installation failed"
 
-    return True
+    if backup_dir:
+        safe_remove_directory(backup_dir)
+    return True, None
 
 
-def install_package_from_git(repo_url):
+def install_package_from_git(
+    repo_url, clone_options=None, use_cache=True, install_slots=None, commit=None
+):
     """
     Install a package from a git repository URL.
 
+    The package is cloned and installed in a hidden staging directory next to
+    its final location, and only replaces the installed package once its
+    install commands succeed. A failed reinstall leaves the old package as it
+    was. Packages with "installInPlace" in their metadata are installed at
+    their final location instead, see _install_in_place.
+
     :param repo_url: URL of the git repository for the package
+    :param clone_options: Clone options from get_clone_options. Without them,
+                          a reinstall reuses the options declared in the
+                          installed package's metadata.
+    :param use_cache: Whether to clone through the local git cache
+    :param install_slots: Semaphore bounding how many packages run their
+                          install commands at the same time (optional)
+    :param commit: Commit to install instead of the default branch tip
     :return: Tuple of (success: bool, message: str, package_name: str or None)
     """
     try:
         # Extract package ID from URL
         package_id = extract_package_id_from_url(repo_url)
 
-        # Set up destination directory
+        # Set up destination and staging directories
         package_dest = os.path.join(PACKAGES_DIR, package_id)
+        staging_dir = os.path.join(
+            PACKAGES_DIR, f".{package_id}.staging-{os.getpid()}"
+        )
 
         # Create packages directory if it doesn't exist
         if not safe_create_directory(PACKAGES_DIR):
@@ -47,29 +159,53 @@ def install_package_from_git(repo_url):
                 None,
             )
 
-        # Remove existing package directory if it exists
-        if os.path.exists(package_dest):
-            if not safe_remove_directory(package_dest):
-                return False, "Failed to remove existing package installation", None
+        # Reinstalls clone the way the installed package declares
+        if clone_options is None:
+            clone_options = get_clone_options(
+                metadata=load_package_metadata(package_dest)
+            )
+
+        # Reuse objects from the installed checkout of the same repository
+        reference_dir = None
+        if os.path.isdir(package_dest) and get_git_origin(package_dest) == repo_url:
+            reference_dir = package_dest
+
+        # Clear what an interrupted install may have left behind
+        safe_remove_directory(staging_dir)
 
         # Download the package
         try:
-            download_package(repo_url, package_dest)
-            run_silent_command(
-                f"git config --global --add safe.directory {package_dest}",
-                f"Marking {package_dest} as safe for git operations",
+            download_package(
+                repo_url, staging_dir, clone_options, use_cache, reference_dir
             )
+            with _git_config_lock:
+                run_silent_command(
+                    f"git config --global --add safe.directory {package_dest}",
+                    f"Marking {package_dest} as safe for git operations",
+                )
         except Exception as e:
+            safe_remove_directory(staging_dir)
             return False, f"Failed to download package: {e}", None
 
+        # Keep the branch so later upgrades move forward from the pinned commit
+        if commit:
+            target_commit = resolve_commit(staging_dir, commit)
+            if target_commit:
+                result = run_git_command(
+                    staging_dir, ["reset", "--hard", "--quiet", target_commit]
+                )
+            if not target_commit or result.returncode != 0:
+                safe_remove_directory(staging_dir)
+                return False, f"Commit {commit} not found in {repo_url}", None
+
         # Check for metadata file
-        metadata_file = os.path.join(package_dest, ".install.polly.json")
+        metadata_file = os.path.join(staging_dir, ".install.polly.json")
 
         # Validate metadata
         is_valid, error_msg = validate_metadata_file(metadata_file)
         if not is_valid:
             # Clean up downloaded package
-            safe_remove_directory(package_dest)
+            safe_remove_directory(staging_dir)
             return False, f"Invalid package metadata: {error_msg}", None
 
         # Load metadata
@@ -77,16 +213,110 @@ def install_package_from_git(repo_url):
             with open(metadata_file, "r") as f:
                 metadata = json.load(f)
         except Exception as e:
-            safe_remove_directory(package_dest)
+            safe_remove_directory(staging_dir)
             return False, f"Failed to load metadata: {e}", None
 
         # Install package based on metadata
-        if not install_package_from_metadata(package_dest, metadata):
-            # Clean up downloaded package
-            safe_remove_directory(package_dest)
-            return False, "Package installation failed", None
+        with install_slots or nullcontext():
+            if metadata.get("installInPlace", False):
+                installed, message = _install_in_place(
+                    staging_dir, package_dest, metadata, package_id
+                )
+            else:
+                installed, message = _install_staged(
+                    staging_dir, package_dest, metadata, package_id
+                )
+
+        if not installed:
+            return False, message, None
+
+        invalidate_size_cache(package_dest)
+        record_package(package_id)
 
         return True, f"Package '{package_id}' installed successfully", package_id
 
     except Exception as e:
         return False, f"Unexpected error during installation: {e}", None
+
+
+def _install_batch_package(repo_url, clone_options, use_cache, install_slots):
+    """Install one package of a batch, capturing everything it prints."""
+    package_id = extract_package_id_from_url(repo_url)
+
+    with trace_context(package=package_id), span("install", "package"):
+        with capture_thread_output(write=False) as buffers:
+            success, message, package_name = install_package_from_git(
+                repo_url, clone_options, use_cache, install_slots
+            )
+
+    return {
+        "repo_url": repo_url,
+        "package_id": package_id,
+        "success": success,
+        "message": message,
+        "package_name": package_name,
+        "output": buffers["stdout"].getvalue() + buffers["stderr"].getvalue(),
+    }
+
+
+def iter_install_packages_from_git(
+    repo_urls,
+    clone_options=None,
+    use_cache=True,
+    jobs=DEFAULT_INSTALL_JOBS,
+    workers=DEFAULT_INSTALL_WORKERS,
+):
+    """
+    Install several packages, yielding each result as soon as it finishes.
+
+    Packages are cloned concurrently, while at most ``workers`` of them run
+    their install commands at the same time. A failing package never stops
+    the others.
+
+    :param repo_urls: Git repository URLs of the packages to install
+    :param clone_options: Clone options for every package (optional)
+    :param use_cache: Whether to clone through the local git cache
+    :param jobs: Maximum number of packages to clone concurrently
+    :param workers: Maximum number of packages running install commands at once
+    :return: Generator of result dictionaries with repo_url, package_id,
+             success, message, package_name and the captured output
+    """
+    install_slots = threading.BoundedSemaphore(max(1, workers))
+    claimed = {}
+    pending = []
+
+    for repo_url in dict.fromkeys(repo_urls):
+        package_id = extract_package_id_from_url(repo_url)
+
+        # Two repositories with the same name would install to the same place
+        if package_id in claimed:
+            yield {
+                "repo_url": repo_url,
+                "package_id": package_id,
+                "success": False,
+                "message": f"Package '{package_id}' is already installed from "
+                f"{claimed[package_id]} in this batch",
+                "package_name": None,
+                "output": "",
+            }
+            continue
+
+        claimed[package_id] = repo_url
+        pending.append(repo_url)
+
+    if not pending:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(pending)))) as executor:
+        futures = [
+            executor.submit(
+                _install_batch_package,
+                repo_url,
+                clone_options,
+                use_cache,
+                install_slots,
+            )
+            for repo_url in pending
+        ]
+        for future in as_completed(futures):
+            yield future.result()
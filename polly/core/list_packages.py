@@ -1,17 +1,67 @@
-from ..utils import get_installed_packages, format_size
+from ..utils.package import iter_installed_packages
+from ..utils.filesystem import format_size
 
 
-def list_packages(detailed=False):
+def format_package(package, detailed=False, include_size=True):
+    """
+    Format an installed package for display.
+
+    :param package: Package information dictionary
+    :param detailed: Whether to include detailed information
+    :param include_size: Whether the package size is available
+    :return: Dictionary with the formatted package
+    """
+    formatted_package = {
+        "name": package["name"],
+        "size": package["size"] if include_size else None,
+        "size_formatted": format_size(package["size"]) if include_size else None,
+        "install_date": package["install_date"],
+        "path": package["path"],
+        "has_metadata": package["metadata"] is not None,
+    }
+
+    if detailed:
+        # Add detailed information
+        if package["metadata"]:
+            metadata = package["metadata"]
+
+            formatted_package.update(
+                {
+                    "install_commands": metadata.get("install", []),
+                    "uninstall_commands": metadata.get("uninstall", []),
+                    "version": metadata.get("version"),
+                    "description": metadata.get("description"),
+                    "author": metadata.get("author"),
+                }
+            )
+
+    return formatted_package
+
+
+def iter_packages(detailed=False, include_size=True, **filters):
+    """
+    Yield installed packages formatted for display, as soon as each is read.
+
+    :param detailed: Whether to include detailed information
+    :param include_size: Whether to compute package sizes
+    :param filters: Filters, sort and limit passed to iter_installed_packages
+    """
+    for package in iter_installed_packages(include_size, **filters):
+        yield format_package(package, detailed, include_size)
+
+
+def list_packages(detailed=False, include_size=True):
     """
     List all installed packages.
 
     :param detailed: Whether to return detailed information
+    :param include_size: Whether to compute package sizes
     :return: Tuple of (success: bool, message: str, data: dict)
     """
     try:
-        packages = get_installed_packages()
+        formatted_packages = list(iter_packages(detailed, include_size))
 
-        if not packages:
+        if not formatted_packages:
             return (
                 True,
                 "No packages are currently installed",
@@ -24,45 +74,22 @@ def list_packages(detailed=False):
             )
 
         # Calculate totals
-        total_size = sum(package["size"] for package in packages)
-
-        # Format packages for display
-        formatted_packages = []
-        for package in packages:
-            formatted_package = {
-                "name": package["name"],
-                "size": package["size"],
-                "size_formatted": format_size(package["size"]),
-                "install_date": package["install_date"],
-                "path": package["path"],
-                "has_metadata": package["metadata"] is not None,
-            }
-
-            if detailed:
-                # Add detailed information
-                if package["metadata"]:
-                    metadata = package["metadata"]
-
-                    formatted_package.update(
-                        {
-                            "install_commands": metadata.get("install", []),
-                            "uninstall_commands": metadata.get("uninstall", []),
-                            "version": metadata.get("version"),
-                            "description": metadata.get("description"),
-                            "author": metadata.get("author"),
-                        }
-                    )
-
-            formatted_packages.append(formatted_package)
+        total_size = (
+            sum(package["size"] for package in formatted_packages)
+            if include_size
+            else None
+        )
 
         return (
             True,
-            f"Found {len(packages)} installed package(s)",
+            f"Found {len(formatted_packages)} installed package(s)",
             {
                 "packages": formatted_packages,
-                "total_count": len(packages),
+                "total_count": len(formatted_packages),
                 "total_size": total_size,
-                "total_size_formatted": format_size(total_size),
+                "total_size_formatted": (
+                    format_size(total_size) if include_size else None
+                ),
                 "detailed": detailed,
             },
         )
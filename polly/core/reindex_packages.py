@@ -0,0 +1,28 @@
+from ..utils.package import rebuild_package_index, PACKAGES_DIR
+from ..utils.index import get_index_path
+
+
+def reindex_packages():
+    """
+    Rebuild the package index from the installed package directories.
+
+    :return: Tuple of (success: bool, message: str, data: dict)
+    """
+    try:
+        total_count = rebuild_package_index()
+
+        return (
+            True,
+            f"Indexed {total_count} package(s)",
+            {
+                "total_count": total_count,
+                "index_path": get_index_path(PACKAGES_DIR),
+            },
+        )
+
+    except Exception as e:
+        return (
+            False,
+            f"Error rebuilding package index: {e}",
+            {"total_count": 0, "index_path": get_index_path(PACKAGES_DIR)},
+        )
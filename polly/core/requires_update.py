@@ -1,26 +1,44 @@
-import requests
+import os
+import sys
+import json
+import time
 import subprocess
 from functools import lru_cache
+from polly.config import get_config_value
+from ..utils.filesystem import is_writable_directory
 
+POLLY_REPOSITORY = "https://github.com/pollypm/polly.git"
+POLLY_COMMITS_API = "https://api.github.com/repos/pollypm/polly/commits"
+NETWORK_TIMEOUT = 10
 
-@lru_cache(maxsize=1)
-def get_latest_commit():
+# The latest commit is cached on disk and trusted for LATEST_COMMIT_TTL seconds
+SYSTEM_CACHE_DIR = "/var/cache/polly"
+LATEST_COMMIT_TTL = 6 * 60 * 60
+
+# A background refresh started less than this many seconds ago is still running
+REFRESH_GRACE_PERIOD = 60
+
+
+def fetch_latest_commit():
+    """Ask GitHub for the latest Polly commit. This blocks on the network."""
     # Try git command first (faster, no rate limits)
     try:
         result = subprocess.run(
-            ["git", "ls-remote", "https://github.com/pollypm/polly.git", "HEAD"],
+            ["git", "ls-remote", POLLY_REPOSITORY, "HEAD"],
             capture_output=True,
             text=True,
-            timeout=10,
+            timeout=NETWORK_TIMEOUT,
         )
         if result.returncode == 0:
             return result.stdout.split()[0]
     except Exception:
         pass
 
-    # Fallback to API
+    # Fallback to API, requests is only imported when it's needed
     try:
-        response = requests.get("https://api.github.com/repos/pollypm/polly/commits")
+        import requests
+
+        response = requests.get(POLLY_COMMITS_API, timeout=NETWORK_TIMEOUT)
         response.raise_for_status()
         commits = response.json()
         if commits:
@@ -30,6 +48,142 @@ def get_latest_commit():
         return None
 
 
+def get_latest_commit_cache():
+    """
+    Get the file the latest commit is cached in.
+
+    The cache is shared in SYSTEM_CACHE_DIR when the user can write to it,
+    otherwise each user keeps their own in their XDG cache directory.
+    """
+    cache_file = get_config_value("latest_commit_cache")
+    if cache_file:
+        return cache_file
+
+    cache_dir = SYSTEM_CACHE_DIR
+    if not is_writable_directory(cache_dir):
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(
+            "~/.cache"
+        )
+        cache_dir = os.path.join(cache_home, "polly")
+    return os.path.join(cache_dir, "latest_commit.json")
+
+
+def _get_latest_commit_ttl():
+    """Get how long a cached latest commit is trusted, in seconds."""
+    try:
+        return float(get_config_value("latest_commit_ttl", LATEST_COMMIT_TTL))
+    except (TypeError, ValueError):
+        return LATEST_COMMIT_TTL
+
+
+def read_latest_commit_cache():
+    """
+    Read the cached latest commit.
+
+    :return: Tuple of (commit: str or None, fresh: bool)
+    """
+    try:
+        with open(get_latest_commit_cache(), "r") as f:
+            data = json.load(f)
+        checked_at = float(data["checked_at"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, False
+
+    age = time.time() - checked_at
+    return data.get("commit"), 0 <= age <= _get_latest_commit_ttl()
+
+
+def refresh_latest_commit_cache():
+    """Fetch the latest commit and store it in the cache."""
+    commit = fetch_latest_commit()
+    cache_file = get_latest_commit_cache()
+    temp_path = f"{cache_file}.{os.getpid()}.tmp"
+
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(temp_path, "w") as f:
+            # Failures are cached too, so an offline host doesn't retry every run
+            json.dump({"commit": commit, "checked_at": time.time()}, f)
+        os.replace(temp_path, cache_file)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    try:
+        os.remove(f"{cache_file}.refreshing")
+    except OSError:
+        pass
+
+    return commit
+
+
+def start_background_refresh():
+    """
+    Refresh the latest commit cache in a detached process.
+
+    :return: True if a refresh was started
+    """
+    cache_file = get_latest_commit_cache()
+    marker = f"{cache_file}.refreshing"
+
+    try:
+        if time.time() - os.path.getmtime(marker) < REFRESH_GRACE_PERIOD:
+            return False
+    except OSError:
+        pass
+
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(marker, "w"):
+            pass
+    except OSError:
+        # The cache can't be written, refreshing it would be pointless
+        return False
+
+    project_root = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    python_path = [project_root]
+    if os.environ.get("PYTHONPATH"):
+        python_path.append(os.environ["PYTHONPATH"])
+
+    try:
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "from polly.core.requires_update import refresh_latest_commit_cache;"
+                "refresh_latest_commit_cache()",
+            ],
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(python_path)),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError:
+        return False
+
+    return True
+
+
+@lru_cache(maxsize=1)
+def get_latest_commit():
+    """
+    Get the latest Polly commit without waiting on the network.
+
+    Returns the cached commit, or None when the cache is missing or stale, in
+    which case a background refresh is started for the next run.
+    """
+    commit, fresh = read_latest_commit_cache()
+    if not fresh:
+        start_background_refresh()
+        return None
+    return commit
+
+
 def get_current_version():
     version_file = "/opt/polly/latest"
     try:
@@ -48,4 +202,4 @@ def update_required() -> bool:
 
 def latest_version() -> str:
     latest_commit = get_latest_commit()
-    return latest_commit if latest_commit else "Unknown"
\ No newline at end of file
+    return latest_commit if latest_commit else "Unknown"
@@ -0,0 +1,354 @@
+import re
+import sys
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .install_package import (
+    install_package_from_git,
+    DEFAULT_INSTALL_JOBS,
+    DEFAULT_INSTALL_WORKERS,
+)
+from .uninstall_package import uninstall_package
+from .upgrade_package import upgrade_single_package
+from ..utils.package import get_installed_packages
+from ..utils.git import (
+    extract_package_id_from_url,
+    normalize_repo_url,
+    get_head_commit,
+    resolve_commit,
+    run_git_command,
+    is_ancestor_commit,
+)
+from ..utils.output import capture_thread_output
+from ..utils.trace import trace_context, span
+from ..utils.debug import handle_exception_with_debug, debug_print
+
+# Pins that look like a (possibly abbreviated) commit id
+COMMIT_ID_PATTERN = re.compile(r"[0-9a-fA-F]{4,40}")
+
+
+def load_manifest(manifest_path):
+    """
+    Load a package manifest.
+
+    Text manifests list one repository URL per line, optionally followed by
+    the commit to pin it to. Blank lines and # comments are skipped. JSON
+    manifests are a list (or an object with a "packages" list) of URLs or
+    {"url": ..., "commit": ...} objects.
+
+    :param manifest_path: Manifest file, or - for standard input
+    :return: List of dictionaries with url, package_id and commit
+    :raises: OSError if the file can't be read, ValueError if it's malformed
+    """
+    if manifest_path == "-":
+        content = sys.stdin.read()
+    else:
+        with open(manifest_path, "r") as f:
+            content = f.read()
+
+    if content.lstrip().startswith(("[", "{")):
+        raw_entries = _parse_json_manifest(content)
+    else:
+        raw_entries = []
+        for line_number, line in enumerate(content.splitlines(), 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            fields = line.split()
+            if len(fields) > 2:
+                raise ValueError(f"Line {line_number}: expected 'url [commit]'")
+            raw_entries.append(
+                {"url": fields[0], "commit": fields[1] if len(fields) > 1 else None}
+            )
+
+    entries = []
+    seen = {}
+    for entry in raw_entries:
+        package_id = extract_package_id_from_url(entry["url"])
+        if not package_id:
+            raise ValueError(f"Invalid repository URL: {entry['url']}")
+        if package_id in seen:
+            raise ValueError(
+                f"Package '{package_id}' is listed twice "
+                f"({seen[package_id]} and {entry['url']})"
+            )
+        seen[package_id] = entry["url"]
+        entries.append(
+            {
+                "url": entry["url"],
+                "package_id": package_id,
+                "commit": entry["commit"],
+            }
+        )
+
+    return entries
+
+
+def _parse_json_manifest(content):
+    """Parse a JSON manifest into url and commit dictionaries."""
+    data = json.loads(content)
+    if isinstance(data, dict):
+        data = data.get("packages")
+    if not isinstance(data, list):
+        raise ValueError("Manifest must be a list of packages")
+
+    raw_entries = []
+    for item in data:
+        if isinstance(item, str):
+            raw_entries.append({"url": item, "commit": None})
+        elif isinstance(item, dict) and isinstance(item.get("url"), str):
+            commit = item.get("commit")
+            if commit is not None and not isinstance(commit, str):
+                raise ValueError(f"Invalid commit for {item['url']}")
+            raw_entries.append({"url": item["url"], "commit": commit})
+        else:
+            raise ValueError(f"Invalid manifest entry: {item!r}")
+    return raw_entries
+
+
+def resolve_pin(package_path, pin):
+    """
+    Resolve a manifest pin to a full commit id.
+
+    Branches and tags can move, so origin is fetched once before they're
+    resolved. Branch pins resolve to the fetched origin branch, since the
+    package's own branch is left wherever it was last pinned. Commit ids
+    only fetch when the commit isn't available locally.
+
+    :param package_path: Repository directory of the package
+    :param pin: Commit id, tag or branch from the manifest
+    :return: Full commit id, or None if the pin can't be resolved
+    """
+    if COMMIT_ID_PATTERN.fullmatch(pin):
+        return resolve_commit(package_path, pin)
+
+    result = run_git_command(package_path, ["fetch", "--quiet", "--tags", "origin"])
+    if result.returncode != 0:
+        debug_print(f"Failed to fetch origin of {package_path}: {result.stderr}")
+
+    commit = resolve_commit(package_path, f"origin/{pin}", fetch=False)
+    return commit or resolve_commit(package_path, pin, fetch=False)
+
+
+def build_sync_plan(
+    manifest, keep_extra=False, force=False, jobs=DEFAULT_INSTALL_JOBS
+):
+    """
+    Compare a manifest with the installed packages.
+
+    Only local state is read where possible, packages pinned to the commit
+    they have checked out cost no network access and no git process. Other
+    pins are resolved with git, up to ``jobs`` packages at a time, fetching
+    origin for tag and branch pins.
+
+    :param manifest: Entries from load_manifest
+    :param keep_extra: Whether to keep installed packages missing from the manifest
+    :param force: Whether an empty manifest may remove every installed package
+    :param jobs: Maximum number of packages resolving their pin concurrently
+    :return: Dictionary with install, reinstall, update, remove and unchanged
+             lists. Install, reinstall and update hold manifest entries
+             (updates also carry the package, its current commit and the
+             resolved target commit), remove and unchanged hold package names.
+    :raises: ValueError if the manifest is empty and would remove everything
+    """
+    if not manifest and not keep_extra and not force:
+        raise ValueError(
+            "The manifest lists no packages, syncing it would remove every "
+            "installed package"
+        )
+
+    installed = {
+        package["name"]: package
+        for package in get_installed_packages(include_size=False)
+    }
+    plan = {
+        "install": [],
+        "reinstall": [],
+        "update": [],
+        "remove": [],
+        "unchanged": [],
+    }
+    pending = []
+
+    for entry in manifest:
+        package = installed.get(entry["package_id"])
+
+        if package is None:
+            plan["install"].append(entry)
+            continue
+
+        origin = package.get("origin")
+        if not origin or normalize_repo_url(origin) != normalize_repo_url(
+            entry["url"]
+        ):
+            # Same name from another repository, replace it
+            plan["reinstall"].append(entry)
+            continue
+
+        if entry["commit"]:
+            pin = entry["commit"]
+            head_commit = get_head_commit(package["path"])
+            if (
+                head_commit
+                and COMMIT_ID_PATTERN.fullmatch(pin)
+                and head_commit.startswith(pin.lower())
+            ):
+                plan["unchanged"].append(entry["package_id"])
+                continue
+
+            pending.append((entry, package, head_commit))
+            continue
+
+        plan["unchanged"].append(entry["package_id"])
+
+    if pending:
+        max_workers = max(1, min(jobs, len(pending)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            target_commits = list(
+                executor.map(
+                    lambda item: resolve_pin(item[1]["path"], item[0]["commit"]),
+                    pending,
+                )
+            )
+
+        for (entry, package, head_commit), target_commit in zip(
+            pending, target_commits
+        ):
+            if head_commit and target_commit == head_commit:
+                plan["unchanged"].append(entry["package_id"])
+            else:
+                plan["update"].append(
+                    dict(
+                        entry,
+                        package=package,
+                        current_commit=head_commit,
+                        target_commit=target_commit,
+                    )
+                )
+
+    if not keep_extra:
+        listed = {entry["package_id"] for entry in manifest}
+        plan["remove"] = sorted(
+            (name for name in installed if name not in listed), key=str.lower
+        )
+
+    return plan
+
+
+def is_sync_plan_empty(plan):
+    """Check whether a sync plan has nothing to change."""
+    return not any(
+        plan[action] for action in ("install", "reinstall", "update", "remove")
+    )
+
+
+def _update_pinned_package(entry, install_slots):
+    """Fast-forward an installed package to the commit its manifest entry pins."""
+    package = entry["package"]
+    package_path = package["path"]
+
+    target_commit = entry["target_commit"]
+    if not target_commit:
+        return False, f"Commit {entry['commit']} not found in {entry['url']}"
+
+    head_commit = entry["current_commit"]
+    if head_commit and not is_ancestor_commit(package_path, head_commit, target_commit):
+        return (
+            False,
+            f"Commit {entry['commit']} is not ahead of the installed commit "
+            f"{head_commit[:8]}",
+        )
+
+    update_info = {"base_commit": head_commit, "target_commit": target_commit}
+    with install_slots:
+        if not upgrade_single_package(package, update_info):
+            return False, f"Failed to update '{entry['package_id']}'"
+
+    return True, f"Package '{entry['package_id']}' updated to {target_commit[:8]}"
+
+
+def _run_sync_action(action, item, use_cache, install_slots):
+    """Apply one change of a sync plan, buffering its output."""
+    name = item if action == "remove" else item["package_id"]
+
+    with capture_thread_output():
+        debug_print(f"Sync: {action} {name}")
+        with trace_context(package=name), span(action, "package"):
+            try:
+                if action == "remove":
+                    with install_slots:
+                        success, message = uninstall_package(name)
+                elif action == "update":
+                    success, message = _update_pinned_package(item, install_slots)
+                else:
+                    success, message, _ = install_package_from_git(
+                        item["url"],
+                        use_cache=use_cache,
+                        install_slots=install_slots,
+                        commit=item["commit"],
+                    )
+            except Exception as e:
+                success, message = False, f"Unexpected error during sync: {e}"
+
+    return action, name, success, message
+
+
+def execute_sync_plan(
+    plan,
+    jobs=DEFAULT_INSTALL_JOBS,
+    workers=DEFAULT_INSTALL_WORKERS,
+    use_cache=True,
+):
+    """
+    Apply a sync plan.
+
+    Every change runs concurrently up to ``jobs`` at a time, while at most
+    ``workers`` packages run install or uninstall commands at once.
+
+    :param plan: Plan from build_sync_plan
+    :param jobs: Maximum number of packages to process concurrently
+    :param workers: Maximum number of packages running commands at once
+    :param use_cache: Whether to clone through the local git cache
+    :return: Tuple of (success: bool, message: str, results: dict)
+    """
+    results = {"successful": [], "failed": [], "messages": {}}
+
+    try:
+        install_slots = threading.BoundedSemaphore(max(1, workers))
+        tasks = [
+            (action, item)
+            for action in ("remove", "update", "reinstall", "install")
+            for item in plan[action]
+        ]
+
+        if tasks:
+            max_workers = max(1, min(jobs, len(tasks)))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(
+                        _run_sync_action, action, item, use_cache, install_slots
+                    )
+                    for action, item in tasks
+                ]
+
+            # Report in plan order, whatever order the changes finished in
+            for future in futures:
+                action, name, success, message = future.result()
+                results["successful" if success else "failed"].append(name)
+                results["messages"][name] = message
+
+        success = not results["failed"]
+        if not tasks:
+            message = "All packages are in sync"
+        elif success:
+            message = f"Synced {len(results['successful'])} package(s)"
+        else:
+            message = f"Failed to sync {len(results['failed'])} package(s)"
+
+        return success, message, results
+
+    except Exception as e:
+        error_message = handle_exception_with_debug(
+            f"Unexpected error during sync: {e}", e
+        )
+        return False, error_message, results
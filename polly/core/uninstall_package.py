@@ -1,15 +1,21 @@
 import os
 import json
-from ..utils import (
-    get_package_by_name,
-    run_silent_command,
-    safe_remove_directory,
-    load_package_metadata,
-)
+from ..utils.package import resolve_package, load_package_metadata, forget_package
+from ..utils.command import run_command_steps
+from ..utils.filesystem import safe_remove_directory, invalidate_size_cache
+from ..utils.profiling import phase
 
 
-def run_uninstall_commands(package_dir, metadata):
-    """Run any uninstall commands specified in the metadata."""
+@phase("install commands")
+def run_uninstall_commands(package_dir, metadata, package_name=None):
+    """
+    Run any uninstall commands specified in the metadata.
+
+    :param package_dir: Directory to run the uninstall commands in
+    :param metadata: Package metadata
+    :param package_name: Package the commands' output is logged under (optional)
+    :return: bool indicating success
+    """
     if "uninstall" not in metadata:
         return True
 
@@ -17,12 +23,19 @@ def run_uninstall_commands(package_dir, metadata):
     if not isinstance(commands, list):
         return True
 
-    for i, command in enumerate(commands):
-        description = f"Running uninstall command {i + 1}/{len(commands)}"
-        if not run_silent_command(command, description, cwd=package_dir):
-            return False
-
-    return True
+    descriptions = [
+        f"Running uninstall command {i + 1}/{len(commands)}"
+        for i in range(len(commands))
+    ]
+    success, _ = run_command_steps(
+        commands,
+        descriptions,
+        cwd=package_dir,
+        package=package_name,
+        operation="uninstall",
+        persistent_shell=metadata.get("persistentShell", False),
+    )
+    return success
 
 
 def uninstall_package(package_name):
@@ -34,7 +47,7 @@ def uninstall_package(package_name):
     """
     try:
         # Get package information
-        package = get_package_by_name(package_name)
+        package = resolve_package(package_name, fields=("metadata",))
         if not package:
             return False, f"Package '{package_name}' is not installed"
 
@@ -45,7 +58,7 @@ def uninstall_package(package_name):
             return False, f"Package metadata not found for '{package_name}'"
 
         # Run uninstall commands if specified
-        if not run_uninstall_commands(package_path, metadata):
+        if not run_uninstall_commands(package_path, metadata, package_name):
             # Continue with removal anyway, but note the failure
             pass
 
@@ -53,6 +66,9 @@ def uninstall_package(package_name):
         if not safe_remove_directory(package_path):
             return False, "Failed to remove package files. Check permissions."
 
+        invalidate_size_cache(package_path)
+        forget_package(package_name)
+
         return True, f"Package '{package_name}' uninstalled successfully"
 
     except Exception as e:
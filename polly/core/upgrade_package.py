@@ -1,54 +1,100 @@
 import os
-from ..utils import (
+from concurrent.futures import ThreadPoolExecutor
+from ..utils.package import (
     get_installed_packages,
-    check_for_updates,
-    upgrade_git_package,
-    run_silent_command,
+    record_package,
+    load_package_metadata,
+    PACKAGES_DIR,
+)
+from ..utils.git import check_for_updates, upgrade_git_package
+from ..utils.command import run_command_steps
+from ..utils.filesystem import (
     get_directory_size,
     get_available_space,
-    PACKAGES_DIR,
+    invalidate_size_cache,
 )
+from ..utils.output import capture_thread_output
+from ..utils.trace import trace_context, span
 from ..utils.debug import (
     format_error_with_debug,
     handle_exception_with_debug,
     debug_print,
 )
 
+# Update checks mostly wait on the network, so several can run at once
+DEFAULT_CHECK_JOBS = 8
 
-def check_package_updates():
-    """
-    Check all installed packages for available updates.
+# Install commands may share global state (package managers, locks), so
+# upgrades run one at a time unless more workers are requested
+DEFAULT_UPGRADE_WORKERS = 1
 
-    :return: Tuple of (upgradeable_packages: list, error_packages: list)
-    """
-    packages = get_installed_packages()
-    upgradeable_packages = []
-    error_packages = []
 
-    debug_print(f"Checking updates for {len(packages)} packages")
+def check_single_package(package):
+    """
+    Check a single package for available updates.
 
-    for package in packages:
-        package_name = package["name"]
-        package_path = package["path"]
+    :param package: Package information dictionary
+    :return: Tuple of (update_info, error) from check_for_updates.
+             update_info is None if the check failed, error then says why
+    """
+    package_name = package["name"]
+    package_path = package["path"]
 
-        debug_print(f"Checking updates for package: {package_name} at {package_path}")
+    debug_print(f"Checking updates for package: {package_name} at {package_path}")
 
+    with trace_context(package=package_name), span("update check", "package"):
         try:
-            update_info = check_for_updates(package_path)
+            update_info, error = check_for_updates(package_path)
             if update_info is None:
-                debug_print(
-                    f"Failed to check updates for {package_name} - check_for_updates returned None"
-                )
-                error_packages.append(package_name)
+                debug_print(f"Failed to check updates for {package_name}: {error}")
             elif update_info is not False:  # Has updates
                 debug_print(f"Updates available for {package_name}: {update_info}")
-                package["update_info"] = update_info
-                upgradeable_packages.append(package)
             else:
                 debug_print(f"No updates available for {package_name}")
+            return update_info, error
         except Exception as e:
             debug_print(f"Exception while checking updates for {package_name}: {e}")
-            error_packages.append(package_name)
+            return None, str(e)
+
+
+def check_package_updates(jobs=DEFAULT_CHECK_JOBS, on_checked=None):
+    """
+    Check all installed packages for available updates.
+
+    Checks are mostly spent waiting on the network, so up to ``jobs`` packages
+    are checked at the same time. Results keep the installed package order.
+
+    :param jobs: Maximum number of packages to check concurrently
+    :param on_checked: Function called with each package, its update_info and
+                       error from check_single_package as soon as its check
+                       finishes, from the checking thread (optional)
+    :return: Tuple of (upgradeable_packages: list, error_packages: list)
+    """
+    packages = get_installed_packages()
+    upgradeable_packages = []
+    error_packages = []
+
+    debug_print(f"Checking updates for {len(packages)} packages with {jobs} job(s)")
+
+    if not packages:
+        return upgradeable_packages, error_packages
+
+    def check(package):
+        update_info, error = check_single_package(package)
+        if on_checked:
+            on_checked(package, update_info, error)
+        return update_info
+
+    workers = max(1, min(jobs, len(packages)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(check, packages))
+
+    for package, update_info in zip(packages, results):
+        if update_info is None:
+            error_packages.append(package["name"])
+        elif update_info is not False:  # Has updates
+            package["update_info"] = update_info
+            upgradeable_packages.append(package)
 
     return upgradeable_packages, error_packages
 
@@ -61,7 +107,12 @@ def get_upgrade_summary(upgradeable_packages):
     :return: Dictionary with summary information
     """
     total_size = sum(
-        get_directory_size(package["path"]) for package in upgradeable_packages
+        (
+            package["size"]
+            if package.get("size") is not None
+            else get_directory_size(package["path"])
+        )
+        for package in upgradeable_packages
     )
     available_space = get_available_space(PACKAGES_DIR)
 
@@ -73,6 +124,111 @@ def get_upgrade_summary(upgradeable_packages):
     }
 
 
+class UpgradePlan:
+    """
+    A resolved set of package upgrades.
+
+    The plan keeps every upgradeable package together with the commit it was
+    checked on and the already fetched commit it will be upgraded to, so it
+    can be displayed and then executed without contacting the remotes again.
+    """
+
+    def __init__(self, packages, errors=None):
+        """
+        :param packages: Package dictionaries, each with an update_info entry
+        :param errors: Names of packages whose updates couldn't be checked
+        """
+        self.packages = packages
+        self.errors = errors or []
+        self._summary = None
+
+    @property
+    def names(self):
+        """Names of the packages in the plan."""
+        return [package["name"] for package in self.packages]
+
+    def is_empty(self):
+        """Check if the plan has nothing to upgrade."""
+        return not self.packages
+
+    def summary(self):
+        """Get summary information about the upgrade, see get_upgrade_summary."""
+        if self._summary is None:
+            self._summary = get_upgrade_summary(self.packages)
+        return self._summary
+
+    def filter(self, package_names):
+        """
+        Get a plan restricted to the given packages.
+
+        :param package_names: Names of the packages to keep, or None for all
+        :return: UpgradePlan
+        """
+        if not package_names:
+            return self
+        return UpgradePlan(
+            [pkg for pkg in self.packages if pkg["name"] in package_names],
+            self.errors,
+        )
+
+    def to_dict(self):
+        """Serialize the plan so it can be stored and applied later."""
+        return {
+            "packages": [
+                {
+                    "name": package["name"],
+                    "path": package["path"],
+                    "size": package.get("size"),
+                    "update_info": package["update_info"],
+                }
+                for package in self.packages
+            ],
+            "errors": self.errors,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Load a plan stored with to_dict.
+
+        Metadata is read again from disk, so the commands that run are the
+        ones of the installed package.
+        """
+        packages = []
+        errors = list(data.get("errors", []))
+
+        for entry in data.get("packages", []):
+            metadata = load_package_metadata(entry["path"])
+            if metadata is None:
+                errors.append(entry["name"])
+                continue
+            packages.append(
+                {
+                    "name": entry["name"],
+                    "path": entry["path"],
+                    "size": entry.get("size"),
+                    "metadata": metadata,
+                    "update_info": entry["update_info"],
+                }
+            )
+
+        return cls(packages, errors)
+
+
+def build_upgrade_plan(package_names=None, jobs=DEFAULT_CHECK_JOBS, on_checked=None):
+    """
+    Check installed packages for updates and build an upgrade plan.
+
+    :param package_names: List of specific package names to plan, or None for all
+    :param jobs: Maximum number of packages to check for updates concurrently
+    :param on_checked: Function called as each check finishes, see
+                       check_package_updates (optional)
+    :return: UpgradePlan
+    """
+    upgradeable_packages, error_packages = check_package_updates(jobs, on_checked)
+    return UpgradePlan(upgradeable_packages, error_packages).filter(package_names)
+
+
 def upgrade_single_package(package, update_info):
     """
     Upgrade a single package.
@@ -90,41 +246,60 @@ def upgrade_single_package(package, update_info):
     debug_print(f"Update info: {update_info}")
 
     try:
-        # Pull latest changes
+        # Move to the planned commit, or pull latest changes without a plan
         debug_print(f"Pulling latest changes for {package_name}")
-        if not upgrade_git_package(package_path):
+        if not upgrade_git_package(
+            package_path,
+            target_commit=update_info.get("target_commit"),
+            base_commit=update_info.get("base_commit"),
+        ):
             debug_print(f"Git upgrade failed for {package_name}")
             return False
 
+        # The tree changed, cached directory sizes are no longer valid
+        invalidate_size_cache(package_path)
+
         # Run uninstall commands if specified
         if "uninstall" in metadata:
             debug_print(
                 f"Running uninstall commands for {package_name}: {metadata['uninstall']}"
             )
-            for command in metadata["uninstall"]:
-                if not run_silent_command(
-                    command,
-                    f"Running uninstall command for {package_name}",
-                    cwd=package_path,
-                ):
-                    debug_print(
-                        f"Uninstall command failed for {package_name}: {command}"
-                    )
-                    return False
+            commands = metadata["uninstall"]
+            success, failed = run_command_steps(
+                commands,
+                [f"Running uninstall command for {package_name}"] * len(commands),
+                cwd=package_path,
+                package=package_name,
+                operation="upgrade",
+                persistent_shell=metadata.get("persistentShell", False),
+            )
+            if not success:
+                debug_print(
+                    f"Uninstall command failed for {package_name}: {commands[failed]}"
+                )
+                return False
 
         # Run install commands
         if "install" in metadata:
             debug_print(
                 f"Running install commands for {package_name}: {metadata['install']}"
             )
-            for command in metadata["install"]:
-                if not run_silent_command(
-                    command,
-                    f"Running install command for {package_name}",
-                    cwd=package_path,
-                ):
-                    debug_print(f"Install command failed for {package_name}: {command}")
-                    return False
+            commands = metadata["install"]
+            success, failed = run_command_steps(
+                commands,
+                [f"Running install command for {package_name}"] * len(commands),
+                cwd=package_path,
+                package=package_name,
+                operation="upgrade",
+                persistent_shell=metadata.get("persistentShell", False),
+            )
+            if not success:
+                debug_print(
+                    f"Install command failed for {package_name}: {commands[failed]}"
+                )
+                return False
+
+        record_package(package_name)
 
         debug_print(f"Successfully upgraded {package_name}")
         return True
@@ -134,18 +309,136 @@ def upgrade_single_package(package, update_info):
         return False
 
 
-def upgrade_packages(package_names=None):
+def _try_upgrade_package(package):
+    """Upgrade a single package, treating exceptions as a failed upgrade."""
+    package_name = package["name"]
+    debug_print(f"Upgrading package: {package_name}")
+
+    with trace_context(package=package_name), span("upgrade", "package"):
+        try:
+            if upgrade_single_package(package, package["update_info"]):
+                debug_print(f"Successfully upgraded: {package_name}")
+                return True
+            debug_print(f"Failed to upgrade: {package_name}")
+        except Exception as e:
+            debug_print(f"Exception while upgrading {package_name}: {e}")
+    return False
+
+
+def group_upgrade_packages(packages):
+    """
+    Split packages into groups that must be upgraded one after another.
+
+    Packages declaring the same ``serialGroup`` in their metadata share
+    global state in their install commands and end up in one group, every
+    other package is a group of its own.
+
+    :param packages: Package dictionaries to upgrade
+    :return: List of package lists, in the original package order
+    """
+    groups = {}
+    for package in packages:
+        serial_group = (package.get("metadata") or {}).get("serialGroup")
+        key = f"group:{serial_group}" if serial_group else f"package:{package['name']}"
+        groups.setdefault(key, []).append(package)
+    return list(groups.values())
+
+
+def _upgrade_package_group(group, on_upgraded=None):
+    """Upgrade a group of packages in order, buffering each package's output."""
+    results = {}
+    for package in group:
+        with capture_thread_output():
+            results[package["name"]] = _try_upgrade_package(package)
+        if on_upgraded:
+            on_upgraded(package, results[package["name"]])
+    return results
+
+
+def _run_upgrades(packages, workers, on_upgraded=None):
+    """
+    Upgrade packages, using up to ``workers`` worker slots.
+
+    A failing package never stops its siblings.
+
+    :param on_upgraded: Function called with each package and whether it was
+                        upgraded as soon as it finishes (optional)
+    :return: Dictionary of package name to success
+    """
+    if workers <= 1 or len(packages) <= 1:
+        results = {}
+        for package in packages:
+            results[package["name"]] = _try_upgrade_package(package)
+            if on_upgraded:
+                on_upgraded(package, results[package["name"]])
+        return results
+
+    groups = group_upgrade_packages(packages)
+    results = {}
+
+    debug_print(f"Upgrading {len(groups)} group(s) with {workers} worker(s)")
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(groups))) as executor:
+        for group_results in executor.map(
+            lambda group: _upgrade_package_group(group, on_upgraded), groups
+        ):
+            results.update(group_results)
+
+    return results
+
+
+def upgrade_packages(
+    package_names=None,
+    jobs=DEFAULT_CHECK_JOBS,
+    plan=None,
+    workers=DEFAULT_UPGRADE_WORKERS,
+):
     """
     Upgrade specified packages or all upgradeable packages.
 
     :param package_names: List of specific package names to upgrade, or None for all
+    :param jobs: Maximum number of packages to check for updates concurrently
+    :param plan: UpgradePlan to execute. Without it, a plan is built first.
+    :param workers: Maximum number of packages to upgrade at the same time
     :return: Tuple of (success: bool, message: str, results: dict)
     """
     try:
         debug_print(f"Starting package upgrade process. Package names: {package_names}")
 
         # Get packages that need upgrading
-        upgradeable_packages, error_packages = check_package_updates()
+        if plan is None:
+            plan = build_upgrade_plan(jobs=jobs)
+
+        return execute_upgrade_plan(plan.filter(package_names), workers)
+
+    except Exception as e:
+        error_message = handle_exception_with_debug(
+            f"Unexpected error during upgrade: {e}", e
+        )
+        debug_print(f"Exception in upgrade_packages: {e}")
+        return (
+            False,
+            error_message,
+            {"upgradeable": [], "errors": [], "successful": [], "failed": []},
+        )
+
+
+def execute_upgrade_plan(plan, workers=DEFAULT_UPGRADE_WORKERS, on_upgraded=None):
+    """
+    Upgrade the packages of a plan to the commits it was built against.
+
+    With more than one worker, packages are upgraded in parallel and each
+    package's output is printed in one piece once it finishes.
+
+    :param plan: UpgradePlan to execute
+    :param workers: Maximum number of packages to upgrade at the same time
+    :param on_upgraded: Function called with each package and whether it was
+                        upgraded as soon as it finishes (optional)
+    :return: Tuple of (success: bool, message: str, results: dict)
+    """
+    try:
+        upgradeable_packages = plan.packages
+        error_packages = plan.errors
 
         debug_print(
             f"Found {len(upgradeable_packages)} upgradeable packages, {len(error_packages)} errors"
@@ -163,37 +456,20 @@ def upgrade_packages(package_names=None):
                 },
             )
 
-        # Filter by specific package names if provided
-        if package_names:
-            debug_print(f"Filtering packages by names: {package_names}")
-            original_count = len(upgradeable_packages)
-            upgradeable_packages = [
-                pkg for pkg in upgradeable_packages if pkg["name"] in package_names
-            ]
-            debug_print(
-                f"Filtered from {original_count} to {len(upgradeable_packages)} packages"
-            )
-
         # Perform upgrades
-        successful_upgrades = []
-        failed_upgrades = []
-
         debug_print(f"Starting upgrade of {len(upgradeable_packages)} packages")
 
-        for package in upgradeable_packages:
-            package_name = package["name"]
-            debug_print(f"Upgrading package: {package_name}")
-
-            try:
-                if upgrade_single_package(package, package["update_info"]):
-                    successful_upgrades.append(package_name)
-                    debug_print(f"Successfully upgraded: {package_name}")
-                else:
-                    failed_upgrades.append(package_name)
-                    debug_print(f"Failed to upgrade: {package_name}")
-            except Exception as e:
-                failed_upgrades.append(package_name)
-                debug_print(f"Exception while upgrading {package_name}: {e}")
+        upgrade_results = _run_upgrades(upgradeable_packages, workers, on_upgraded)
+
+        # Report in plan order, whatever order the upgrades finished in
+        successful_upgrades = [
+            pkg["name"] for pkg in upgradeable_packages if upgrade_results[pkg["name"]]
+        ]
+        failed_upgrades = [
+            pkg["name"]
+            for pkg in upgradeable_packages
+            if not upgrade_results[pkg["name"]]
+        ]
 
         # Determine overall success
         success = len(failed_upgrades) == 0
@@ -227,7 +503,7 @@ def upgrade_packages(package_names=None):
         error_message = handle_exception_with_debug(
             f"Unexpected error during upgrade: {e}", e
         )
-        debug_print(f"Exception in upgrade_packages: {e}")
+        debug_print(f"Exception in execute_upgrade_plan: {e}")
         return (
             False,
             error_message,
@@ -1,7 +1,33 @@
-from .colors import *
-from .filesystem import *
-from .command import *
-from .git import *
-from .package import *
-from .simple import *
-from .debug import *
+import importlib
+
+# Modules whose public names are available from polly.utils. Polly's own code
+# imports from the modules directly, a name used from the package is looked up
+# in each module in turn, importing only the modules it has to.
+_MODULES = (
+    "colors",
+    "filesystem",
+    "command",
+    "command_log",
+    "git_refs",
+    "git",
+    "git_cache",
+    "index",
+    "package",
+    "simple",
+    "json_mode",
+    "debug",
+    "output",
+    "profiling",
+    "trace",
+)
+
+
+def __getattr__(name):
+    if not name.startswith("_"):
+        for module_name in _MODULES:
+            module = importlib.import_module(f"{__name__}.{module_name}")
+            if hasattr(module, name):
+                value = getattr(module, name)
+                globals()[name] = value
+                return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
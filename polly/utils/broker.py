@@ -0,0 +1,427 @@
+"""
+Privileged command broker for Polly CLI.
+This module runs the commands Polly needs root for through one elevated
+helper per Polly run, instead of starting sudo and a shell for every command.
+
+The helper runs serve() under sudo and reads JSON requests, one per line,
+from stdin:
+
+    {"id": 1, "argv": ["git", "fetch"], "cwd": "/opt/pollypackages/foo"}
+    {"id": 2, "command": "make install", "cwd": "...", "merge_stderr": true}
+
+Shell commands are split and run directly unless they use shell features.
+Requests run concurrently, their output and exit codes come back as JSON
+lines on stdout:
+
+    {"id": 1, "stream": "stdout", "data": "..."}
+    {"id": 1, "exit_code": 0}
+
+Commands get no standard input, since the broker's stdin carries requests,
+so privileged steps must be non-interactive. Polly runs commands the same way
+when it doesn't need the broker.
+
+The broker is started as ``sudo <python> -I -S -c ...``, so sudo must allow
+that interpreter. It refuses to start unless root owns Polly's code.
+
+Every request is written to an audit log, so there's one place listing
+everything Polly ran as root.
+"""
+
+import os
+import re
+import sys
+import json
+import stat
+import time
+import queue
+import shlex
+import atexit
+import itertools
+import threading
+import subprocess
+from polly.config import get_config_value
+from .command_log import iter_stream_chunks
+
+# Audit log of every command the broker runs, written by the broker as root
+AUDIT_LOG = get_config_value("audit_log", "/var/log/polly/audit.log")
+
+# Exit code reported when a command can't be started, like a shell would
+COMMAND_NOT_FOUND = 127
+
+# Characters that need a shell to mean what they mean in a command
+SHELL_CHARACTERS = re.compile(r"[|&;<>()$`\\*?\[\]{}~#!\n]")
+
+# Shell builtins, which only exist in a shell
+SHELL_BUILTINS = {
+    ".",
+    ":",
+    "alias",
+    "cd",
+    "eval",
+    "exec",
+    "exit",
+    "export",
+    "read",
+    "set",
+    "shift",
+    "source",
+    "trap",
+    "ulimit",
+    "umask",
+    "unset",
+}
+
+# Directory Polly is imported from. The broker imports Polly from there as
+# root, so it must only be writable by root.
+PROJECT_ROOT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+# Isolated (-I) and without site (-S), the broker's interpreter ignores
+# PYTHON* variables, the current directory and site-packages .pth files, and
+# only imports the standard library and Polly from PROJECT_ROOT
+BROKER_CODE = (
+    f"import sys; sys.path.insert(0, {PROJECT_ROOT!r}); "
+    "from polly.utils.broker import serve; serve()"
+)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def split_command(command):
+    """
+    Split a shell command into arguments if it runs the same without a shell.
+
+    :param command: Shell command
+    :return: List of arguments, or None if the command needs a shell
+    """
+    if SHELL_CHARACTERS.search(command):
+        return None
+
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None
+
+    # Variable assignments and builtins only work in a shell
+    if not argv or "=" in argv[0] or argv[0] in SHELL_BUILTINS:
+        return None
+    return argv
+
+
+def _encode(data):
+    """Encode output bytes losslessly as a JSON string."""
+    return data.decode("utf-8", errors="surrogateescape")
+
+
+def _decode(text):
+    """Decode output from its JSON string."""
+    return text.encode("utf-8", errors="surrogateescape")
+
+
+def _check_root_owned(path):
+    """
+    Check that only root can change a file or directory.
+
+    :return: None if root owns it and nobody else can write it, otherwise why
+    """
+    info = os.lstat(path)
+    if info.st_uid != 0:
+        return f"{path} isn't owned by root"
+    if info.st_mode & stat.S_IWOTH or (info.st_mode & stat.S_IWGRP and info.st_gid):
+        return f"{path} is writable by users other than root"
+    return None
+
+
+def check_broker_code():
+    """
+    Check that the code the broker runs as root can only be changed by root.
+
+    Covers the interpreter, PROJECT_ROOT and its parents, and everything in
+    the polly package, since any of them could otherwise be replaced by the
+    user to run their own code as root.
+
+    :raises: OSError naming the first path that isn't safe
+    """
+    paths = [os.path.realpath(sys.executable)]
+    directory = PROJECT_ROOT
+    while True:
+        paths.append(directory)
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+
+    for root, directories, files in os.walk(os.path.join(PROJECT_ROOT, "polly")):
+        paths.append(root)
+        paths.extend(os.path.join(root, name) for name in files)
+
+    for path in paths:
+        problem = _check_root_owned(path)
+        if problem:
+            raise OSError(
+                f"Refusing to run Polly's code as root: {problem}. "
+                "Install Polly system-wide, owned by root, to run privileged commands"
+            )
+
+
+# Broker side
+
+
+def write_audit_entry(entry):
+    """Append an entry to the audit log, warning on stderr if it can't be."""
+    entry = dict(entry, time=time.strftime("%Y-%m-%dT%H:%M:%S%z"))
+    try:
+        os.makedirs(os.path.dirname(AUDIT_LOG), exist_ok=True)
+        with open(AUDIT_LOG, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print(f"polly broker: can't write audit log {AUDIT_LOG}: {e}", file=sys.stderr)
+
+
+def _pump_output(stream, name, request_id, send):
+    """Send a command's output as it arrives."""
+    for chunk in iter_stream_chunks(stream):
+        send({"id": request_id, "stream": name, "data": _encode(chunk)})
+
+
+def handle_request(request, send):
+    """
+    Run one request and send its output and exit code.
+
+    :param request: Request dictionary with id, argv or command, cwd and
+                    merge_stderr
+    :param send: Function sending a response dictionary to the client
+    """
+    request_id = request.get("id")
+    cwd = request.get("cwd")
+    argv = request.get("argv")
+    shell = False
+    if argv is None:
+        argv = split_command(request.get("command", ""))
+        if argv is None:
+            argv = ["/bin/sh", "-c", request.get("command", "")]
+            shell = True
+
+    audit = {
+        "id": request_id,
+        "client_pid": os.getppid(),
+        "user": os.environ.get("SUDO_USER") or str(os.getuid()),
+        "cwd": cwd,
+        "argv": argv,
+        "shell": shell,
+    }
+    write_audit_entry(dict(audit, event="start"))
+    start = time.perf_counter()
+
+    stderr = subprocess.STDOUT if request.get("merge_stderr") else subprocess.PIPE
+    try:
+        process = subprocess.Popen(
+            argv,
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+        )
+    except OSError as e:
+        send({"id": request_id, "stream": "stderr", "data": f"{argv[0]}: {e}\n"})
+        exit_code = COMMAND_NOT_FOUND
+    else:
+        with process:
+            stderr_pump = None
+            if process.stderr:
+                stderr_pump = threading.Thread(
+                    target=_pump_output,
+                    args=(process.stderr, "stderr", request_id, send),
+                )
+                stderr_pump.start()
+            _pump_output(process.stdout, "stdout", request_id, send)
+            if stderr_pump:
+                stderr_pump.join()
+        exit_code = process.returncode
+
+    write_audit_entry(
+        dict(
+            audit,
+            event="exit",
+            exit_code=exit_code,
+            duration=round(time.perf_counter() - start, 3),
+        )
+    )
+    send({"id": request_id, "exit_code": exit_code})
+
+
+def serve(requests=None, responses=None):
+    """
+    Handle requests until the client closes the request stream.
+
+    :param requests: Binary stream of JSON request lines (default: stdin)
+    :param responses: Binary stream for JSON response lines (default: stdout)
+    """
+    requests = requests or sys.stdin.buffer
+    responses = responses or sys.stdout.buffer
+    send_lock = threading.Lock()
+
+    def send(response):
+        line = json.dumps(response).encode() + b"\n"
+        with send_lock:
+            responses.write(line)
+            responses.flush()
+
+    workers = []
+    for line in requests:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            print(f"polly broker: ignoring invalid request {line!r}", file=sys.stderr)
+            continue
+
+        worker = threading.Thread(target=handle_request, args=(request, send))
+        worker.start()
+        workers.append(worker)
+        workers = [worker for worker in workers if worker.is_alive()]
+
+    for worker in workers:
+        worker.join()
+
+
+# Client side
+
+
+class BrokerProcess:
+    """A command running in the broker, read like a subprocess.Popen."""
+
+    def __init__(self, responses):
+        self._responses = responses
+        self.returncode = None
+
+    def iter_output(self):
+        """
+        Yield the command's output until it exits.
+
+        :return: Iterator of (stream name, bytes) tuples
+        """
+        while self.returncode is None:
+            response = self._responses.get()
+            if "exit_code" in response:
+                self.returncode = response["exit_code"]
+            else:
+                yield response["stream"], _decode(response["data"])
+
+    def communicate(self):
+        """
+        Wait for the command and collect its output.
+
+        :return: Tuple of (stdout, stderr) bytes
+        """
+        output = {"stdout": bytearray(), "stderr": bytearray()}
+        for stream, data in self.iter_output():
+            output[stream] += data
+        return bytes(output["stdout"]), bytes(output["stderr"])
+
+
+class Broker:
+    """Client of a broker process, shared by all threads of a Polly run."""
+
+    def __init__(self, sudo_prefix):
+        """
+        Start the broker.
+
+        :param sudo_prefix: Privilege escalation command the broker runs
+                            under, empty to run it as the current user
+        :raises: OSError if the broker's code isn't root-owned or it can't start
+        """
+        if sudo_prefix:
+            check_broker_code()
+
+        self._process = subprocess.Popen(
+            sudo_prefix + [sys.executable, "-I", "-S", "-c", BROKER_CODE],
+            cwd="/",
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        reader = threading.Thread(target=self._read_responses, daemon=True)
+        reader.start()
+
+    def _read_responses(self):
+        """Route responses to the commands waiting for them."""
+        for line in self._process.stdout:
+            response = json.loads(line)
+            with self._lock:
+                responses = self._pending.get(response["id"])
+                if "exit_code" in response:
+                    self._pending.pop(response["id"], None)
+            if responses is not None:
+                responses.put(response)
+
+        # The broker is gone, fail whatever was still running
+        with self._lock:
+            pending, self._pending = self._pending, None
+        for request_id, responses in pending.items():
+            responses.put(
+                {"id": request_id, "stream": "stderr", "data": "Broker exited\n"}
+            )
+            responses.put({"id": request_id, "exit_code": -1})
+
+    def run(self, argv=None, command=None, cwd=None, merge_stderr=False):
+        """
+        Run a command as root.
+
+        :param argv: List of arguments, run without a shell
+        :param command: Shell command, used instead of argv
+        :param cwd: Working directory (default: the current directory)
+        :param merge_stderr: Whether stderr is sent as stdout
+        :return: BrokerProcess
+        :raises: OSError if the broker exited
+        """
+        request = {
+            "cwd": os.path.abspath(cwd or os.getcwd()),
+            "merge_stderr": merge_stderr,
+        }
+        if argv is not None:
+            request["argv"] = list(argv)
+        else:
+            request["command"] = command
+
+        responses = queue.Queue()
+        with self._lock:
+            if self._pending is None:
+                raise OSError("The privileged broker exited")
+            request["id"] = next(self._ids)
+            self._pending[request["id"]] = responses
+
+        with self._write_lock:
+            self._process.stdin.write(json.dumps(request).encode() + b"\n")
+            self._process.stdin.flush()
+
+        return BrokerProcess(responses)
+
+    def close(self):
+        """Let the broker finish its commands and exit."""
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        self._process.wait()
+
+
+def get_broker(sudo_prefix):
+    """
+    Get the broker of this Polly run, starting it on first use.
+
+    :param sudo_prefix: Privilege escalation command the broker runs under
+    :return: Broker
+    """
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = Broker(sudo_prefix)
+            atexit.register(_broker.close)
+        return _broker
+
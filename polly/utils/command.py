@@ -1,33 +1,143 @@
+import os
+import shlex
 import subprocess
+from polly.config import get_config_value
 from .colors import format_message
 from .debug import is_debug_mode, format_error_with_debug, debug_print
+from .trace import span
+from .broker import get_broker, split_command
+from .command_log import (
+    get_command_log_path,
+    iter_stream_chunks,
+    stream_command_output,
+    append_command_log,
+    OUTPUT_TAIL_SIZE,
+)
 
+# Command that privileged commands run through, an empty value runs them
+# directly (e.g. when Polly already runs as root, or in unprivileged tests)
+SUDO_COMMAND = get_config_value("sudo", "sudo")
 
-def run_silent_command(command, description, cwd=None):
-    """Run a command silently and return success status."""
+
+def get_sudo_prefix():
+    """
+    Get the privilege escalation command as a list of arguments.
+
+    The list is empty when Polly already runs as root.
+    """
+    if os.geteuid() == 0:
+        return []
+    return shlex.split(SUDO_COMMAND or "")
+
+
+def _stream_privileged_command(command, cwd, log_path, header, process_output=None):
+    """
+    Run a shell command as root and stream its output to its log.
+
+    The command gets no standard input, whether it runs through the broker or
+    directly, so privileged steps must be non-interactive.
+
+    :param command: Shell command to run
+    :param cwd: Working directory
+    :param log_path: Log file, or None to keep only the output's tail
+    :param header: Line written to the log before the output
+    :param process_output: Function filtering the output chunks (optional)
+    :return: Tuple of (return code, tail of the output, log file or None if
+             the output couldn't be logged)
+    """
+    sudo_prefix = get_sudo_prefix()
+
+    if sudo_prefix:
+        process = get_broker(sudo_prefix).run(
+            command=command, cwd=cwd, merge_stderr=True
+        )
+        chunks = (data for _, data in process.iter_output())
+        if process_output:
+            chunks = process_output(chunks)
+        output, logged = stream_command_output(chunks, log_path, header)
+    else:
+        argv = split_command(command)
+        process = subprocess.Popen(
+            argv or command,
+            shell=argv is None,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=cwd,
+        )
+        with process:
+            chunks = iter_stream_chunks(process.stdout)
+            if process_output:
+                chunks = process_output(chunks)
+            output, logged = stream_command_output(chunks, log_path, header)
+
+    if not logged:
+        return process.returncode, output, None
+
+    append_command_log(log_path, f"=== Exit code {process.returncode}")
+    return process.returncode, output, log_path
+
+
+def _print_command_failure(
+    description, command, returncode, output, log_path, summary=None
+):
+    """
+    Print why a command failed, with its output in debug mode.
+
+    :param summary: Error shown instead of "<description> failed" (optional)
+    """
+    details = f"Command: {command}\nReturn code: {returncode}"
+    if log_path:
+        details += f"\nLog: {log_path}"
+    details += f"\nOutput (last {OUTPUT_TAIL_SIZE // 1024} KB): {output}"
+    error_msg = format_error_with_debug(summary or f"{description} failed", details)
+    if log_path and not is_debug_mode():
+        error_msg += f" (see {log_path})"
+    print(format_message("error", error_msg))
+
+
+def run_silent_command(command, description, cwd=None, package=None, operation=None):
+    """
+    Run a command silently and return success status.
+
+    The command runs through the privileged broker unless Polly already runs
+    as root, and without a shell unless it needs one. It can't read standard
+    input, so it must not prompt. Its output is streamed to the package's log
+    for the operation, only its tail is kept to report a failure.
+
+    :param command: Shell command to run
+    :param description: Description shown while the command runs
+    :param cwd: Working directory (optional)
+    :param package: Package the command runs for, its output is logged when
+                    given along with the operation
+    :param operation: Operation the command is part of, e.g. install
+    :return: bool indicating success
+    """
     print(format_message("progress", f"{description}..."))
 
     debug_print(f"Running command: {command}")
     debug_print(f"Working directory: {cwd}")
 
+    log_path = None
+    if package and operation:
+        log_path = get_command_log_path(package, operation)
+        debug_print(f"Command log: {log_path}")
+
     try:
-        result = subprocess.run(
-            "sudo " + command, shell=True, capture_output=True, text=True, cwd=cwd
-        )
+        with span(description, "subprocess", command=command, cwd=cwd) as attributes:
+            returncode, output, log_path = _stream_privileged_command(
+                command, cwd, log_path, f"{description}: {command}"
+            )
+            attributes["exit_code"] = returncode
 
-        debug_print(f"Command return code: {result.returncode}")
-        debug_print(f"Command stdout: {result.stdout}")
-        debug_print(f"Command stderr: {result.stderr}")
+        debug_print(f"Command return code: {returncode}")
+        debug_print(f"Command output: {output}")
 
-        if result.returncode == 0:
+        if returncode == 0:
             print(format_message("success", f"{description} completed"))
             return True
         else:
-            error_msg = format_error_with_debug(
-                f"{description} failed",
-                f"Command: {command}\nReturn code: {result.returncode}\nStdout: {result.stdout}\nStderr: {result.stderr}",
-            )
-            print(format_message("error", error_msg))
+            _print_command_failure(description, command, returncode, output, log_path)
             return False
 
     except Exception as e:
@@ -38,15 +148,233 @@ def run_silent_command(command, description, cwd=None):
         return False
 
 
+def _build_session_script(commands, marker):
+    """
+    Build a script running commands in one shell, printing a marker line
+    before and after each one.
+
+    Commands are eval'd so each one is only parsed when its turn comes, a
+    syntax error fails that step rather than the script before it starts.
+    """
+    lines = []
+    for i, command in enumerate(commands):
+        lines += [
+            f"printf '\\n%s start %d\\n' {marker} {i}",
+            f"eval {shlex.quote(command)}",
+            "__polly_status=$?",
+            f"printf '\\n%s exit %d %d\\n' {marker} {i} \"$__polly_status\"",
+            '[ "$__polly_status" -eq 0 ] || exit "$__polly_status"',
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _split_session_markers(chunks, marker, on_marker):
+    """
+    Remove the marker lines of a shell session from its output.
+
+    Markers are printed on their own line after a newline, which is removed
+    along with them so the output is what the commands printed.
+
+    :param chunks: Iterable of output bytes
+    :param marker: Marker bytes starting every marker line
+    :param on_marker: Function called with the fields of each marker line,
+                      in order with the output around it. It can return a
+                      line to put in the output in place of the marker.
+    :return: Iterator of output bytes
+    """
+    pending = b""
+    newline_pending = False
+    line_open = False
+
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        output = bytearray()
+
+        for line in lines:
+            if line.startswith(marker):
+                # The newline before the marker was printed with it
+                newline_pending = False
+                replacement = on_marker(line[len(marker) :].decode().split())
+                if replacement:
+                    output += (b"\n" if line_open else b"") + replacement + b"\n"
+                    line_open = False
+            else:
+                if newline_pending:
+                    output += b"\n"
+                    line_open = False
+                output += line
+                newline_pending = True
+                line_open = line_open or bool(line)
+
+        # Only hold back a partial line while it could still be a marker
+        if pending and pending[: len(marker)] != marker[: len(pending)]:
+            if newline_pending:
+                output += b"\n"
+            output += pending
+            pending = b""
+            newline_pending = False
+            line_open = True
+
+        if output:
+            yield bytes(output)
+
+    tail = (b"\n" if newline_pending else b"") + pending
+    if tail:
+        yield tail
+
+
+def run_shell_session(commands, descriptions, cwd=None, package=None, operation=None):
+    """
+    Run commands one after another in a single shell.
+
+    The working directory, environment and shell state carry over from one
+    command to the next, e.g. after ``. venv/bin/activate``. Every command
+    is still reported on its own, and the session stops at the first one
+    that fails.
+
+    :param commands: Shell commands to run
+    :param descriptions: Description shown while each command runs
+    :param cwd: Working directory (optional)
+    :param package: Package the commands run for, their output is logged
+                    when given along with the operation
+    :param operation: Operation the commands are part of, e.g. install
+    :return: Tuple of (success: bool, index of the failing command or None)
+    """
+    if not commands:
+        return True, None
+
+    nonce = os.urandom(8).hex()
+    marker = f"polly-step-{nonce}"
+    script = _build_session_script(commands, marker)
+
+    debug_print(f"Running {len(commands)} commands in one shell")
+    debug_print(f"Working directory: {cwd}")
+
+    log_path = None
+    if package and operation:
+        log_path = get_command_log_path(package, operation)
+        debug_print(f"Command log: {log_path}")
+
+    # Index of the running command, and the exit code of every finished one
+    state = {"running": None, "exit_codes": {}}
+
+    def on_marker(fields):
+        event, index = fields[0], int(fields[1])
+        if event == "start":
+            state["running"] = index
+            print(format_message("progress", f"{descriptions[index]}..."))
+            return f"=== Step {index + 1}: {commands[index]}".encode()
+        elif event == "exit":
+            state["running"] = None
+            state["exit_codes"][index] = int(fields[2])
+            if int(fields[2]) == 0:
+                print(format_message("success", f"{descriptions[index]} completed"))
+        return None
+
+    try:
+        with span(
+            f"{operation or 'command'} shell session",
+            "subprocess",
+            command=" && ".join(commands),
+            cwd=cwd,
+            steps=len(commands),
+        ) as attributes:
+            returncode, output, log_path = _stream_privileged_command(
+                script,
+                cwd,
+                log_path,
+                f"Shell session of {len(commands)} commands",
+                lambda chunks: _split_session_markers(
+                    chunks, marker.encode(), on_marker
+                ),
+            )
+            attributes["exit_code"] = returncode
+
+        debug_print(f"Shell session return code: {returncode}")
+        debug_print(f"Shell session output: {output}")
+
+        exit_codes = state["exit_codes"]
+        for index in range(len(commands)):
+            if exit_codes.get(index) == 0:
+                continue
+
+            summary = None
+            if index not in exit_codes and state["running"] == index and not returncode:
+                # The shell ended successfully before the command's exit code
+                # was reported, so the command called exit itself. A syntax
+                # error ends the shell too, but with a failing code.
+                summary = (
+                    f"{descriptions[index]} exited the persistent shell with "
+                    f"code {returncode}, commands sharing a shell must not "
+                    "call exit"
+                )
+            step_code = exit_codes.get(index, returncode)
+            _print_command_failure(
+                descriptions[index],
+                commands[index],
+                step_code,
+                output,
+                log_path,
+                summary,
+            )
+            return False, index
+
+        return True, None
+
+    except Exception as e:
+        index = state["running"] or 0
+        error_msg = format_error_with_debug(
+            f"{descriptions[index]} failed",
+            f"Command: {commands[index]}\nWorking directory: {cwd}",
+            e,
+        )
+        print(format_message("error", error_msg))
+        return False, index
+
+
+def run_command_steps(
+    commands,
+    descriptions,
+    cwd=None,
+    package=None,
+    operation=None,
+    persistent_shell=False,
+):
+    """
+    Run commands in order, stopping at the first one that fails.
+
+    :param commands: Shell commands to run
+    :param descriptions: Description shown while each command runs
+    :param cwd: Working directory (optional)
+    :param package: Package the commands run for (optional)
+    :param operation: Operation the commands are part of, e.g. install
+    :param persistent_shell: Whether the commands share one shell, see
+                             run_shell_session
+    :return: Tuple of (success: bool, index of the failing command or None)
+    """
+    if persistent_shell:
+        return run_shell_session(commands, descriptions, cwd, package, operation)
+
+    for index, (command, description) in enumerate(zip(commands, descriptions)):
+        if not run_silent_command(
+            command, description, cwd=cwd, package=package, operation=operation
+        ):
+            return False, index
+    return True, None
+
+
 def run_command_with_output(command, description, cwd=None):
     """Run a command and return the result with output."""
     debug_print(f"Running command with output: {command}")
     debug_print(f"Working directory: {cwd}")
 
     try:
-        result = subprocess.run(
-            command, shell=True, capture_output=True, text=True, cwd=cwd
-        )
+        with span(description, "subprocess", command=command, cwd=cwd) as attributes:
+            result = subprocess.run(
+                command, shell=True, capture_output=True, text=True, cwd=cwd
+            )
+            attributes["exit_code"] = result.returncode
 
         debug_print(f"Command return code: {result.returncode}")
         debug_print(f"Command stdout: {result.stdout}")
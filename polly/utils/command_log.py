@@ -0,0 +1,166 @@
+"""
+Command log handling for Polly CLI.
+This module streams the output of install and uninstall commands to rotating
+per-package, per-operation log files, and keeps only the tail of the output
+in memory for error messages, however much a command prints.
+"""
+
+import os
+import re
+import sys
+import time
+from polly.config import get_config_value
+from .colors import format_message
+from .debug import debug_print
+from .filesystem import parse_size, is_writable_directory
+
+# Default directory holding one subdirectory of logs per package
+SYSTEM_LOG_DIR = "/var/log/polly"
+
+# A log is rotated once it grows past this size, keeping this many old logs
+DEFAULT_LOG_MAX_SIZE = "1M"
+LOG_BACKUP_COUNT = 3
+
+# Amount of output kept in memory for error messages
+OUTPUT_TAIL_SIZE = 16 * 1024
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Parsed log_max_size setting, see get_log_max_size
+_log_max_size = None
+
+
+def get_log_dir():
+    """
+    Get the directory holding one subdirectory of logs per package.
+
+    Logs are written by Polly itself, not by the privileged broker, so
+    SYSTEM_LOG_DIR is only used when the user can write to it. Otherwise
+    they go to the user's XDG state directory.
+    """
+    log_dir = get_config_value("log_dir")
+    if log_dir:
+        return log_dir
+    if is_writable_directory(SYSTEM_LOG_DIR):
+        return SYSTEM_LOG_DIR
+    state_home = os.environ.get("XDG_STATE_HOME") or os.path.expanduser(
+        "~/.local/state"
+    )
+    return os.path.join(state_home, "polly", "logs")
+
+
+def get_log_max_size():
+    """Get the size in bytes a log is rotated at, warning once if it's invalid."""
+    global _log_max_size
+    if _log_max_size is None:
+        size = get_config_value("log_max_size", DEFAULT_LOG_MAX_SIZE)
+        try:
+            _log_max_size = parse_size(size)
+        except ValueError:
+            print(
+                format_message(
+                    "warning",
+                    f"Invalid log_max_size {size}, using {DEFAULT_LOG_MAX_SIZE}",
+                ),
+                file=sys.stderr,
+            )
+            _log_max_size = parse_size(DEFAULT_LOG_MAX_SIZE)
+    return _log_max_size
+
+
+def get_command_log_path(package, operation):
+    """
+    Get the log file of an operation on a package.
+
+    :param package: Package name
+    :param operation: Operation, e.g. install, uninstall or upgrade
+    :return: Path of the log file
+    """
+    safe_package = re.sub(r"[^A-Za-z0-9._-]", "_", package).lstrip(".") or "_"
+    return os.path.join(get_log_dir(), safe_package, f"{operation}.log")
+
+
+def rotate_log(log_path):
+    """Shift a log to .1, .2, ... dropping the oldest one."""
+    for i in range(LOG_BACKUP_COUNT - 1, 0, -1):
+        source = f"{log_path}.{i}"
+        if os.path.exists(source):
+            os.replace(source, f"{log_path}.{i + 1}")
+    if os.path.exists(log_path):
+        os.replace(log_path, f"{log_path}.1")
+
+
+def open_command_log(log_path):
+    """
+    Open a log file for appending, rotating it first when it is full.
+
+    :return: Binary file object, or None if the log can't be written
+    """
+    try:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        if os.path.exists(log_path) and os.path.getsize(log_path) >= get_log_max_size():
+            rotate_log(log_path)
+        return open(log_path, "ab")
+    except OSError as e:
+        debug_print(f"Can't write command log {log_path}: {e}")
+        return None
+
+
+def iter_stream_chunks(stream):
+    """Read a binary stream in chunks as they arrive, until it is closed."""
+    return iter(lambda: stream.read1(READ_CHUNK_SIZE), b"")
+
+
+def stream_command_output(chunks, log_path=None, header=None):
+    """
+    Copy a command's output to its log file as it arrives.
+
+    Only the last OUTPUT_TAIL_SIZE bytes stay in memory. The log rotates
+    mid-stream when a command prints more than the log_max_size setting.
+
+    :param chunks: Iterable of output bytes, e.g. from iter_stream_chunks
+    :param log_path: Log file to append to, or None to keep only the tail
+    :param header: Line written to the log before the output
+    :return: Tuple of (tail of the output decoded, whether the whole output
+             was written to the log)
+    """
+    log_file = open_command_log(log_path) if log_path else None
+    logged = log_file is not None
+    tail = bytearray()
+
+    try:
+        if log_file and header:
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            log_file.write(f"=== {timestamp} {header}\n".encode())
+
+        for chunk in chunks:
+            tail += chunk
+            if len(tail) > OUTPUT_TAIL_SIZE:
+                del tail[: len(tail) - OUTPUT_TAIL_SIZE]
+
+            if log_file:
+                try:
+                    log_file.write(chunk)
+                    if log_file.tell() >= get_log_max_size():
+                        log_file.close()
+                        rotate_log(log_path)
+                        log_file = open(log_path, "ab")
+                except OSError as e:
+                    debug_print(f"Stopped writing command log {log_path}: {e}")
+                    log_file.close()
+                    log_file = None
+                    logged = False
+    finally:
+        if log_file:
+            log_file.close()
+
+    return tail.decode(errors="replace"), logged
+
+
+def append_command_log(log_path, line):
+    """Append a line, e.g. a command's exit code, to a log file."""
+    try:
+        with open(log_path, "a") as f:
+            f.write(f"{line}\n")
+    except OSError as e:
+        debug_print(f"Can't write command log {log_path}: {e}")
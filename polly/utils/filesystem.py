@@ -1,21 +1,159 @@
 import os
+import json
 import shutil
+import hashlib
+from .profiling import phase
 
 
-def get_directory_size(directory):
-    """Calculate the total size of a directory in bytes."""
-    total_size = 0
+# Global size cache state
+_size_cache_dir = None
+_size_cache = {}
+
+
+def set_size_cache_dir(cache_dir):
+    """Set the directory where directory size caches are persisted."""
+    global _size_cache_dir
+    _size_cache_dir = cache_dir
+    _size_cache.clear()
+
+
+def _get_size_cache_file(directory):
+    """Get the cache file used for a directory, or None if not persisted."""
+    if not _size_cache_dir:
+        return None
+    key = hashlib.sha1(directory.encode("utf-8")).hexdigest()
+    return os.path.join(_size_cache_dir, f"{key}.json")
+
+
+def _load_size_cache(directory):
+    """Load the cached per-directory totals for a directory tree."""
+    if directory in _size_cache:
+        return _size_cache[directory]
+
+    entries = {}
+    cache_file = _get_size_cache_file(directory)
+    if cache_file:
+        try:
+            with open(cache_file, "r") as f:
+                data = json.load(f)
+            if data.get("root") == directory:
+                entries = data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+
+    _size_cache[directory] = entries
+    return entries
+
+
+def _save_size_cache(directory, entries):
+    """Persist the cached per-directory totals for a directory tree."""
+    _size_cache[directory] = entries
+
+    cache_file = _get_size_cache_file(directory)
+    if not cache_file:
+        return
+
     try:
-        for dirpath, dirnames, filenames in os.walk(directory):
-            for filename in filenames:
-                filepath = os.path.join(dirpath, filename)
-                try:
-                    total_size += os.path.getsize(filepath)
-                except (OSError, FileNotFoundError):
-                    pass
-    except (OSError, FileNotFoundError):
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump({"root": directory, "entries": entries}, f)
+        os.replace(temp_file, cache_file)
+    except OSError:
         pass
-    return total_size
+
+
+def invalidate_size_cache(directory):
+    """Drop the cached size and file count of a directory tree."""
+    directory = os.path.abspath(directory)
+    _size_cache.pop(directory, None)
+
+    cache_file = _get_size_cache_file(directory)
+    if cache_file:
+        try:
+            os.remove(cache_file)
+        except OSError:
+            pass
+
+
+@phase("size walk")
+def get_directory_stats(directory):
+    """
+    Calculate the total size in bytes and the file count of a directory.
+
+    Totals are cached per subdirectory together with its inode and mtime, so
+    only subdirectories whose entries changed since the last call are listed
+    again. Files modified in place don't change their directory's mtime, use
+    invalidate_size_cache after changing a tree.
+
+    :param directory: Directory to measure
+    :return: Tuple of (size: int, file_count: int)
+    """
+    directory = os.path.abspath(directory)
+    cached_entries = _load_size_cache(directory)
+    entries = {}
+    changed = False
+    total_size = 0
+    total_count = 0
+
+    stack = [""]
+    while stack:
+        relpath = stack.pop()
+        path = os.path.join(directory, relpath) if relpath else directory
+
+        try:
+            stat = os.stat(path)
+        except (OSError, FileNotFoundError):
+            changed = changed or relpath in cached_entries
+            continue
+
+        signature = [stat.st_ino, stat.st_mtime_ns]
+        cached = cached_entries.get(relpath)
+
+        if cached and cached[0] == signature:
+            entry = cached
+        else:
+            changed = True
+            size = 0
+            count = 0
+            children = []
+            try:
+                with os.scandir(path) as it:
+                    for item in it:
+                        try:
+                            is_dir = item.is_dir()
+                        except OSError:
+                            is_dir = False
+
+                        if is_dir:
+                            # Like os.walk, don't descend into symlinked directories
+                            if not item.is_symlink():
+                                children.append(item.name)
+                            continue
+
+                        count += 1
+                        try:
+                            size += item.stat().st_size
+                        except (OSError, FileNotFoundError):
+                            pass
+            except (OSError, FileNotFoundError):
+                pass
+            entry = [signature, size, count, children]
+
+        entries[relpath] = entry
+        total_size += entry[1]
+        total_count += entry[2]
+        stack.extend(os.path.join(relpath, child) for child in entry[3])
+
+    if changed or len(entries) != len(cached_entries):
+        _save_size_cache(directory, entries)
+
+    return total_size, total_count
+
+
+def get_directory_size(directory):
+    """Calculate the total size of a directory in bytes."""
+    return get_directory_stats(directory)[0]
 
 
 def format_size(size_bytes):
@@ -34,15 +172,38 @@ def format_size(size_bytes):
     return f"{size:.1f} {size_names[size_index]}"
 
 
+def parse_size(size_text):
+    """
+    Parse a human readable size like 512M or 1.5 GB into bytes.
+
+    :param size_text: Size in bytes, or with a B/K/M/G/T suffix (powers of 1024)
+    :return: Size in bytes
+    :raises: ValueError if the size can't be parsed
+    """
+    if isinstance(size_text, (int, float)):
+        return int(size_text)
+
+    text = str(size_text).strip().upper().replace(" ", "")
+    if text.endswith("IB"):
+        text = text[:-2]
+    elif text.endswith("B") and len(text) > 1 and not text[-2].isdigit():
+        text = text[:-1]
+
+    multipliers = {"B": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    multiplier = 1
+    if text and text[-1] in multipliers:
+        multiplier = multipliers[text[-1]]
+        text = text[:-1]
+
+    try:
+        return int(float(text) * multiplier)
+    except ValueError:
+        raise ValueError(f"Invalid size: {size_text}")
+
+
 def get_file_count(directory):
     """Count the number of files in a directory."""
-    count = 0
-    try:
-        for dirpath, dirnames, filenames in os.walk(directory):
-            count += len(filenames)
-    except (OSError, FileNotFoundError):
-        pass
-    return count
+    return get_directory_stats(directory)[1]
 
 
 def get_available_space(path):
@@ -66,6 +227,78 @@ def safe_remove_directory(directory_path):
     return False
 
 
+def swap_directory(source_path, dest_path):
+    """
+    Move a directory into place, keeping the existing one as a backup.
+
+    The existing directory is renamed aside before the new one is renamed in,
+    so dest_path is missing just between the two renames. If the new
+    directory can't be moved in, the old one is put back.
+
+    :param source_path: Directory to move, on the same filesystem as dest_path
+    :param dest_path: Final location of the directory
+    :return: Tuple of (success: bool, backup_path: str or None), the backup
+             path is None when nothing was replaced
+    """
+    backup_path = None
+
+    try:
+        if os.path.exists(dest_path):
+            backup_path = os.path.join(
+                os.path.dirname(dest_path),
+                f".{os.path.basename(dest_path)}.old-{os.getpid()}",
+            )
+            safe_remove_directory(backup_path)
+            os.rename(dest_path, backup_path)
+
+        try:
+            os.rename(source_path, dest_path)
+        except OSError:
+            if backup_path:
+                os.rename(backup_path, dest_path)
+            raise
+    except OSError:
+        return False, None
+
+    return True, backup_path
+
+
+def restore_directory(backup_path, dest_path):
+    """
+    Undo swap_directory, removing the new directory and putting back the old.
+
+    :param backup_path: Backup path from swap_directory, or None to only
+                        remove dest_path
+    :param dest_path: Location the directories were swapped at
+    :return: True if dest_path holds the old directory again, or is gone when
+             there was none
+    """
+    if not safe_remove_directory(dest_path) and os.path.exists(dest_path):
+        return False
+    if not backup_path:
+        return True
+
+    try:
+        os.rename(backup_path, dest_path)
+        return True
+    except OSError:
+        return False
+
+
+def replace_directory(source_path, dest_path):
+    """
+    Move a directory into place, replacing the existing one if any.
+
+    :param source_path: Directory to move, on the same filesystem as dest_path
+    :param dest_path: Final location of the directory
+    :return: True if source_path now lives at dest_path
+    """
+    swapped, backup_path = swap_directory(source_path, dest_path)
+    if backup_path:
+        safe_remove_directory(backup_path)
+    return swapped
+
+
 def safe_create_directory(directory_path):
     """Safely create a directory, including parent directories."""
     try:
@@ -83,3 +316,18 @@ def file_exists(file_path):
 def directory_exists(directory_path):
     """Check if a directory exists."""
     return os.path.exists(directory_path) and os.path.isdir(directory_path)
+
+
+def is_writable_directory(directory_path):
+    """
+    Check if the current user can write to a directory, or create it.
+
+    A missing directory counts as writable when its closest existing parent is.
+    """
+    path = os.path.abspath(directory_path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+    return os.path.isdir(path) and os.access(path, os.W_OK | os.X_OK)
@@ -1,8 +1,25 @@
 import os
+import re
+import shlex
 import subprocess
 from urllib.parse import urlparse
-from ..utils import run_silent_command
+from .command import run_silent_command, get_sudo_prefix
+from .broker import get_broker
 from .debug import debug_print, format_error_with_debug
+from .profiling import phase
+from .trace import span
+from .git_refs import (
+    find_git_dir,
+    read_head,
+    read_packed_refs,
+    resolve_ref,
+    read_git_config,
+    get_upstream_ref,
+    read_loose_commit,
+)
+
+# Maximum number of commit messages reported for an available update
+UPDATE_LOG_LIMIT = 10
 
 
 def extract_package_id_from_url(repo_url):
@@ -15,58 +32,68 @@ def extract_package_id_from_url(repo_url):
     return path.split("/")[-1]
 
 
+def normalize_repo_url(repo_url):
+    """
+    Normalize a repository URL so URLs naming the same repository compare equal.
+
+    The scheme, user and host case are dropped along with a trailing slash or
+    .git, so https://GitHub.com/user/repo.git/ and git@github.com:user/repo
+    both become github.com/user/repo.
+
+    :param repo_url: Repository URL, scp-like address or local path
+    :return: Normalized host and path
+    """
+    url = repo_url.strip()
+    parsed = urlparse(url)
+    scp_match = re.fullmatch(r"(?:[^@/]+@)?([^:/]+):(?!//)(.*)", url)
+
+    if parsed.scheme and parsed.netloc:
+        host = (parsed.hostname or "").lower()
+        if parsed.port:
+            host += f":{parsed.port}"
+        path = parsed.path
+    elif parsed.scheme == "file":
+        host, path = "", parsed.path
+    elif scp_match:
+        host, path = scp_match.group(1).lower(), scp_match.group(2)
+    else:
+        host, path = "", url
+
+    path = path.rstrip("/").removesuffix(".git").strip("/")
+    return f"{host}/{path}"
+
+
 def is_git_repository(directory):
     """Check if a directory is a git repository."""
     git_dir = os.path.join(directory, ".git")
     return os.path.exists(git_dir) and os.path.isdir(git_dir)
 
 
-def get_git_info(package_path):
-    """Get git repository information if available."""
-    if not is_git_repository(package_path):
+def get_git_origin(package_path):
+    """Get the remote origin URL of a git repository if available."""
+    git_dir = find_git_dir(package_path)
+    if git_dir is None:
         return None
 
-    git_info = {}
+    return read_git_config(git_dir).get("remote.origin.url") or None
 
-    try:
-        # Get remote origin URL
-        result = subprocess.run(
-            ["git", "config", "--get", "remote.origin.url"],
-            cwd=package_path,
-            capture_output=True,
-            text=True,
-        )
-        if result.returncode == 0:
-            git_info["origin"] = result.stdout.strip()
-    except:
-        pass
 
+def _read_last_commit_with_git(package_path):
+    """Read the last commit with the git command line."""
+    command = ["git", "log", "-1", "--format=%H|%s|%an|%ad", "--date=short"]
     try:
-        # Get current branch
-        result = subprocess.run(
-            ["git", "branch", "--show-current"],
-            cwd=package_path,
-            capture_output=True,
-            text=True,
-        )
-        if result.returncode == 0:
-            git_info["branch"] = result.stdout.strip()
-    except:
-        pass
-
-    try:
-        # Get last commit info
-        result = subprocess.run(
-            ["git", "log", "-1", "--format=%H|%s|%an|%ad", "--date=short"],
-            cwd=package_path,
-            capture_output=True,
-            text=True,
-        )
+        with span(
+            "git log", "subprocess", command=shlex.join(command), cwd=package_path
+        ) as attrs:
+            result = subprocess.run(
+                command, cwd=package_path, capture_output=True, text=True
+            )
+            attrs["exit_code"] = result.returncode
         if result.returncode == 0:
             commit_data = result.stdout.strip().split("|")
             if len(commit_data) == 4:
-                git_info["last_commit"] = {
-                    "hash": commit_data[0][:8],
+                return {
+                    "hash": commit_data[0],
                     "message": commit_data[1],
                     "author": commit_data[2],
                     "date": commit_data[3],
@@ -74,141 +101,378 @@ def get_git_info(package_path):
     except:
         pass
 
+    return None
+
+
+@phase("git calls")
+def get_git_info(package_path):
+    """
+    Get git repository information if available.
+
+    Origin, branch and HEAD are read straight from the git directory. The
+    git command line is only used for commits stored in packfiles.
+    """
+    if not is_git_repository(package_path):
+        return None
+
+    git_dir = find_git_dir(package_path)
+    git_info = {}
+
+    # Get remote origin URL
+    origin = read_git_config(git_dir).get("remote.origin.url")
+    if origin:
+        git_info["origin"] = origin
+
+    # Get current branch, empty for a detached HEAD like git branch --show-current
+    head = read_head(git_dir)
+    if head is not None:
+        git_info["branch"] = head[0] or ""
+
+    # Get last commit info
+    head_commit = resolve_ref(git_dir, "HEAD")
+    commit = read_loose_commit(git_dir, head_commit) if head_commit else None
+    if commit is None:
+        debug_print(f"Last commit of {package_path} is packed, asking git")
+        commit = _read_last_commit_with_git(package_path)
+    if commit:
+        git_info["last_commit"] = dict(commit, hash=commit["hash"][:8])
+
     return git_info if git_info else None
 
 
+def run_git_command(package_path, args, use_sudo=True):
+    """
+    Run a git command in a package directory and capture its output.
+
+    :param package_path: Repository directory to run git in
+    :param args: Arguments passed to git
+    :param use_sudo: Whether to run git as root, through the privileged broker
+    :return: subprocess.CompletedProcess
+    """
+    name = f"git {args[0]}" if args else "git"
+    return _run_git(package_path, name, ["git"] + list(args), None, use_sudo)
+
+
+def run_git_commands(package_path, commands, use_sudo=True):
+    """
+    Run several git commands in one shell, stopping at the first that fails.
+
+    The commands cost a single process and privileged request, and their
+    output is concatenated in order.
+
+    :param package_path: Repository directory to run git in
+    :param commands: Lists of arguments passed to git
+    :param use_sudo: Whether to run git as root, through the privileged broker
+    :return: subprocess.CompletedProcess
+    """
+    script = " && ".join(shlex.join(["git"] + list(args)) for args in commands)
+    return _run_git(package_path, "git batch", None, script, use_sudo)
+
+
+@phase("git calls")
+def _run_git(package_path, name, argv, command, use_sudo):
+    """Run git from an argument list or a shell command, capturing its output."""
+    sudo_prefix = get_sudo_prefix() if use_sudo else []
+    with span(
+        name,
+        "subprocess",
+        command=command or shlex.join(argv),
+        cwd=package_path,
+    ) as attrs:
+        if sudo_prefix:
+            process = get_broker(sudo_prefix).run(
+                argv=argv, command=command, cwd=package_path
+            )
+            stdout, stderr = process.communicate()
+            result = subprocess.CompletedProcess(
+                argv or command,
+                process.returncode,
+                stdout.decode(errors="replace"),
+                stderr.decode(errors="replace"),
+            )
+        else:
+            result = subprocess.run(
+                argv or command,
+                shell=argv is None,
+                cwd=package_path,
+                capture_output=True,
+                text=True,
+            )
+        attrs["exit_code"] = result.returncode
+        return result
+
+
+def _parse_behind_count(track):
+    """Parse the number of commits behind from a %(upstream:track) value."""
+    match = re.search(r"behind (\d+)", track)
+    return int(match.group(1)) if match else 0
+
+
+def _read_local_refs_in_process(package_path):
+    """
+    Resolve HEAD, the current branch and origin's branches from the git directory.
+
+    :return: Dictionary with branch, head, upstream, behind and remote_refs,
+             or None if the refs couldn't be read
+    """
+    git_dir = find_git_dir(package_path)
+    if git_dir is None:
+        return None
+
+    head = read_head(git_dir)
+    packed_refs = read_packed_refs(git_dir)
+    head_commit = resolve_ref(git_dir, "HEAD", packed_refs)
+    if head is None or head_commit is None:
+        return None
+
+    branch = head[0]
+    refs = {
+        "branch": branch,
+        "head": head_commit,
+        "upstream": None,
+        "behind": None,
+        "remote_refs": {},
+    }
+
+    upstream = get_upstream_ref(read_git_config(git_dir), branch) if branch else None
+    if upstream and upstream.startswith("refs/remotes/origin/"):
+        refs["upstream"] = upstream
+
+    for candidate in [upstream] + [
+        f"refs/remotes/origin/{name}" for name in [branch, "main", "master"] if name
+    ]:
+        if candidate and candidate.startswith("refs/remotes/origin/"):
+            commit = resolve_ref(git_dir, candidate, packed_refs)
+            if commit:
+                refs["remote_refs"][candidate] = commit
+
+    return refs
+
+
+def _read_local_refs(package_path):
+    """
+    Resolve HEAD, the current branch and origin's branches in one git call.
+
+    :return: Dictionary with branch, head, upstream, behind and remote_refs,
+             or None if the refs couldn't be read
+    """
+    result = run_git_command(
+        package_path,
+        [
+            "for-each-ref",
+            "--format=%(HEAD)%00%(refname)%00%(objectname)%00%(upstream)%00%(upstream:track,nobracket)",
+            "refs/heads",
+            "refs/remotes/origin",
+        ],
+    )
+    if result.returncode != 0:
+        debug_print(f"Failed to read refs: {result.stderr}")
+        return None
+
+    refs = {
+        "branch": None,
+        "head": None,
+        "upstream": None,
+        "behind": None,
+        "remote_refs": {},
+    }
+
+    for line in result.stdout.splitlines():
+        fields = line.split("\0")
+        if len(fields) != 5:
+            continue
+        is_head, refname, objectname, upstream, track = fields
+
+        if refname.startswith("refs/remotes/origin/"):
+            refs["remote_refs"][refname] = objectname
+        elif is_head == "*":
+            refs["branch"] = refname[len("refs/heads/") :]
+            refs["head"] = objectname
+            if upstream.startswith("refs/remotes/origin/"):
+                refs["upstream"] = upstream
+                refs["behind"] = _parse_behind_count(track)
+
+    return refs
+
+
+def _failure_message(description, result):
+    """Describe a failed git command by its first line of error output."""
+    lines = result.stderr.strip().splitlines()
+    return f"{description}: {lines[0]}" if lines else description
+
+
 def check_for_updates(package_path, debug=False):
-    """Check if a package has updates available by comparing with remote."""
+    """
+    Check if a package has updates available by comparing with remote.
+
+    An up to date package costs a single ``git fetch``, HEAD and the remote
+    branch are then read straight from the git directory. Only when updates
+    are available is one more process run, a shell running ``git rev-list
+    --count`` and a ``git log`` bounded to UPDATE_LOG_LIMIT messages. If the
+    git directory can't be read, one ``git for-each-ref`` resolves the refs
+    and the commit count instead, and the bounded log runs on its own.
+
+    Shallow and partial clones are fetched without ``--depth``, so git only
+    deepens the history as far as the current HEAD and commit counts stay
+    exact. Partial clones only need commits here, blobs are fetched on demand
+    when the upgrade checks them out.
+
+    :param package_path: Path to the package
+    :return: Tuple of (update_info, error). update_info is the update
+             information, False if the package is up to date, or None if the
+             check failed, in which case error says why
+    """
 
     debug_print(f"Checking for updates in package: {package_path}")
 
     if not is_git_repository(package_path):
         debug_print(f"{package_path} is not a git repository")
-        return None
+        return None, "Not a git repository"
 
     try:
         # Fetch latest changes from remote
         debug_print(f"Fetching latest changes from remote for {package_path}")
-        result = subprocess.run(
-            ["sudo", "git", "fetch", "origin"],
-            cwd=package_path,
-            capture_output=True,
-            text=True,
-        )
+        result = run_git_command(package_path, ["fetch", "origin"])
         if result.returncode != 0:
             debug_print(f"Failed to fetch from remote: {result.stderr}")
-            return None
-
-        # Get current commit hash
-        debug_print("Getting current commit hash")
-        result = subprocess.run(
-            ["sudo", "git", "rev-parse", "HEAD"],
-            cwd=package_path,
-            capture_output=True,
-            text=True,
-        )
-        if result.returncode != 0:
-            debug_print(f"Failed to get current commit: {result.stderr}")
-            return None
-        current_commit = result.stdout.strip()
+            return None, _failure_message("Failed to fetch from remote", result)
+
+        debug_print("Reading local and remote refs")
+        refs = _read_local_refs_in_process(package_path)
+        if refs is None:
+            debug_print("Could not read refs from the git directory, asking git")
+            refs = _read_local_refs(package_path)
+        if refs is None:
+            return None, "Could not read the local and remote refs"
+
+        current_commit = refs["head"]
+        current_branch = refs["branch"]
+        if current_commit is None:
+            # Detached HEAD, for-each-ref only marks branches
+            result = run_git_command(package_path, ["rev-parse", "HEAD"])
+            if result.returncode != 0:
+                debug_print(f"Failed to get current commit: {result.stderr}")
+                return None, _failure_message("Failed to get current commit", result)
+            current_commit = result.stdout.strip()
         debug_print(f"Current commit: {current_commit}")
-
-        # Get current branch name
-        debug_print("Getting current branch name")
-        result = subprocess.run(
-            ["sudo", "git", "rev-parse", "--abbrev-ref", "HEAD"],
-            cwd=package_path,
-            capture_output=True,
-            text=True,
-        )
-        current_branch = result.stdout.strip() if result.returncode == 0 else "main"
         debug_print(f"Current branch: {current_branch}")
 
-        # Get remote commit hash for current branch
-        debug_print(f"Getting remote commit hash for branch {current_branch}")
-        result = subprocess.run(
-            ["sudo", "git", "rev-parse", f"origin/{current_branch}"],
-            cwd=package_path,
-            capture_output=True,
-            text=True,
-        )
+        # Prefer the configured upstream, then fall back to common branch names
+        candidates = []
+        if refs["upstream"]:
+            candidates.append(refs["upstream"])
+        for branch in [current_branch, "main", "master"]:
+            if branch:
+                candidates.append(f"refs/remotes/origin/{branch}")
 
-        # Fallback to common branch names if current branch doesn't exist on remote
-        if result.returncode != 0:
-            debug_print(
-                f"Branch {current_branch} not found on remote, trying fallback branches"
-            )
-            for branch in ["main", "master"]:
-                result = subprocess.run(
-                    ["sudo", "git", "rev-parse", f"origin/{branch}"],
-                    cwd=package_path,
-                    capture_output=True,
-                    text=True,
-                )
-                if result.returncode == 0:
-                    debug_print(f"Using fallback branch {branch}")
-                    break
-            else:
-                debug_print("No valid remote branch found")
-                return None
+        remote_ref = next(
+            (ref for ref in candidates if ref in refs["remote_refs"]), None
+        )
+        if remote_ref is None:
+            debug_print("No valid remote branch found")
+            return None, "No valid remote branch found"
 
-        remote_commit = result.stdout.strip()
-        debug_print(f"Remote commit: {remote_commit}")
+        remote_commit = refs["remote_refs"][remote_ref]
+        debug_print(f"Remote commit: {remote_commit} ({remote_ref})")
 
         # Check if updates are available
         if current_commit == remote_commit:
             debug_print("Package is up to date")
-            return False  # Up to date
+            return False, None  # Up to date
 
-        # Get commit count and messages for updates
+        # Get commit count and messages for updates. Without a count from
+        # for-each-ref, rev-list counts the commits in the same shell as the log
         debug_print("Getting commit count and messages for updates")
-        result = subprocess.run(
-            [
-                "sudo",
-                "git",
-                "rev-list",
-                "--count",
-                f"{current_commit}..{remote_commit}",
-            ],
-            cwd=package_path,
-            capture_output=True,
-            text=True,
-        )
-        commit_count = int(result.stdout.strip()) if result.returncode == 0 else 0
-
-        result = subprocess.run(
-            ["sudo", "git", "log", "--oneline", f"{current_commit}..{remote_commit}"],
-            cwd=package_path,
-            capture_output=True,
-            text=True,
-        )
+        revision_range = f"{current_commit}..{remote_commit}"
+        log_args = [
+            "log",
+            f"--max-count={UPDATE_LOG_LIMIT}",
+            "--format=%h %s",
+            revision_range,
+        ]
+        commit_count = None
+        if remote_ref == refs["upstream"] and refs["behind"] is not None:
+            commit_count = refs["behind"]
+            result = run_git_command(package_path, log_args)
+        else:
+            result = run_git_commands(
+                package_path, [["rev-list", "--count", revision_range], log_args]
+            )
 
-        commit_messages = []
-        if result.returncode == 0 and result.stdout.strip():
-            commit_messages = [
-                line.strip()
-                for line in result.stdout.strip().split("\n")
-                if line.strip()
-            ]
+        lines = []
+        if result.returncode == 0:
+            lines = [line.strip() for line in result.stdout.split("\n") if line.strip()]
+        if commit_count is None:
+            commit_count = int(lines.pop(0)) if lines else 0
+        commit_messages = lines
 
         update_info = {
             "current_commit": current_commit[:8],
             "remote_commit": remote_commit[:8],
+            "base_commit": current_commit,
+            "target_commit": remote_commit,
             "commit_count": commit_count,
-            "commit_messages": commit_messages[:10],  # Limit to 10 most recent
+            "commit_messages": commit_messages,
         }
 
         debug_print(f"Found {commit_count} updates available")
 
-        return update_info
+        return update_info, None
 
     except Exception as e:
         debug_print(f"Exception occurred while checking for updates: {e}")
-        return None
+        return None, str(e)
+
+
+def get_head_commit(package_path):
+    """Get the full commit id of HEAD, or None if it can't be resolved."""
+    git_dir = find_git_dir(package_path)
+    head_commit = resolve_ref(git_dir, "HEAD") if git_dir else None
+    if head_commit:
+        return head_commit
+
+    result = run_git_command(package_path, ["rev-parse", "HEAD"])
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def resolve_commit(package_path, revision, fetch=True):
+    """
+    Resolve a commit id or other revision to a full commit id.
 
+    :param package_path: Repository directory of the package
+    :param revision: Commit id (possibly abbreviated), tag or branch
+    :param fetch: Whether to fetch origin when the commit isn't available locally
+    :return: Full commit id, or None if the revision can't be resolved
+    """
+    args = ["rev-parse", "--verify", "--quiet", f"{revision}^{{commit}}"]
 
-def upgrade_git_package(package_path):
-    """Upgrade a git package by pulling latest changes."""
+    result = run_git_command(package_path, args)
+    if result.returncode != 0 and fetch:
+        debug_print(f"{revision} not found locally, fetching origin")
+        if run_git_command(package_path, ["fetch", "--quiet", "origin"]).returncode == 0:
+            result = run_git_command(package_path, args)
+
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def is_ancestor_commit(package_path, ancestor, descendant):
+    """Check whether a commit is an ancestor of (or the same as) another one."""
+    result = run_git_command(
+        package_path, ["merge-base", "--is-ancestor", ancestor, descendant]
+    )
+    return result.returncode == 0
+
+
+def upgrade_git_package(package_path, target_commit=None, base_commit=None):
+    """
+    Upgrade a git package by pulling latest changes.
+
+    :param package_path: Repository directory of the package
+    :param target_commit: Already fetched commit to fast-forward to. Without
+                          it, the latest changes are pulled from origin.
+    :param base_commit: Commit HEAD must still be on for the upgrade to apply
+    :return: bool indicating success
+    """
     debug_print(f"Attempting to upgrade git package at: {package_path}")
 
     if not is_git_repository(package_path):
@@ -216,18 +480,28 @@ def upgrade_git_package(package_path):
         return False
 
     try:
-        debug_print("Running 'git pull origin'")
-        # Pull latest changes
-        result = subprocess.run(
-            ["sudo", "git", "pull", "origin"],
-            cwd=package_path,
-            capture_output=True,
-            text=True,
-        )
+        if base_commit:
+            head_commit = get_head_commit(package_path)
+            if head_commit != base_commit:
+                debug_print(
+                    f"HEAD moved from {base_commit} to {head_commit}, refusing to upgrade"
+                )
+                return False
+
+        if target_commit:
+            # The commit was fetched when the upgrade was planned, no network needed
+            debug_print(f"Running 'git merge --ff-only {target_commit}'")
+            result = run_git_command(
+                package_path, ["merge", "--ff-only", target_commit]
+            )
+        else:
+            debug_print("Running 'git pull origin'")
+            # Pull latest changes
+            result = run_git_command(package_path, ["pull", "origin"])
 
-        debug_print(f"Git pull return code: {result.returncode}")
-        debug_print(f"Git pull stdout: {result.stdout}")
-        debug_print(f"Git pull stderr: {result.stderr}")
+        debug_print(f"Git upgrade return code: {result.returncode}")
+        debug_print(f"Git upgrade stdout: {result.stdout}")
+        debug_print(f"Git upgrade stderr: {result.stderr}")
 
         if result.returncode == 0:
             debug_print("Git package upgrade successful")
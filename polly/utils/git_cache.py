@@ -0,0 +1,145 @@
+"""
+Local git object cache for Polly.
+This module keeps a bare mirror of the branches and tags of every cloned
+repository, so reinstalls and repeated installs only fetch what changed
+instead of cloning again.
+Mirrors are evicted least recently used first once the cache grows past
+its size limit.
+"""
+
+import os
+import shlex
+import hashlib
+from polly.config import get_config_value
+from .command import run_silent_command
+from .debug import debug_print
+from .profiling import phase
+from .filesystem import (
+    get_directory_size,
+    invalidate_size_cache,
+    safe_create_directory,
+    safe_remove_directory,
+    parse_size,
+)
+
+GIT_CACHE_DIR = get_config_value("git_cache_dir", "/var/cache/polly/git")
+DEFAULT_GIT_CACHE_LIMIT = "2G"
+
+# Refs kept in mirrors, other refs such as GitHub's refs/pull/* are skipped
+MIRROR_REFSPECS = ("+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*")
+
+
+def get_git_cache_limit():
+    """Get the maximum size of the git cache in bytes."""
+    limit = get_config_value("git_cache_limit", DEFAULT_GIT_CACHE_LIMIT)
+    try:
+        return parse_size(limit)
+    except ValueError:
+        debug_print(f"Invalid git_cache_limit {limit}, using {DEFAULT_GIT_CACHE_LIMIT}")
+        return parse_size(DEFAULT_GIT_CACHE_LIMIT)
+
+
+def get_mirror_path(repo_url):
+    """Get the path of the cached mirror of a repository."""
+    key = hashlib.sha256(repo_url.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(GIT_CACHE_DIR, f"{key}.git")
+
+
+@phase("git calls")
+def update_mirror(repo_url):
+    """
+    Create or refresh the cached mirror of a repository.
+
+    :param repo_url: URL of the git repository
+    :return: Path of the up to date mirror, or None if it couldn't be updated
+    """
+    mirror_path = get_mirror_path(repo_url)
+
+    if os.path.isdir(mirror_path):
+        refspecs = " ".join(shlex.quote(refspec) for refspec in MIRROR_REFSPECS)
+        if not run_silent_command(
+            f"git --git-dir={shlex.quote(mirror_path)} fetch --prune --quiet "
+            f"origin {refspecs}",
+            "Updating cached repository",
+        ):
+            return None
+    else:
+        if not safe_create_directory(GIT_CACHE_DIR):
+            debug_print(f"Unable to create git cache directory {GIT_CACHE_DIR}")
+            return None
+
+        # Clone next to the final path so a failed clone never looks cached
+        temp_path = f"{mirror_path}.{os.getpid()}.tmp"
+        safe_remove_directory(temp_path)
+        # A bare clone only copies branches and tags
+        if not run_silent_command(
+            f"git clone --bare --quiet {shlex.quote(repo_url)} "
+            f"{shlex.quote(temp_path)}",
+            "Caching repository",
+        ):
+            safe_remove_directory(temp_path)
+            return None
+
+        try:
+            os.rename(temp_path, mirror_path)
+        except OSError as e:
+            # Another polly process cached it first
+            debug_print(f"Could not move mirror into place: {e}")
+            safe_remove_directory(temp_path)
+            if not os.path.isdir(mirror_path):
+                return None
+
+    invalidate_size_cache(mirror_path)
+    touch_mirror(mirror_path)
+    evict_git_cache(keep=mirror_path)
+    return mirror_path
+
+
+def touch_mirror(mirror_path):
+    """Mark a mirror as recently used."""
+    try:
+        os.utime(mirror_path)
+    except OSError:
+        pass
+
+
+def evict_git_cache(limit=None, keep=None):
+    """
+    Remove least recently used mirrors until the cache fits its size limit.
+
+    :param limit: Maximum cache size in bytes, defaults to the configured limit
+    :param keep: Mirror path that must not be evicted
+    :return: List of evicted mirror paths
+    """
+    if limit is None:
+        limit = get_git_cache_limit()
+
+    try:
+        names = [name for name in os.listdir(GIT_CACHE_DIR) if name.endswith(".git")]
+    except OSError:
+        return []
+
+    mirrors = []
+    for name in names:
+        path = os.path.join(GIT_CACHE_DIR, name)
+        try:
+            last_used = os.stat(path).st_mtime
+        except OSError:
+            continue
+        mirrors.append((last_used, path, get_directory_size(path)))
+
+    total_size = sum(size for _, _, size in mirrors)
+    evicted = []
+
+    for _, path, size in sorted(mirrors):
+        if total_size <= limit:
+            break
+        if path == keep:
+            continue
+        debug_print(f"Evicting cached repository {path} ({size} bytes)")
+        if safe_remove_directory(path):
+            invalidate_size_cache(path)
+            total_size -= size
+            evicted.append(path)
+
+    return evicted
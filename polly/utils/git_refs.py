@@ -0,0 +1,261 @@
+"""
+In-process git repository reader for Polly.
+This module resolves HEAD, refs, config values and loose commits by reading
+the .git directory directly, so common queries don't need a git process.
+Every function returns None when it can't answer, callers then fall back to
+the git command line.
+"""
+
+import os
+import re
+import zlib
+from datetime import datetime, timedelta, timezone
+
+# Symbolic refs pointing to symbolic refs are rare, but guard against loops
+MAX_SYMREF_DEPTH = 5
+
+
+def find_git_dir(repo_path):
+    """Get the git directory of a repository, following .git files."""
+    dot_git = os.path.join(repo_path, ".git")
+
+    if os.path.isdir(dot_git):
+        return dot_git
+
+    try:
+        with open(dot_git, "r") as f:
+            content = f.read().strip()
+    except OSError:
+        return None
+
+    if not content.startswith("gitdir:"):
+        return None
+
+    git_dir = content[len("gitdir:") :].strip()
+    if not os.path.isabs(git_dir):
+        git_dir = os.path.join(repo_path, git_dir)
+    return os.path.normpath(git_dir)
+
+
+def _get_common_dir(git_dir):
+    """Get the directory holding shared refs and config (differs for worktrees)."""
+    try:
+        with open(os.path.join(git_dir, "commondir"), "r") as f:
+            common_dir = f.read().strip()
+    except OSError:
+        return git_dir
+
+    if not os.path.isabs(common_dir):
+        common_dir = os.path.join(git_dir, common_dir)
+    return os.path.normpath(common_dir)
+
+
+def _read_text(path):
+    """Read a small text file, returning None if it can't be read."""
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def read_packed_refs(git_dir):
+    """Read packed-refs into a dictionary of refname to object id."""
+    content = _read_text(os.path.join(_get_common_dir(git_dir), "packed-refs"))
+    refs = {}
+    if content is None:
+        return refs
+
+    for line in content.splitlines():
+        # Skip the header and peeled tag lines
+        if not line or line.startswith(("#", "^")):
+            continue
+        parts = line.split(" ", 1)
+        if len(parts) == 2:
+            refs[parts[1].strip()] = parts[0]
+    return refs
+
+
+def _read_loose_ref(git_dir, refname):
+    """Read a loose ref file, which may hold an object id or a symbolic ref."""
+    # HEAD and other pseudo refs are per worktree, everything under refs/ is shared
+    base_dir = git_dir if not refname.startswith("refs/") else _get_common_dir(git_dir)
+    for directory in dict.fromkeys([git_dir, base_dir]):
+        content = _read_text(os.path.join(directory, refname))
+        if content is not None:
+            return content.strip()
+    return None
+
+
+def resolve_ref(git_dir, refname, packed_refs=None):
+    """
+    Resolve a ref name to an object id.
+
+    :param git_dir: Git directory of the repository
+    :param refname: Full ref name, e.g. refs/remotes/origin/main, or HEAD
+    :param packed_refs: Already read packed refs, to avoid rereading the file
+    :return: Object id, or None if the ref doesn't exist
+    """
+    for _ in range(MAX_SYMREF_DEPTH):
+        value = _read_loose_ref(git_dir, refname)
+
+        if value is None:
+            if packed_refs is None:
+                packed_refs = read_packed_refs(git_dir)
+            return packed_refs.get(refname)
+
+        if value.startswith("ref:"):
+            refname = value[len("ref:") :].strip()
+            continue
+
+        return value if re.fullmatch(r"[0-9a-f]{40,64}", value) else None
+
+    return None
+
+
+def read_head(git_dir):
+    """
+    Read HEAD without resolving it.
+
+    :return: Tuple of (branch: str or None, refname: str or None), branch is
+             None for a detached HEAD, or None if HEAD can't be read
+    """
+    value = _read_loose_ref(git_dir, "HEAD")
+    if value is None:
+        return None
+
+    if value.startswith("ref:"):
+        refname = value[len("ref:") :].strip()
+        if refname.startswith("refs/heads/"):
+            return refname[len("refs/heads/") :], refname
+        return None, refname
+
+    return None, None
+
+
+def read_git_config(git_dir):
+    """
+    Read the repository config into a dictionary.
+
+    Keys are lowercased ``section.subsection.name`` strings, the last value
+    wins. Includes and multi-line values aren't supported.
+    """
+    content = _read_text(os.path.join(_get_common_dir(git_dir), "config"))
+    config = {}
+    if content is None:
+        return config
+
+    section = None
+    for raw_line in content.splitlines():
+        line = raw_line.strip()
+        if not line or line.startswith(("#", ";")):
+            continue
+
+        header = re.match(r'^\[\s*([^\s\]"]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]', line)
+        if header:
+            name = header.group(1).lower()
+            if header.group(2) is not None:
+                subsection = re.sub(r"\\(.)", r"\1", header.group(2))
+                section = f"{name}.{subsection}"
+            else:
+                section = name
+            line = line[header.end() :].strip()
+            if not line:
+                continue
+
+        if section is None:
+            continue
+
+        if "=" in line:
+            key, value = line.split("=", 1)
+            value = _parse_config_value(value)
+        else:
+            # A key without value means true
+            key, value = line, "true"
+
+        config[f"{section}.{key.strip().lower()}"] = value
+
+    return config
+
+
+def _parse_config_value(value):
+    """Strip comments and quotes from a raw config value."""
+    result = []
+    in_quotes = False
+    escaped = False
+
+    for char in value.strip():
+        if escaped:
+            result.append({"n": "\n", "t": "\t", "b": "\b"}.get(char, char))
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            in_quotes = not in_quotes
+        elif char in "#;" and not in_quotes:
+            break
+        else:
+            result.append(char)
+
+    return "".join(result).strip()
+
+
+def get_upstream_ref(config, branch):
+    """
+    Get the remote-tracking ref a branch follows.
+
+    :return: Full remote-tracking ref name, or None if no upstream is set
+    """
+    remote = config.get(f"branch.{branch}.remote")
+    merge = config.get(f"branch.{branch}.merge")
+    if not remote or not merge or not merge.startswith("refs/heads/"):
+        return None
+    return f"refs/remotes/{remote}/{merge[len('refs/heads/'):]}"
+
+
+def read_loose_commit(git_dir, commit_id):
+    """
+    Read a commit stored as a loose object.
+
+    :return: Dictionary with hash, message, author and date (short format in
+             the author's timezone), or None if the commit isn't a loose object
+    """
+    object_path = os.path.join(
+        _get_common_dir(git_dir), "objects", commit_id[:2], commit_id[2:]
+    )
+
+    try:
+        with open(object_path, "rb") as f:
+            data = zlib.decompress(f.read())
+    except (OSError, zlib.error):
+        return None
+
+    header, _, body = data.partition(b"\0")
+    if not header.startswith(b"commit "):
+        return None
+
+    headers, _, message = body.partition(b"\n\n")
+    author = None
+    for line in headers.split(b"\n"):
+        if line.startswith(b"author "):
+            author = line[len(b"author ") :].decode("utf-8", "replace")
+            break
+
+    match = re.match(r"^(.*) <[^>]*> (\d+) ([+-])(\d{2})(\d{2})$", author or "")
+    if not match:
+        return None
+
+    offset = timedelta(hours=int(match.group(4)), minutes=int(match.group(5)))
+    if match.group(3) == "-":
+        offset = -offset
+    date = datetime.fromtimestamp(int(match.group(2)), timezone(offset))
+
+    # Like git's %s, the subject is the first paragraph joined into one line
+    subject = message.decode("utf-8", "replace").strip().split("\n\n")[0]
+
+    return {
+        "hash": commit_id,
+        "message": " ".join(subject.split("\n")).strip(),
+        "author": match.group(1),
+        "date": date.strftime("%Y-%m-%d"),
+    }
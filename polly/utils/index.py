@@ -0,0 +1,202 @@
+"""
+Package index handling for Polly.
+This module manages the on-disk SQLite index of installed packages so that
+read commands don't have to rescan every package directory.
+"""
+
+import os
+import json
+import sqlite3
+from .debug import debug_print
+
+INDEX_DIRNAME = ".polly"
+INDEX_FILENAME = "index.db"
+INDEX_SCHEMA_VERSION = "1"
+
+# ORDER BY clause of each package sort, largest and newest packages first
+INDEX_SORT_ORDERS = {
+    "name": "name COLLATE NOCASE",
+    "size": "size DESC",
+    "date": "install_time DESC",
+}
+
+
+def get_state_directory(packages_dir):
+    """Get the directory where Polly keeps its internal state."""
+    return os.path.join(packages_dir, INDEX_DIRNAME)
+
+
+def get_index_path(packages_dir):
+    """Get the path of the package index database."""
+    return os.path.join(get_state_directory(packages_dir), INDEX_FILENAME)
+
+
+def open_index(packages_dir):
+    """
+    Open (and create if needed) the package index.
+
+    :param packages_dir: Directory containing the installed packages
+    :return: sqlite3.Connection, or None if the index is not available
+    """
+    index_path = get_index_path(packages_dir)
+
+    try:
+        if not os.path.exists(index_path):
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+
+        conn = sqlite3.connect(index_path, timeout=5)
+        conn.row_factory = sqlite3.Row
+
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS packages (
+                    name TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    metadata TEXT,
+                    origin TEXT,
+                    install_time REAL,
+                    size INTEGER,
+                    install_type TEXT
+                )
+                """
+            )
+            # Let size and date queries find their top packages without
+            # sorting the whole table
+            conn.execute("CREATE INDEX IF NOT EXISTS packages_size ON packages (size)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS packages_install_time"
+                " ON packages (install_time)"
+            )
+
+        if index_get_meta(conn, "schema_version") != INDEX_SCHEMA_VERSION:
+            with conn:
+                conn.execute("DELETE FROM packages")
+                conn.execute("DELETE FROM meta")
+                index_set_meta(conn, "schema_version", INDEX_SCHEMA_VERSION)
+
+        return conn
+
+    except (OSError, sqlite3.Error) as e:
+        debug_print(f"Package index unavailable at {index_path}: {e}")
+        return None
+
+
+def index_get_meta(conn, key):
+    """Get a value from the index meta table."""
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+def index_set_meta(conn, key, value):
+    """Set a value in the index meta table. Must be called inside a transaction."""
+    conn.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value))
+    )
+
+
+def index_upsert(conn, entry):
+    """Insert or update a package entry. Must be called inside a transaction."""
+    metadata = entry.get("metadata")
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO packages
+            (name, path, metadata, origin, install_time, size, install_type)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            entry["name"],
+            entry["path"],
+            json.dumps(metadata) if metadata is not None else None,
+            entry.get("origin"),
+            entry.get("install_time"),
+            entry.get("size"),
+            entry.get("install_type"),
+        ),
+    )
+
+
+def index_set_size(conn, name, size):
+    """Update the size of a package entry. Must be called inside a transaction."""
+    conn.execute("UPDATE packages SET size = ? WHERE name = ?", (size, name))
+
+
+def index_delete(conn, name):
+    """Remove a package entry. Must be called inside a transaction."""
+    conn.execute("DELETE FROM packages WHERE name = ?", (name,))
+
+
+def index_clear(conn):
+    """Remove every package entry. Must be called inside a transaction."""
+    conn.execute("DELETE FROM packages")
+
+
+def index_names(conn):
+    """Get the names of all indexed packages."""
+    return [row["name"] for row in conn.execute("SELECT name FROM packages")]
+
+
+def index_entries(
+    conn,
+    name=None,
+    origin=None,
+    min_size=None,
+    installed_before=None,
+    sort=None,
+    limit=None,
+):
+    """
+    Get indexed package entries as dictionaries.
+
+    Filters are evaluated by SQLite, so only matching rows are decoded.
+
+    :param name: Glob the package name must match, e.g. "lib*"
+    :param origin: Text the git origin URL must contain
+    :param min_size: Minimum size in bytes
+    :param installed_before: Timestamp the package must be installed before
+    :param sort: Sort order from INDEX_SORT_ORDERS, unsorted if None
+    :param limit: Maximum number of entries
+    """
+    conditions = []
+    parameters = []
+    if name is not None:
+        conditions.append("name GLOB ?")
+        parameters.append(name)
+    if origin is not None:
+        conditions.append("instr(origin, ?) > 0")
+        parameters.append(origin)
+    if min_size is not None:
+        conditions.append("size >= ?")
+        parameters.append(min_size)
+    if installed_before is not None:
+        conditions.append("install_time < ?")
+        parameters.append(installed_before)
+
+    query = "SELECT * FROM packages"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if sort is not None:
+        query += f" ORDER BY {INDEX_SORT_ORDERS[sort]}"
+    if limit is not None:
+        query += " LIMIT ?"
+        parameters.append(limit)
+
+    entries = []
+    for row in conn.execute(query, parameters):
+        entries.append(
+            {
+                "name": row["name"],
+                "path": row["path"],
+                "metadata": (
+                    json.loads(row["metadata"]) if row["metadata"] is not None else None
+                ),
+                "origin": row["origin"],
+                "install_time": row["install_time"],
+                "size": row["size"],
+                "install_type": row["install_type"],
+            }
+        )
+    return entries
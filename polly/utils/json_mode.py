@@ -0,0 +1,54 @@
+"""
+JSON mode handling for Polly CLI.
+This module manages the global JSON mode state. In JSON mode, commands write
+one JSON object per line to stdout as soon as each result is ready, and
+everything else Polly prints goes to stderr, so stdout can be consumed
+incrementally as NDJSON.
+"""
+
+import sys
+import json
+import threading
+
+# Global JSON mode state
+_json_mode = False
+_json_stream = None
+_json_lock = threading.Lock()
+
+
+def set_json_mode(enabled):
+    """
+    Set the global JSON mode state.
+
+    Enabling it moves sys.stdout to stderr, only print_json writes to the
+    real stdout.
+    """
+    global _json_mode, _json_stream
+    _json_mode = enabled
+
+    if enabled and _json_stream is None:
+        _json_stream = sys.stdout
+        sys.stdout = sys.stderr
+    elif not enabled and _json_stream is not None:
+        sys.stdout = _json_stream
+        _json_stream = None
+
+
+def is_json_mode():
+    """Check if JSON mode is enabled."""
+    return _json_mode
+
+
+def print_json(record):
+    """
+    Write one JSON object on its own line, flushed right away.
+
+    Safe to call from several threads, lines are never interleaved.
+
+    :param record: Dictionary to write, with a "type" key naming the record
+    """
+    line = json.dumps(record, default=str)
+    with _json_lock:
+        stream = _json_stream or sys.stdout
+        stream.write(line + "\n")
+        stream.flush()
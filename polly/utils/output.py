@@ -0,0 +1,94 @@
+"""
+Output capture handling for Polly.
+This module lets worker threads buffer what they print, so the output of
+operations running in parallel is written out in one piece instead of being
+interleaved line by line.
+"""
+
+import io
+import sys
+import threading
+from contextlib import contextmanager
+
+# Global capture state
+_write_lock = threading.Lock()
+_thread_buffers = {}
+_original_streams = {}
+_active_captures = 0
+
+
+class _ThreadRoutedStream:
+    """Stream that sends writes from capturing threads to their buffer."""
+
+    def __init__(self, name, stream):
+        self._name = name
+        self._stream = stream
+
+    def write(self, text):
+        buffer = _thread_buffers.get((threading.get_ident(), self._name))
+        if buffer is not None:
+            return buffer.write(text)
+        with _write_lock:
+            return self._stream.write(text)
+
+    def flush(self):
+        if (threading.get_ident(), self._name) not in _thread_buffers:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _install_routing():
+    """Route sys.stdout and sys.stderr through thread aware streams."""
+    global _active_captures
+    with _write_lock:
+        if _active_captures == 0:
+            _original_streams["stdout"] = sys.stdout
+            _original_streams["stderr"] = sys.stderr
+            sys.stdout = _ThreadRoutedStream("stdout", sys.stdout)
+            sys.stderr = _ThreadRoutedStream("stderr", sys.stderr)
+        _active_captures += 1
+
+
+def _remove_routing():
+    """Restore the original streams once no thread is capturing anymore."""
+    global _active_captures
+    with _write_lock:
+        _active_captures -= 1
+        if _active_captures == 0:
+            sys.stdout = _original_streams.pop("stdout")
+            sys.stderr = _original_streams.pop("stderr")
+
+
+@contextmanager
+def capture_thread_output(write=True):
+    """
+    Buffer everything the current thread prints until the block ends.
+
+    The buffered output is written in one piece when the block exits, while
+    other threads keep printing directly.
+
+    :param write: Whether to write the buffered output when the block exits,
+                  otherwise the caller takes it from the yielded buffers
+    """
+    thread_id = threading.get_ident()
+    buffers = {"stdout": io.StringIO(), "stderr": io.StringIO()}
+
+    _install_routing()
+    _thread_buffers[(thread_id, "stdout")] = buffers["stdout"]
+    _thread_buffers[(thread_id, "stderr")] = buffers["stderr"]
+
+    try:
+        yield buffers
+    finally:
+        del _thread_buffers[(thread_id, "stdout")]
+        del _thread_buffers[(thread_id, "stderr")]
+
+        with _write_lock:
+            for name, buffer in buffers.items() if write else ():
+                stream = _original_streams[name]
+                stream.write(buffer.getvalue())
+                stream.flush()
+
+        _remove_routing()
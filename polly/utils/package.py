@@ -1,86 +1,477 @@
 import os
 import json
+import heapq
+import sqlite3
+from fnmatch import fnmatchcase
 from datetime import datetime
-from .filesystem import get_directory_size, file_exists
+from .filesystem import (
+    get_directory_size,
+    file_exists,
+    set_size_cache_dir,
+    invalidate_size_cache,
+)
+from .git import get_git_origin
+from polly.config import get_config_value
+from .debug import debug_print
+from .profiling import phase
+from .index import (
+    get_state_directory,
+    open_index,
+    index_get_meta,
+    index_set_meta,
+    index_upsert,
+    index_set_size,
+    index_delete,
+    index_clear,
+    index_names,
+    index_entries,
+)
 
 
-PACKAGES_DIR = "/opt/pollypackages"
+PACKAGES_DIR = get_config_value("packages_dir", "/opt/pollypackages")
+METADATA_FILENAME = ".install.polly.json"
 
+# Package fields resolve_package can load, besides the name and path
+PACKAGE_FIELDS = ("metadata", "origin", "install_time", "size")
+
+# Persist directory size caches next to the package index
+set_size_cache_dir(os.path.join(get_state_directory(PACKAGES_DIR), "sizes"))
+
+
+def _format_install_date(install_time):
+    """Format an install timestamp the way Polly displays it."""
+    return datetime.fromtimestamp(install_time).strftime("%Y-%m-%d %H:%M:%S")
 
-def get_installed_packages():
-    """Get list of installed packages with their metadata."""
-    if not os.path.exists(PACKAGES_DIR):
-        return []
 
-    packages = []
+@phase("package scan")
+def _list_package_directories():
+    """Get the names of all directories in PACKAGES_DIR that hold a package."""
+    names = []
     for item in os.listdir(PACKAGES_DIR):
+        if item.startswith("."):
+            continue
         package_path = os.path.join(PACKAGES_DIR, item)
-        if os.path.isdir(package_path):
-            metadata_file = os.path.join(package_path, ".install.polly.json")
-            if os.path.exists(metadata_file):
-                try:
-                    with open(metadata_file, "r") as f:
-                        metadata = json.load(f)
-
-                    # Get package information
-                    size = get_directory_size(package_path)
-                    install_time = os.path.getctime(package_path)
-                    install_date = datetime.fromtimestamp(install_time).strftime(
-                        "%Y-%m-%d %H:%M:%S"
-                    )
-
-                    packages.append(
-                        {
-                            "name": item,
-                            "path": package_path,
-                            "metadata": metadata,
-                            "size": size,
-                            "install_date": install_date,
-                            "install_type": metadata.get("installType", "Unknown"),
-                        }
-                    )
-                except:
-                    # If metadata is invalid, still include package but with limited info
-                    size = get_directory_size(package_path)
-                    install_time = os.path.getctime(package_path)
-                    install_date = datetime.fromtimestamp(install_time).strftime(
-                        "%Y-%m-%d %H:%M:%S"
-                    )
-
-                    packages.append(
-                        {
-                            "name": item,
-                            "path": package_path,
-                            "metadata": None,
-                            "size": size,
-                            "install_date": install_date,
-                            "install_type": "Invalid",
-                        }
-                    )
-
-    return sorted(packages, key=lambda x: x["name"].lower())
+        if os.path.isdir(package_path) and os.path.exists(
+            os.path.join(package_path, METADATA_FILENAME)
+        ):
+            names.append(item)
+    return names
+
+
+def _scan_package(package_name, fields=PACKAGE_FIELDS):
+    """
+    Read a package from disk and build its index entry.
+
+    Only the requested fields are read, the others are None.
+
+    :param package_name: Package name
+    :param fields: Fields to read, from PACKAGE_FIELDS
+    :return: Index entry, or None if the package isn't installed
+    """
+    package_path = os.path.join(PACKAGES_DIR, package_name)
+    metadata_file = os.path.join(package_path, METADATA_FILENAME)
+    if not os.path.isdir(package_path) or not os.path.exists(metadata_file):
+        return None
+
+    entry = {
+        "name": package_name,
+        "path": package_path,
+        "metadata": None,
+        "origin": None,
+        "install_time": None,
+        "size": None,
+        "install_type": None,
+    }
+
+    if "metadata" in fields:
+        try:
+            with open(metadata_file, "r") as f:
+                entry["metadata"] = json.load(f)
+            entry["install_type"] = entry["metadata"].get("installType", "Unknown")
+        except:
+            # If metadata is invalid, still include package but with limited info
+            entry["metadata"] = None
+            entry["install_type"] = "Invalid"
+    if "origin" in fields:
+        entry["origin"] = get_git_origin(package_path)
+    if "install_time" in fields:
+        entry["install_time"] = os.path.getctime(package_path)
+    if "size" in fields:
+        entry["size"] = get_directory_size(package_path)
+
+    return entry
+
+
+def _entry_to_package(entry, include_size=True):
+    """Convert an index entry to the package dictionary used by commands."""
+    return {
+        "name": entry["name"],
+        "path": entry["path"],
+        "metadata": entry["metadata"],
+        "size": entry["size"] if include_size else None,
+        "install_date": (
+            _format_install_date(entry["install_time"])
+            if entry["install_time"] is not None
+            else None
+        ),
+        "install_type": entry["install_type"],
+        "origin": entry["origin"],
+        "install_time": entry["install_time"],
+    }
+
+
+def _get_packages_dir_signature():
+    """Get a signature that changes whenever packages are added or removed."""
+    stat = os.stat(PACKAGES_DIR)
+    return f"{stat.st_ino}:{stat.st_mtime_ns}"
+
+
+@phase("package scan")
+def _sync_package_index(conn):
+    """
+    Bring the index in line with the package directories on disk.
+
+    Adding or removing a package directory changes the mtime of PACKAGES_DIR,
+    so when the stored signature still matches nothing needs to be scanned.
+    """
+    signature = _get_packages_dir_signature()
+    if index_get_meta(conn, "packages_dir_signature") == signature:
+        return
+
+    debug_print("Package index is out of date, reconciling with filesystem")
+
+    on_disk = set(_list_package_directories())
+    indexed = set(index_names(conn))
+
+    with conn:
+        for name in indexed - on_disk:
+            index_delete(conn, name)
+        for name in on_disk - indexed:
+            entry = _scan_package(name)
+            if entry:
+                index_upsert(conn, entry)
+        index_set_meta(conn, "packages_dir_signature", signature)
+
+
+def _revalidate_size(entry, changed):
+    """
+    Bring the indexed size of a package entry up to date.
+
+    Changing files inside a package doesn't change PACKAGES_DIR, so stored
+    sizes can be out of date. get_directory_size only lists the directories
+    that changed since it last ran. Changed sizes are added to ``changed``.
+    """
+    size = get_directory_size(entry["path"])
+    if size != entry["size"]:
+        entry["size"] = changed[entry["name"]] = size
+
+
+def _save_indexed_sizes(conn, sizes):
+    """Write changed package sizes back to the index."""
+    debug_print(f"Updating {len(sizes)} out of date package size(s) in index")
+    with conn:
+        for package_name, size in sizes.items():
+            index_set_size(conn, package_name, size)
+
+
+def _refresh_indexed_sizes(conn, name=None, origin=None, installed_before=None):
+    """Revalidate the indexed sizes of every package passing the other filters."""
+    changed = {}
+    entries = index_entries(
+        conn, name=name, origin=origin, installed_before=installed_before
+    )
+    for entry in entries:
+        _revalidate_size(entry, changed)
+
+    if changed:
+        _save_indexed_sizes(conn, changed)
+
+
+# Sort key of each package sort, and whether it sorts largest first
+PACKAGE_SORT_KEYS = {
+    "name": (lambda entry: entry["name"].lower(), False),
+    "size": (lambda entry: entry["size"] or 0, True),
+    "date": (lambda entry: entry["install_time"], True),
+}
+
+
+def _iter_scanned_packages(
+    include_size=True,
+    name=None,
+    origin=None,
+    min_size=None,
+    installed_before=None,
+    sort="name",
+    limit=None,
+):
+    """
+    Yield installed packages by scanning every package directory.
+
+    Cheap filters run first, so only packages that pass them have their size
+    computed. A limited sort keeps a heap of the top packages instead of
+    sorting all of them.
+    """
+    needs_size = include_size or min_size is not None or sort == "size"
+    names = _list_package_directories()
+    if name is not None:
+        names = [item for item in names if fnmatchcase(item, name)]
+
+    def iter_matching_entries():
+        for item in names:
+            entry = _scan_package(
+                item, fields=("metadata", "origin", "install_time")
+            )
+            if entry is None:
+                continue
+            if origin is not None and origin not in (entry["origin"] or ""):
+                continue
+            if (
+                installed_before is not None
+                and entry["install_time"] >= installed_before
+            ):
+                continue
+            if needs_size:
+                entry["size"] = get_directory_size(entry["path"])
+            if min_size is not None and entry["size"] < min_size:
+                continue
+            yield entry
+
+    key, largest_first = PACKAGE_SORT_KEYS[sort]
+    entries = iter_matching_entries()
+    if limit is not None:
+        select = heapq.nlargest if largest_first else heapq.nsmallest
+        entries = select(limit, entries, key=key)
+    else:
+        entries = sorted(entries, key=key, reverse=largest_first)
+
+    for entry in entries:
+        yield _entry_to_package(entry, include_size)
+
+
+def iter_installed_packages(
+    include_size=True,
+    name=None,
+    origin=None,
+    min_size=None,
+    installed_before=None,
+    sort="name",
+    limit=None,
+):
+    """
+    Yield installed packages with their metadata, sorted by name by default.
+
+    Packages are read from the package index when it is available, where the
+    filters, sort and limit are evaluated by SQLite. Shown sizes are
+    revalidated as each package is yielded. Filtering or sorting on size
+    revalidates the candidates first, since every size is needed before the
+    first row. Otherwise each package directory is scanned.
+
+    :param include_size: Whether to include the package size
+    :param name: Glob the package name must match, e.g. "lib*"
+    :param origin: Text the git origin URL must contain
+    :param min_size: Minimum size in bytes
+    :param installed_before: Timestamp the package must be installed before
+    :param sort: Sort order, "name", "size" (largest first) or "date"
+                 (newest first)
+    :param limit: Maximum number of packages
+    """
+    if not os.path.exists(PACKAGES_DIR):
+        return
+
+    query = {
+        "name": name,
+        "origin": origin,
+        "min_size": min_size,
+        "installed_before": installed_before,
+        "sort": sort,
+        "limit": limit,
+    }
+
+    with phase("package scan"):
+        conn = open_index(PACKAGES_DIR)
+    if conn is None:
+        yield from _iter_scanned_packages(include_size, **query)
+        return
+
+    queries_size = min_size is not None or sort == "size"
+    try:
+        with phase("package scan"):
+            _sync_package_index(conn)
+        if queries_size:
+            _refresh_indexed_sizes(conn, name, origin, installed_before)
+        with phase("package scan"):
+            entries = index_entries(conn, **query)
+    except sqlite3.Error as e:
+        debug_print(f"Package index could not be read, scanning instead: {e}")
+        entries = None
+    finally:
+        conn.close()
+
+    if entries is None:
+        yield from _iter_scanned_packages(include_size, **query)
+        return
+
+    changed = {}
+    try:
+        for entry in entries:
+            if include_size and not queries_size:
+                _revalidate_size(entry, changed)
+            yield _entry_to_package(entry, include_size)
+    finally:
+        # Also reached when the caller stops early, e.g. after the first rows
+        if changed:
+            _store_revalidated_sizes(changed)
+
+
+def _store_revalidated_sizes(sizes):
+    """Write sizes revalidated while listing back to the index."""
+    conn = open_index(PACKAGES_DIR)
+    if conn is None:
+        return
+
+    try:
+        _save_indexed_sizes(conn, sizes)
+    except sqlite3.Error as e:
+        debug_print(f"Failed to update package sizes in index: {e}")
+    finally:
+        conn.close()
+
+
+def get_installed_packages(include_size=True):
+    """Get list of installed packages with their metadata."""
+    return list(iter_installed_packages(include_size))
+
+
+def record_package(package_name):
+    """
+    Record a freshly installed or upgraded package in the package index.
+
+    Index failures are never fatal, the index is rebuilt from disk on demand.
+    """
+    conn = open_index(PACKAGES_DIR)
+    if conn is None:
+        return False
+
+    try:
+        entry = _scan_package(package_name)
+        with conn:
+            if entry:
+                index_upsert(conn, entry)
+            else:
+                index_delete(conn, package_name)
+        _sync_package_index(conn)
+        return True
+    except (OSError, sqlite3.Error) as e:
+        debug_print(f"Failed to record {package_name} in package index: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def forget_package(package_name):
+    """Remove a package from the package index."""
+    conn = open_index(PACKAGES_DIR)
+    if conn is None:
+        return False
+
+    try:
+        with conn:
+            index_delete(conn, package_name)
+        _sync_package_index(conn)
+        return True
+    except (OSError, sqlite3.Error) as e:
+        debug_print(f"Failed to remove {package_name} from package index: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def rebuild_package_index():
+    """
+    Rebuild the package index from the filesystem.
+
+    :return: Number of packages indexed
+    :raises: OSError if the index can't be written
+    """
+    if not os.path.exists(PACKAGES_DIR):
+        return 0
+
+    conn = open_index(PACKAGES_DIR)
+    if conn is None:
+        raise OSError(f"Unable to open package index in {PACKAGES_DIR}")
+
+    try:
+        names = _list_package_directories()
+        for name in names:
+            invalidate_size_cache(os.path.join(PACKAGES_DIR, name))
+
+        entries = [_scan_package(name) for name in names]
+        entries = [entry for entry in entries if entry]
+        with conn:
+            index_clear(conn)
+            for entry in entries:
+                index_upsert(conn, entry)
+            index_set_meta(
+                conn, "packages_dir_signature", _get_packages_dir_signature()
+            )
+        return len(entries)
+    except sqlite3.Error as e:
+        raise OSError(f"Unable to write package index: {e}")
+    finally:
+        conn.close()
+
+
+def is_valid_package_name(package_name):
+    """Check that a package name names a directory directly in PACKAGES_DIR."""
+    return (
+        bool(package_name)
+        and not package_name.startswith(".")
+        and "/" not in package_name
+        and os.sep not in package_name
+        and "\0" not in package_name
+    )
+
+
+def resolve_package(package_name, fields=PACKAGE_FIELDS):
+    """
+    Get one package by reading only its own directory.
+
+    Only the requested fields are loaded, the others are None, so resolving a
+    package costs the same however many packages are installed.
+
+    :param package_name: Package name
+    :param fields: Fields to load, from PACKAGE_FIELDS
+    :return: Package dictionary like iter_installed_packages yields, or None
+             if the package isn't installed
+    """
+    if not is_valid_package_name(package_name):
+        return None
+
+    entry = _scan_package(package_name, fields)
+    if entry is None:
+        return None
+    return _entry_to_package(entry)
 
 
 def get_package_by_name(package_name):
     """Get a specific package by name."""
-    packages = get_installed_packages()
-    for package in packages:
-        if package["name"] == package_name:
-            return package
-    return None
+    return resolve_package(package_name)
 
 
 def package_exists(package_name):
     """Check if a package is installed."""
+    if not is_valid_package_name(package_name):
+        return False
     package_path = os.path.join(PACKAGES_DIR, package_name)
-    metadata_file = os.path.join(package_path, ".install.polly.json")
+    metadata_file = os.path.join(package_path, METADATA_FILENAME)
     return os.path.exists(package_path) and os.path.exists(metadata_file)
 
 
 def get_package_names():
     """Get list of installed package names."""
-    packages = get_installed_packages()
-    return [package["name"] for package in packages]
+    if not os.path.exists(PACKAGES_DIR):
+        return []
+    return sorted(_list_package_directories(), key=str.lower)
 
 
 def validate_metadata_file(metadata_file):
@@ -102,6 +493,23 @@ def validate_metadata_file(metadata_file):
         if not isinstance(metadata["install"], list):
             return False, "install must be a list of commands"
 
+        # Validate optional clone options
+        if "clone" in metadata:
+            clone = metadata["clone"]
+            if not isinstance(clone, dict):
+                return False, "clone must be an object"
+            depth = clone.get("depth")
+            if depth is not None and (not isinstance(depth, int) or depth < 1):
+                return False, "clone.depth must be a positive integer"
+            if "filter" in clone and not isinstance(clone["filter"], str):
+                return False, "clone.filter must be a string"
+
+        if not isinstance(metadata.get("persistentShell", False), bool):
+            return False, "persistentShell must be true or false"
+
+        if not isinstance(metadata.get("installInPlace", False), bool):
+            return False, "installInPlace must be true or false"
+
         return True, "Valid metadata"
 
     except json.JSONDecodeError as e:
@@ -110,9 +518,10 @@ def validate_metadata_file(metadata_file):
         return False, f"Error validating metadata: {e}"
 
 
+@phase("metadata load")
 def load_package_metadata(package_path):
     """Load metadata for a package."""
-    metadata_file = os.path.join(package_path, ".install.polly.json")
+    metadata_file = os.path.join(package_path, METADATA_FILENAME)
     try:
         with open(metadata_file, "r") as f:
             return json.load(f)
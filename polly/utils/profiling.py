@@ -0,0 +1,182 @@
+"""
+Profile mode handling for Polly CLI.
+This module manages the global profile mode state, and times the phases of a
+command (package scan, metadata load, size walk, git calls, install commands
+and rendering) so a profile shows where the time went.
+"""
+
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from .trace import span, is_trace_mode
+
+# Global profile mode state
+_profile_mode = False
+
+# Phase name to [exclusive seconds, calls], summed over all threads
+_phase_totals = {}
+_phase_lock = threading.Lock()
+_phase_stack = threading.local()
+
+# Phases in the order they are reported
+PHASES = (
+    "package scan",
+    "metadata load",
+    "size walk",
+    "git calls",
+    "install commands",
+    "rendering",
+)
+
+# Number of functions listed in the cProfile summary
+PROFILE_TOP_FUNCTIONS = 15
+
+
+def set_profile_mode(enabled):
+    """Set the global profile mode state."""
+    global _profile_mode
+    _profile_mode = enabled
+
+
+def is_profile_mode():
+    """Check if profile mode is enabled."""
+    return _profile_mode
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a phase of the running command when profiling.
+
+    Phases can nest, a phase's time excludes the phases nested inside it, so
+    every second is counted once per thread. When tracing, the phase is also
+    recorded as a trace span.
+    """
+    if is_trace_mode():
+        with span(name):
+            with _timed_phase(name):
+                yield
+    else:
+        with _timed_phase(name):
+            yield
+
+
+@contextmanager
+def _timed_phase(name):
+    """Add the exclusive time of a phase to the phase totals when profiling."""
+    if not _profile_mode:
+        yield
+        return
+
+    stack = getattr(_phase_stack, "frames", None)
+    if stack is None:
+        stack = _phase_stack.frames = []
+
+    frame = [name, time.perf_counter(), 0.0]
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+        elapsed = time.perf_counter() - frame[1]
+        if stack:
+            stack[-1][2] += elapsed
+
+        with _phase_lock:
+            totals = _phase_totals.setdefault(name, [0.0, 0])
+            totals[0] += elapsed - frame[2]
+            totals[1] += 1
+
+
+def get_phase_totals():
+    """Get a copy of the phase totals as name to (seconds, calls)."""
+    with _phase_lock:
+        return {name: tuple(totals) for name, totals in _phase_totals.items()}
+
+
+def reset_phase_totals():
+    """Forget all recorded phase times."""
+    with _phase_lock:
+        _phase_totals.clear()
+
+
+def format_phase_report(wall_time, peak_memory=None):
+    """
+    Format the phase breakdown of a profiled command.
+
+    Phases running in worker threads are summed over the threads, so they
+    can add up to more than the wall time.
+    """
+    totals = get_phase_totals()
+    names = [name for name in PHASES if name in totals]
+    names += sorted(name for name in totals if name not in PHASES)
+
+    lines = [f"Profile: {wall_time * 1000:.1f} ms wall time"]
+    if peak_memory is not None:
+        lines[0] += f", {peak_memory / (1024 * 1024):.1f} MB peak traced memory"
+
+    lines.append(f"  {'phase':<20}{'time':>12}{'calls':>8}{'share':>8}")
+    accounted = 0.0
+    for name in names:
+        seconds, calls = totals[name]
+        accounted += seconds
+        share = seconds / wall_time * 100 if wall_time else 0
+        lines.append(f"  {name:<20}{seconds * 1000:>9.1f} ms{calls:>8}{share:>7.1f}%")
+
+    other = max(0.0, wall_time - accounted)
+    share = other / wall_time * 100 if wall_time else 0
+    lines.append(f"  {'other':<20}{other * 1000:>9.1f} ms{'':>8}{share:>7.1f}%")
+    if accounted > wall_time:
+        lines.append("  (phases ran in parallel threads, their times overlap)")
+    return "\n".join(lines)
+
+
+def profile_call(function, output_path=None):
+    """
+    Run a function under cProfile and tracemalloc, then report where time went.
+
+    The report goes to stderr so simple mode output stays parseable. The
+    report is printed even when the function exits with SystemExit.
+
+    :param function: Function to call without arguments
+    :param output_path: File to dump the cProfile stats to, for pstats or
+                        snakeviz (optional)
+    :return: Return value of the function
+    """
+    # Only profiled runs pay for importing the profilers
+    import io
+    import pstats
+    import cProfile
+    import tracemalloc
+
+    reset_phase_totals()
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    try:
+        profiler.enable()
+        try:
+            return function()
+        finally:
+            profiler.disable()
+    finally:
+        wall_time = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats_output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stats_output)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+
+        print(file=sys.stderr)
+        print(format_phase_report(wall_time, peak_memory), file=sys.stderr)
+        print(stats_output.getvalue().rstrip(), file=sys.stderr)
+
+        if output_path:
+            try:
+                profiler.dump_stats(output_path)
+                print(f"Profile written to {output_path}", file=sys.stderr)
+            except OSError as e:
+                print(f"Could not write profile to {output_path}: {e}", file=sys.stderr)
@@ -0,0 +1,213 @@
+"""
+Trace handling for Polly CLI.
+This module records a span for every subprocess and phase while tracing is
+enabled, and writes them as Chrome trace events (chrome://tracing, Perfetto)
+or as OTLP-style JSON lines, to see concurrency and tail latency.
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Global trace state
+_trace_mode = False
+_spans = []
+_spans_lock = threading.Lock()
+_thread_state = threading.local()
+
+# Trace files ending with this are written as OTLP-style JSON lines
+OTLP_SUFFIX = ".jsonl"
+
+
+def set_trace_mode(enabled):
+    """Set the global trace mode state."""
+    global _trace_mode
+    _trace_mode = enabled
+
+
+def is_trace_mode():
+    """Check if trace mode is enabled."""
+    return _trace_mode
+
+
+def _get_stack():
+    """Get the current thread's stack of open span ids."""
+    stack = getattr(_thread_state, "stack", None)
+    if stack is None:
+        stack = _thread_state.stack = []
+    return stack
+
+
+def _get_context():
+    """Get the attributes every span of the current thread carries."""
+    context = getattr(_thread_state, "context", None)
+    if context is None:
+        context = _thread_state.context = {}
+    return context
+
+
+@contextmanager
+def trace_context(**attributes):
+    """Add attributes, e.g. package, to every span the current thread records."""
+    context = _get_context()
+    previous = dict(context)
+    context.update(attributes)
+    try:
+        yield
+    finally:
+        context.clear()
+        context.update(previous)
+
+
+@contextmanager
+def span(name, category="phase", **attributes):
+    """
+    Record a span while tracing.
+
+    The yielded dictionary holds the span attributes, add to it to record
+    results such as an exit code.
+
+    :param name: Span name, e.g. a phase or a command description
+    :param category: Span category, phase or subprocess
+    """
+    attributes = dict(_get_context(), **attributes)
+    if not _trace_mode:
+        yield attributes
+        return
+
+    stack = _get_stack()
+    span_id = os.urandom(8).hex()
+    parent_id = stack[-1] if stack else None
+    stack.append(span_id)
+
+    start_ns = time.time_ns()
+    start_counter = time.perf_counter_ns()
+    try:
+        yield attributes
+    finally:
+        duration_ns = time.perf_counter_ns() - start_counter
+        stack.pop()
+
+        with _spans_lock:
+            _spans.append(
+                {
+                    "name": name,
+                    "category": category,
+                    "span_id": span_id,
+                    "parent_id": parent_id,
+                    "start_ns": start_ns,
+                    "duration_ns": duration_ns,
+                    "thread_id": threading.get_native_id(),
+                    "attributes": {
+                        key: value
+                        for key, value in attributes.items()
+                        if value is not None
+                    },
+                }
+            )
+
+
+def get_spans():
+    """Get a copy of the recorded spans, ordered by start time."""
+    with _spans_lock:
+        return sorted(_spans, key=lambda recorded: recorded["start_ns"])
+
+
+def clear_spans():
+    """Forget all recorded spans."""
+    with _spans_lock:
+        _spans.clear()
+
+
+def format_chrome_trace(spans):
+    """Format spans as a Chrome trace-event document."""
+    pid = os.getpid()
+    origin_ns = spans[0]["start_ns"] if spans else 0
+
+    events = []
+    for recorded in spans:
+        events.append(
+            {
+                "name": recorded["name"],
+                "cat": recorded["category"],
+                "ph": "X",
+                "ts": (recorded["start_ns"] - origin_ns) / 1000,
+                "dur": recorded["duration_ns"] / 1000,
+                "pid": pid,
+                "tid": recorded["thread_id"],
+                "args": recorded["attributes"],
+            }
+        )
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _otlp_value(value):
+    """Convert an attribute value to an OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def format_otlp_spans(spans):
+    """Format spans as OTLP-style span dictionaries sharing one trace id."""
+    trace_id = os.urandom(16).hex()
+
+    formatted = []
+    for recorded in spans:
+        attributes = dict(recorded["attributes"])
+        attributes["thread_id"] = recorded["thread_id"]
+        exit_code = attributes.get("exit_code")
+        end_ns = recorded["start_ns"] + recorded["duration_ns"]
+
+        formatted.append(
+            {
+                "traceId": trace_id,
+                "spanId": recorded["span_id"],
+                "parentSpanId": recorded["parent_id"] or "",
+                "name": recorded["name"],
+                "kind": "SPAN_KIND_INTERNAL",
+                "startTimeUnixNano": str(recorded["start_ns"]),
+                "endTimeUnixNano": str(end_ns),
+                "attributes": [
+                    {"key": f"polly.{key}", "value": _otlp_value(value)}
+                    for key, value in attributes.items()
+                ],
+                "status": {
+                    "code": (
+                        "STATUS_CODE_ERROR"
+                        if exit_code not in (None, 0)
+                        else "STATUS_CODE_UNSET"
+                    )
+                },
+            }
+        )
+    return formatted
+
+
+def write_trace(output_path):
+    """
+    Write the recorded spans to a file.
+
+    Files ending in .jsonl get one OTLP-style span per line, anything else
+    gets a Chrome trace-event JSON document.
+
+    :return: Number of spans written
+    :raises: OSError if the file can't be written
+    """
+    spans = get_spans()
+
+    with open(output_path, "w") as f:
+        if output_path.endswith(OTLP_SUFFIX):
+            for formatted in format_otlp_spans(spans):
+                f.write(json.dumps(formatted) + "\n")
+        else:
+            json.dump(format_chrome_trace(spans), f)
+
+    return len(spans)
@@ -0,0 +1,318 @@
+"""
+Startup and per-command latency benchmarks for Polly.
+This script measures the cold-start wall time and import time of the CLI
+commands on a local fixture with the network stubbed out, writes the results
+as JSON and flags regressions against a stored baseline.
+
+Usage:
+    python tests/benchmarks/bench_commands.py
+    python tests/benchmarks/bench_commands.py --output results.json
+    python tests/benchmarks/bench_commands.py --save-baseline tests/benchmarks/baseline.json
+
+The exit status is 1 when a command regressed against the baseline.
+
+Absolute timings only mean something on the machine that measured them, so
+every run also times a bare interpreter start (python -c pass) and the
+baseline is compared through each command's time relative to it. The stored
+baseline.json can then be checked on any host. For tighter thresholds, save
+a baseline for the host itself and pass it with --baseline.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+from fixtures import create_fixture, get_fixture_env
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+POLLY_MAIN = os.path.join(REPO_ROOT, "polly", "main.py")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Benchmarked commands, the first fixture package stands in for {package}
+COMMANDS = {
+    "help": ["--simple", "help"],
+    "list": ["--simple", "list"],
+    "inspect": ["--simple", "inspect", "{package}"],
+    "upgrade_check": ["--simple", "upgrade", "--check-only"],
+}
+
+# Measured alongside the commands, their times are compared relative to it
+REFERENCE_COMMAND = ["-c", "pass"]
+
+# A command regressed when it is this much slower than the baseline...
+DEFAULT_THRESHOLD = 0.25
+# ...and slower by at least this many milliseconds, to ignore timer noise
+MIN_REGRESSION_MS = 5.0
+
+
+def run_command(args, env, importtime=False, script=POLLY_MAIN):
+    """
+    Run Polly once in a fresh interpreter.
+
+    :param script: Script run with the arguments, None to pass them straight
+                   to the interpreter
+    :return: Tuple of (wall time in ms, total import time in ms or None)
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ([script] if script else []) + args
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        command,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"polly {' '.join(args)} failed with {result.returncode}: {result.stderr}"
+        )
+
+    import_ms = None
+    if importtime:
+        import_ms = parse_import_time(result.stderr)
+    return wall_ms, import_ms
+
+
+def parse_import_time(stderr):
+    """Sum the self times reported by -X importtime, in milliseconds."""
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        try:
+            total_us += int(fields[0])
+        except (ValueError, IndexError):
+            # Header line
+            continue
+    return total_us / 1000
+
+
+def benchmark_command(args, env, repeat, warmup):
+    """
+    Benchmark one command.
+
+    :return: Dictionary of wall time and import time statistics in ms
+    """
+    for _ in range(warmup):
+        run_command(args, env)
+
+    wall_times = [run_command(args, env)[0] for _ in range(repeat)]
+    import_times = [run_command(args, env, importtime=True)[1] for _ in range(repeat)]
+
+    return {
+        "wall_ms": {
+            "median": round(statistics.median(wall_times), 2),
+            "min": round(min(wall_times), 2),
+            "max": round(max(wall_times), 2),
+        },
+        "import_ms": {
+            "median": round(statistics.median(import_times), 2),
+            "min": round(min(import_times), 2),
+        },
+        "runs": repeat,
+    }
+
+
+def measure_reference(env, repeat, warmup):
+    """
+    Time a bare interpreter start, the yardstick of the host's speed.
+
+    :return: Median wall time in ms
+    """
+    for _ in range(warmup):
+        run_command(REFERENCE_COMMAND, env, script=None)
+    wall_times = [
+        run_command(REFERENCE_COMMAND, env, script=None)[0] for _ in range(repeat)
+    ]
+    return round(statistics.median(wall_times), 2)
+
+
+def run_benchmarks(packages, repeat, warmup, commands=None):
+    """
+    Build a fixture and benchmark every command on it.
+
+    Each result also holds its medians divided by the reference time, see
+    measure_reference.
+
+    :return: Results dictionary, ready to be written as JSON
+    """
+    root = tempfile.mkdtemp(prefix="polly-bench-")
+    try:
+        fixture = create_fixture(root, count=packages)
+        env = get_fixture_env(fixture)
+        reference_ms = measure_reference(env, repeat, warmup)
+
+        results = {}
+        for name, args in COMMANDS.items():
+            if commands and name not in commands:
+                continue
+            args = [arg.replace("{package}", fixture["names"][0]) for arg in args]
+            result = benchmark_command(args, env, repeat, warmup)
+            for metric in ("wall_ms", "import_ms"):
+                result[metric]["relative"] = round(
+                    result[metric]["median"] / reference_ms, 3
+                )
+            results[name] = result
+
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "packages": packages,
+            "reference_ms": reference_ms,
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def compare_to_baseline(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare benchmark results with a baseline.
+
+    Medians relative to the reference time are compared, for both the wall
+    time and the import time, so a baseline from another host still applies.
+    The baseline's relative medians are scaled by the current reference time
+    to report them in milliseconds.
+
+    :return: List of regression dictionaries with command, metric, baseline,
+             current and ratio
+    """
+    regressions = []
+    reference_ms = current["reference_ms"]
+    for name, result in current["results"].items():
+        baseline_result = baseline.get("results", {}).get(name)
+        if not baseline_result:
+            continue
+
+        for metric in ("wall_ms", "import_ms"):
+            relative = baseline_result[metric].get("relative")
+            if not relative or relative <= 0:
+                continue
+            before = round(relative * reference_ms, 2)
+            after = result[metric]["median"]
+            if after > before * (1 + threshold) and after - before >= MIN_REGRESSION_MS:
+                regressions.append(
+                    {
+                        "command": name,
+                        "metric": metric,
+                        "baseline": before,
+                        "current": after,
+                        "ratio": round(after / before, 2),
+                    }
+                )
+    return regressions
+
+
+def print_results(current, regressions):
+    """Print a human readable summary to stderr."""
+    print(
+        f"reference (python -c pass): {current['reference_ms']:.1f} ms",
+        file=sys.stderr,
+    )
+    print(
+        f"{'command':<16}{'wall median':>14}{'wall min':>12}{'import median':>16}",
+        file=sys.stderr,
+    )
+    for name, result in current["results"].items():
+        print(
+            f"{name:<16}{result['wall_ms']['median']:>11.1f} ms"
+            f"{result['wall_ms']['min']:>9.1f} ms"
+            f"{result['import_ms']['median']:>13.1f} ms",
+            file=sys.stderr,
+        )
+
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression['command']} {regression['metric']}: "
+            f"{regression['baseline']} -> {regression['current']} "
+            f"({regression['ratio']}x)",
+            file=sys.stderr,
+        )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark Polly command latency")
+    parser.add_argument(
+        "--packages", type=int, default=20, help="Fixture packages (default: 20)"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Timed runs per command (default: 5)"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=1, help="Untimed runs per command (default: 1)"
+    )
+    parser.add_argument(
+        "--command",
+        action="append",
+        choices=sorted(COMMANDS),
+        help="Only benchmark this command, may be repeated",
+    )
+    parser.add_argument("--output", metavar="FILE", help="Write results to FILE")
+    parser.add_argument(
+        "--baseline",
+        metavar="FILE",
+        default=DEFAULT_BASELINE,
+        help="Baseline to compare against (default: tests/benchmarks/baseline.json)",
+    )
+    parser.add_argument(
+        "--save-baseline", metavar="FILE", help="Write the results as a new baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Allowed slowdown before flagging a regression (default: {DEFAULT_THRESHOLD})",
+    )
+    parsed_args = parser.parse_args(args)
+
+    current = run_benchmarks(
+        parsed_args.packages,
+        max(1, parsed_args.repeat),
+        max(0, parsed_args.warmup),
+        parsed_args.command,
+    )
+
+    regressions = []
+    if parsed_args.baseline and os.path.exists(parsed_args.baseline):
+        with open(parsed_args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(current, baseline, parsed_args.threshold)
+        current["baseline"] = parsed_args.baseline
+    current["regressions"] = regressions
+
+    output = json.dumps(current, indent=2)
+    if parsed_args.output:
+        with open(parsed_args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if parsed_args.save_baseline:
+        baseline = {key: current[key] for key in current if key != "regressions"}
+        baseline.pop("baseline", None)
+        with open(parsed_args.save_baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+
+    print_results(current, regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Scale benchmarks for Polly.
+This script measures how listing, inspecting and update checks scale with
+the number of installed packages and the size of their trees. Every
+configuration runs on its own generated fixture, in a fresh interpreter
+pointed at it through POLLY_PACKAGES_DIR, and reports wall time and the
+number of subprocesses started.
+
+Usage:
+    python tests/benchmarks/bench_scale.py
+    python tests/benchmarks/bench_scale.py --packages 10,100,500 --files 0,500
+    python tests/benchmarks/bench_scale.py --output scale.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+
+from fixtures import create_fixture, get_fixture_env
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+class SubprocessCounter:
+    """Count the subprocesses started while it is installed."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._original_init = subprocess.Popen.__init__
+
+    def install(self):
+        counter = self
+        original_init = self._original_init
+
+        def counting_init(popen, *args, **kwargs):
+            with counter._lock:
+                counter.count += 1
+            original_init(popen, *args, **kwargs)
+
+        subprocess.Popen.__init__ = counting_init
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+
+def _measure(operation, counter, repeat, setup=None):
+    """
+    Run an operation ``repeat`` times.
+
+    :return: Dictionary with the median and min time in ms and the
+             subprocess count of the last run
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        counter.reset()
+        start = time.perf_counter()
+        operation()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "median_ms": round(statistics.median(times), 2),
+        "min_ms": round(min(times), 2),
+        "subprocesses": counter.count,
+    }
+
+
+def run_worker(repeat):
+    """
+    Measure the operations in this interpreter and print the results as JSON.
+
+    The environment must already point Polly at a fixture.
+    """
+    counter = SubprocessCounter()
+    counter.install()
+
+    sys.path.insert(0, REPO_ROOT)
+    from polly.utils import get_installed_packages, PACKAGES_DIR
+    from polly.core import inspect_package, check_package_updates
+
+    state_dir = os.path.join(PACKAGES_DIR, ".polly")
+    names = sorted(name for name in os.listdir(PACKAGES_DIR) if name != ".polly")
+
+    def drop_state():
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    results = {
+        "list_cold": _measure(
+            lambda: get_installed_packages(), counter, repeat, setup=drop_state
+        ),
+        "list_warm": _measure(lambda: get_installed_packages(), counter, repeat),
+        "list_no_sizes": _measure(
+            lambda: get_installed_packages(include_size=False), counter, repeat
+        ),
+        "inspect": _measure(lambda: inspect_package(names[0]), counter, repeat),
+        "check_updates": _measure(lambda: check_package_updates(), counter, repeat),
+    }
+
+    json.dump(results, sys.stdout)
+
+
+def benchmark_configuration(packages, files, file_size, repeat):
+    """Build a fixture for one configuration and measure it in a fresh process."""
+    root = tempfile.mkdtemp(prefix="polly-scale-")
+    try:
+        fixture = create_fixture(
+            root, count=packages, files=files, file_size=file_size, invalid_every=10
+        )
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", str(repeat)],
+            env=get_fixture_env(fixture),
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Benchmark worker failed: {result.stderr}")
+        return json.loads(result.stdout)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _parse_counts(value):
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark how Polly scales")
+    parser.add_argument(
+        "--packages",
+        type=_parse_counts,
+        default=[10, 50, 200],
+        help="Comma separated package counts (default: 10,50,200)",
+    )
+    parser.add_argument(
+        "--files",
+        type=_parse_counts,
+        default=[0, 200],
+        help="Comma separated payload files per package (default: 0,200)",
+    )
+    parser.add_argument(
+        "--file-size",
+        type=int,
+        default=4096,
+        help="Payload file size in bytes (default: 4096)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per operation (default: 3)"
+    )
+    parser.add_argument("--output", metavar="FILE", help="Write results to FILE")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parsed_args = parser.parse_args(args)
+
+    if parsed_args.worker:
+        run_worker(parsed_args.worker)
+        return 0
+
+    runs = []
+    for files in parsed_args.files:
+        for packages in parsed_args.packages:
+            operations = benchmark_configuration(
+                packages, files, parsed_args.file_size, max(1, parsed_args.repeat)
+            )
+            runs.append({"packages": packages, "files": files, "results": operations})
+
+            summary = "  ".join(
+                f"{name} {result['median_ms']:.0f}ms/{result['subprocesses']}p"
+                for name, result in operations.items()
+            )
+            print(f"packages={packages:<5} files={files:<5} {summary}", file=sys.stderr)
+
+    output = json.dumps(
+        {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "file_size": parsed_args.file_size,
+            "runs": runs,
+        },
+        indent=2,
+    )
+    if parsed_args.output:
+        with open(parsed_args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
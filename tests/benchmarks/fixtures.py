@@ -0,0 +1,224 @@
+"""
+Benchmark fixtures for Polly.
+This module builds a throwaway packages directory where every package is a
+git clone of a local bare remote, so commands that talk to remotes run
+without network access.
+
+It can also be run on its own to build a fixture to experiment with:
+    python tests/benchmarks/fixtures.py /tmp/fleet --packages 500 --files 200
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# Commits are made with a fixed identity so the fixture doesn't depend on the
+# host's git config
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "Polly Benchmark",
+    "GIT_AUTHOR_EMAIL": "bench@polly.invalid",
+    "GIT_COMMITTER_NAME": "Polly Benchmark",
+    "GIT_COMMITTER_EMAIL": "bench@polly.invalid",
+    "GIT_CONFIG_NOSYSTEM": "1",
+    "GIT_TERMINAL_PROMPT": "0",
+}
+
+PACKAGE_METADATA = {
+    "install": ["echo installed > built.txt"],
+    "uninstall": ["rm -f built.txt"],
+    "version": "1.0",
+    "description": "Benchmark fixture package",
+}
+
+# Not valid JSON, for packages that should fail metadata validation
+INVALID_METADATA = '{"install": ["echo installed"], "version": '
+
+
+def _git(args, cwd=None):
+    """Run git quietly with the fixture identity."""
+    subprocess.run(
+        ["git"] + args,
+        cwd=cwd,
+        env=dict(os.environ, **GIT_ENV),
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def _commit_file(repo_path, filename, content, message):
+    """Write a file in a repository and commit it."""
+    with open(os.path.join(repo_path, filename), "w") as f:
+        f.write(content)
+    _git(["add", "-A"], cwd=repo_path)
+    _git(["commit", "-q", "-m", message], cwd=repo_path)
+
+
+def _write_tree(package_path, files, file_size, tree_depth):
+    """
+    Write untracked payload files into a package, like build output would be.
+
+    Files are spread over nested directories ``tree_depth`` levels deep.
+    """
+    payload = b"x" * file_size
+    for i in range(files):
+        parts = [f"d{(i >> (3 * level)) % 8}" for level in range(tree_depth)]
+        directory = os.path.join(package_path, "build", *parts)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file{i}.bin"), "wb") as f:
+            f.write(payload)
+
+
+def create_package(
+    root,
+    name,
+    behind=0,
+    files=0,
+    file_size=1024,
+    tree_depth=2,
+    invalid_metadata=False,
+):
+    """
+    Create one installed package backed by a local bare remote.
+
+    :param root: Fixture root directory
+    :param name: Package name
+    :param behind: Number of commits the remote is ahead of the package
+    :param files: Number of payload files written into the package tree
+    :param file_size: Size of each payload file in bytes
+    :param tree_depth: Directory nesting of the payload files
+    :param invalid_metadata: Whether .install.polly.json should be invalid
+    :return: Path of the installed package
+    """
+    work_path = os.path.join(root, "work", name)
+    remote_path = os.path.join(root, "remotes", f"{name}.git")
+    package_path = os.path.join(root, "packages", name)
+
+    _git(["init", "-q", "-b", "main", work_path])
+    _commit_file(
+        work_path,
+        ".install.polly.json",
+        INVALID_METADATA if invalid_metadata else json.dumps(PACKAGE_METADATA),
+        f"Initial {name}",
+    )
+    _commit_file(work_path, "README.md", f"# {name}\n", f"Add {name} readme")
+
+    _git(["clone", "-q", "--bare", work_path, remote_path])
+    _git(["clone", "-q", remote_path, package_path])
+
+    # Move the remote ahead of the installed clone
+    if behind:
+        _git(["remote", "add", "origin", remote_path], cwd=work_path)
+        for i in range(behind):
+            _commit_file(work_path, "CHANGES", f"{i}\n", f"Change {i + 1} on {name}")
+        _git(["push", "-q", "origin", "main"], cwd=work_path)
+
+    if files:
+        _write_tree(package_path, files, file_size, tree_depth)
+
+    return package_path
+
+
+def create_fixture(
+    root,
+    count=10,
+    behind_every=2,
+    behind=3,
+    files=0,
+    file_size=1024,
+    tree_depth=2,
+    invalid_every=0,
+):
+    """
+    Create a packages directory with ``count`` installed git packages.
+
+    :param root: Directory to build the fixture in, must be empty or missing
+    :param count: Number of packages
+    :param behind_every: Every Nth package has updates waiting (0 for none)
+    :param behind: Number of commits waiting on those packages
+    :param files: Number of payload files per package
+    :param file_size: Size of each payload file in bytes
+    :param tree_depth: Directory nesting of the payload files
+    :param invalid_every: Every Nth package has invalid metadata (0 for none)
+    :return: Dictionary with the fixture paths and package names
+    """
+    for directory in ("work", "remotes", "packages", "state"):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    names = [f"pkg{i:04d}" for i in range(1, count + 1)]
+    for i, name in enumerate(names, 1):
+        is_behind = behind_every and i % behind_every == 0
+        create_package(
+            root,
+            name,
+            behind=behind if is_behind else 0,
+            files=files,
+            file_size=file_size,
+            tree_depth=tree_depth,
+            invalid_metadata=bool(invalid_every and i % invalid_every == 0),
+        )
+
+    return {
+        "root": root,
+        "packages_dir": os.path.join(root, "packages"),
+        "state_dir": os.path.join(root, "state"),
+        "names": names,
+    }
+
+
+def get_fixture_env(fixture):
+    """
+    Get the environment that points Polly at a fixture with the network stubbed.
+
+    The self-update check is served from a freshly written cache and remotes
+    are local paths, so no command goes online. Commands run without sudo.
+    """
+    latest_commit_cache = os.path.join(fixture["state_dir"], "latest_commit.json")
+    with open(latest_commit_cache, "w") as f:
+        json.dump({"commit": "0" * 40, "checked_at": time.time()}, f)
+
+    env = dict(os.environ, **GIT_ENV)
+    env.update(
+        {
+            "POLLY_SUDO": "",
+            "POLLY_CONFIG": os.path.join(fixture["state_dir"], "config.json"),
+            "POLLY_PACKAGES_DIR": fixture["packages_dir"],
+            "POLLY_LATEST_COMMIT_CACHE": latest_commit_cache,
+            "POLLY_GIT_CACHE_DIR": os.path.join(fixture["state_dir"], "git"),
+        }
+    )
+    return env
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Build a Polly benchmark fixture")
+    parser.add_argument("root", help="Directory to build the fixture in")
+    parser.add_argument("--packages", type=int, default=10)
+    parser.add_argument("--behind-every", type=int, default=2)
+    parser.add_argument("--behind", type=int, default=3)
+    parser.add_argument("--files", type=int, default=0)
+    parser.add_argument("--file-size", type=int, default=1024)
+    parser.add_argument("--tree-depth", type=int, default=2)
+    parser.add_argument("--invalid-every", type=int, default=0)
+    parsed_args = parser.parse_args(args)
+
+    fixture = create_fixture(
+        parsed_args.root,
+        count=parsed_args.packages,
+        behind_every=parsed_args.behind_every,
+        behind=parsed_args.behind,
+        files=parsed_args.files,
+        file_size=parsed_args.file_size,
+        tree_depth=parsed_args.tree_depth,
+        invalid_every=parsed_args.invalid_every,
+    )
+    print(f"export POLLY_PACKAGES_DIR={fixture['packages_dir']}")
+    print("export POLLY_SUDO=")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
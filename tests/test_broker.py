@@ -0,0 +1,182 @@
+import io
+import os
+import sys
+import json
+import time
+import threading
+import pytest
+from polly.utils import broker
+
+# Every byte value, including ones that aren't valid UTF-8
+ALL_BYTES = bytes(range(256))
+
+
+@pytest.fixture(autouse=True)
+def audit_log(tmp_path, monkeypatch):
+    """Write the audit log of in-process and spawned brokers to a temp file."""
+    path = tmp_path / "audit.log"
+    monkeypatch.setattr(broker, "AUDIT_LOG", str(path))
+    monkeypatch.setenv("POLLY_AUDIT_LOG", str(path))
+    return path
+
+
+@pytest.fixture
+def client():
+    """A broker process running as the current user."""
+    client = broker.Broker([])
+    yield client
+    client.close()
+
+
+def serve_requests(*requests):
+    """Run requests through serve and group the responses by request id."""
+    lines = b"".join(json.dumps(request).encode() + b"\n" for request in requests)
+    output = io.BytesIO()
+    broker.serve(io.BytesIO(lines), output)
+
+    responses = {}
+    for line in output.getvalue().splitlines():
+        response = json.loads(line)
+        responses.setdefault(response["id"], []).append(response)
+    return responses
+
+
+def collect(responses):
+    """Join the output of one request's responses per stream."""
+    output = {"stdout": b"", "stderr": b""}
+    for response in responses:
+        if "data" in response:
+            output[response["stream"]] += broker._decode(response["data"])
+    return output
+
+
+def test_split_command():
+    assert broker.split_command("git fetch --quiet origin") == [
+        "git",
+        "fetch",
+        "--quiet",
+        "origin",
+    ]
+    assert broker.split_command("make 'a b'") == ["make", "a b"]
+    assert broker.split_command("make | tee log") is None
+    assert broker.split_command("cd build") is None
+    assert broker.split_command("CC=clang make") is None
+    assert broker.split_command("echo $HOME") is None
+    assert broker.split_command("") is None
+
+
+def test_encode_round_trips_any_bytes_through_json():
+    text = json.loads(json.dumps(broker._encode(ALL_BYTES)))
+    assert broker._decode(text) == ALL_BYTES
+
+
+def test_serve_routes_output_and_exit_code_by_id():
+    responses = serve_requests(
+        {"id": 1, "argv": ["sh", "-c", "echo one"]},
+        {"id": 2, "command": "echo two >&2; exit 3"},
+    )
+
+    assert collect(responses[1]) == {"stdout": b"one\n", "stderr": b""}
+    assert responses[1][-1] == {"id": 1, "exit_code": 0}
+    assert collect(responses[2]) == {"stdout": b"", "stderr": b"two\n"}
+    assert responses[2][-1] == {"id": 2, "exit_code": 3}
+
+
+def test_serve_merges_stderr_when_asked():
+    responses = serve_requests(
+        {"id": 1, "command": "echo out; echo err >&2", "merge_stderr": True}
+    )
+    assert collect(responses[1]) == {"stdout": b"out\nerr\n", "stderr": b""}
+
+
+def test_serve_passes_non_utf8_output_unchanged():
+    code = "import sys; sys.stdout.buffer.write(bytes(range(256)))"
+    responses = serve_requests({"id": 1, "argv": [sys.executable, "-c", code]})
+    assert collect(responses[1])["stdout"] == ALL_BYTES
+
+
+def test_serve_reports_missing_commands():
+    responses = serve_requests({"id": 1, "argv": ["/nonexistent/command"]})
+    assert responses[1][-1]["exit_code"] == broker.COMMAND_NOT_FOUND
+    assert b"/nonexistent/command" in collect(responses[1])["stderr"]
+
+
+def test_serve_runs_requests_concurrently():
+    start = time.monotonic()
+    responses = serve_requests(
+        *({"id": i, "argv": ["sleep", "0.5"]} for i in range(4))
+    )
+    assert time.monotonic() - start < 1.5
+    assert all(responses[i][-1]["exit_code"] == 0 for i in range(4))
+
+
+def test_serve_writes_audit_entries(audit_log):
+    serve_requests({"id": 7, "command": "exit 2", "cwd": "/"})
+
+    entries = [json.loads(line) for line in audit_log.read_text().splitlines()]
+    assert [entry["event"] for entry in entries] == ["start", "exit"]
+    assert entries[0]["argv"] == ["/bin/sh", "-c", "exit 2"]
+    assert entries[0]["shell"] is True
+    assert entries[1]["exit_code"] == 2
+
+
+def test_client_runs_commands(client):
+    process = client.run(argv=[sys.executable, "-c", "print('hello')"])
+    assert process.communicate() == (b"hello\n", b"")
+    assert process.returncode == 0
+
+    process = client.run(command="echo fail >&2; exit 4", cwd="/")
+    assert process.communicate() == (b"", b"fail\n")
+    assert process.returncode == 4
+
+
+def test_client_passes_non_utf8_output_unchanged(client):
+    code = "import sys; sys.stdout.buffer.write(bytes(range(256)))"
+    process = client.run(argv=[sys.executable, "-c", code])
+    assert process.communicate()[0] == ALL_BYTES
+
+
+def test_client_routes_concurrent_requests(client):
+    results = {}
+
+    def run(n):
+        process = client.run(
+            command=f"for i in 1 2 3; do echo {n}-$i; sleep 0.01; done; exit {n}"
+        )
+        results[n] = (process.communicate()[0], process.returncode)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for n in range(8):
+        assert results[n] == (f"{n}-1\n{n}-2\n{n}-3\n".encode(), n)
+
+
+def test_client_fails_pending_commands_when_the_broker_dies(client):
+    process = client.run(argv=["sleep", "5"])
+    client._process.kill()
+
+    stdout, stderr = process.communicate()
+    assert process.returncode == -1
+    assert b"Broker exited" in stderr
+
+    with pytest.raises(OSError):
+        client.run(argv=["true"])
+
+
+def test_check_broker_code_refuses_code_others_can_write(tmp_path, monkeypatch):
+    package = tmp_path / "polly"
+    package.mkdir()
+    module = package / "module.py"
+    module.write_text("")
+    os.chmod(module, 0o666)
+    monkeypatch.setattr(broker, "PROJECT_ROOT", str(tmp_path))
+
+    with pytest.raises(OSError, match="Refusing to run"):
+        broker.check_broker_code()
+    # Checked before anything is started under the sudo prefix
+    with pytest.raises(OSError, match="Refusing to run"):
+        broker.Broker(["/nonexistent/sudo"])
@@ -0,0 +1,131 @@
+import pytest
+from polly.utils import command
+
+MARKER = b"polly-step-test"
+
+# Arguments of _print_command_failure
+FAILURE_FIELDS = ("description", "command", "returncode", "output", "log", "summary")
+
+
+def split(chunks):
+    """Run chunks through _split_session_markers, returning output and markers."""
+    markers = []
+
+    def on_marker(fields):
+        markers.append(fields)
+        if fields[0] == "start":
+            return f"=== Step {int(fields[1]) + 1}".encode()
+        return None
+
+    output = b"".join(command._split_session_markers(chunks, MARKER, on_marker))
+    return output, markers
+
+
+def session_output(*steps):
+    """Output of a session whose steps print the given bytes and exit 0."""
+    output = b""
+    for index, printed in enumerate(steps):
+        output += b"\n%s start %d\n" % (MARKER, index)
+        output += printed
+        output += b"\n%s exit %d 0\n" % (MARKER, index)
+    return output
+
+
+@pytest.fixture
+def failures(monkeypatch):
+    """Run sessions without sudo and record the failures they report."""
+    reported = []
+    monkeypatch.setattr(command, "SUDO_COMMAND", "")
+    monkeypatch.setattr(
+        command,
+        "_print_command_failure",
+        lambda *args: reported.append(dict(zip(FAILURE_FIELDS, args))),
+    )
+    return reported
+
+
+def test_split_removes_markers():
+    output, markers = split([session_output(b"one\n", b"two\n")])
+    assert output == b"=== Step 1\none\n=== Step 2\ntwo\n"
+    assert markers == [
+        ["start", "0"],
+        ["exit", "0", "0"],
+        ["start", "1"],
+        ["exit", "1", "0"],
+    ]
+
+
+def test_split_keeps_output_without_a_trailing_newline():
+    output, _ = split([session_output(b"one", b"two")])
+    assert output == b"=== Step 1\none\n=== Step 2\ntwo"
+
+    output, _ = split([b"\n%s start 0\npartial" % MARKER])
+    assert output == b"=== Step 1\npartial"
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16])
+def test_split_handles_markers_split_across_chunks(size):
+    data = session_output(b"one", b"line\nmore\n")
+    chunks = [data[i : i + size] for i in range(0, len(data), size)]
+    assert split(chunks) == split([data])
+
+
+def test_split_keeps_lines_that_only_look_like_markers():
+    output, markers = split([b"polly-step\n%s start 0\n" % MARKER])
+    assert output == b"polly-step\n=== Step 1\n"
+    assert markers == [["start", "0"]]
+
+
+def test_session_shares_shell_state(failures, tmp_path):
+    (tmp_path / "sub").mkdir()
+    success, index = command.run_shell_session(
+        ["cd sub", "VALUE=1", '[ "$VALUE" = 1 ] && touch here'],
+        ["Enter", "Set", "Check"],
+        cwd=str(tmp_path),
+    )
+
+    assert (success, index) == (True, None)
+    assert (tmp_path / "sub" / "here").exists()
+    assert failures == []
+
+
+def test_session_stops_at_the_failing_step(failures, tmp_path):
+    success, index = command.run_shell_session(
+        ["true", "echo broken; exit_code=4; (exit $exit_code)", "touch never"],
+        ["First", "Second", "Third"],
+        cwd=str(tmp_path),
+    )
+
+    assert (success, index) == (False, 1)
+    assert not (tmp_path / "never").exists()
+    assert len(failures) == 1
+    assert failures[0]["description"] == "Second"
+    assert failures[0]["returncode"] == 4
+    assert failures[0]["summary"] is None
+    assert "broken" in failures[0]["output"]
+
+
+def test_session_reports_a_syntax_error_as_a_failing_step(failures, tmp_path):
+    success, index = command.run_shell_session(
+        ["true", "eval 'if then'"], ["First", "Second"], cwd=str(tmp_path)
+    )
+
+    assert (success, index) == (False, 1)
+    assert failures[0]["returncode"] != 0
+    assert failures[0]["summary"] is None
+
+
+def test_session_reports_a_step_calling_exit(failures, tmp_path):
+    success, index = command.run_shell_session(
+        ["exit 0", "touch never"], ["First", "Second"], cwd=str(tmp_path)
+    )
+
+    assert (success, index) == (False, 0)
+    assert not (tmp_path / "never").exists()
+    assert "must not call exit" in failures[0]["summary"]
+
+    failures.clear()
+    success, index = command.run_shell_session(["exit 3"], ["First"], cwd=str(tmp_path))
+    assert (success, index) == (False, 0)
+    assert failures[0]["returncode"] == 3
+    assert failures[0]["summary"] is None